@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import api_client
+import streaming
+import tracing
+from application import encode_payload
+
+# Shared worker pool so analysis requests never block the Streamlit script thread
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis")
+
+# Lifecycle states reported by an analysis job, in the order they happen
+QUEUED = "queued"
+SENDING = "sending"
+RETRYING = "retrying"
+RECEIVING = "receiving"
+COMPLETE = "complete"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINAL_STATES = (COMPLETE, FAILED, CANCELLED)
+
+
+class AnalysisCancelled(Exception):
+    pass
+
+
+# A single analysis request running on the background executor.
+# State changes come from the request itself: the worker picking the job up,
+# a retry being scheduled, the response headers arriving and the body being
+# fully read.
+class AnalysisJob:
+    def __init__(self, payload, headers=None, client=None):
+        self.payload = payload
+        self.headers = headers or {}
+        self.client = client or api_client.get_client()
+        self.attempts = 1
+        # Time spent running the request, once it has finished
+        self.duration_ms = None
+
+        self.state = QUEUED
+        self.status_code = None
+        self.content = b""
+        self.error = None
+        # Sections of a streamed analysis_result, filled in as events arrive
+        self.streamed = False
+        self.sections = {}
+        self.revision = 0
+
+        # The submission span the request is timed under, from the caller's thread
+        self.trace_parent = tracing.current_span()
+        self._created = time.perf_counter()
+
+        self._cancel_event = threading.Event()
+        self._changed = threading.Condition()
+        self._response = None
+        self._future = None
+
+    # Run on the shared analysis pool, or on `executor` for callers that bound
+    # their own fan-out
+    def start(self, executor=None):
+        self._future = (executor or _EXECUTOR).submit(self._run)
+        return self
+
+    # Call fn(job) once the job has finished running (or was cancelled before it ran)
+    def add_done_callback(self, fn):
+        self._future.add_done_callback(lambda _: fn(self))
+
+    def _set_state(self, state):
+        with self._changed:
+            if self.state in FINAL_STATES:
+                return
+            self.state = state
+            self.revision += 1
+            self._changed.notify_all()
+
+    def _apply_events(self, events):
+        if not events:
+            return
+        with self._changed:
+            for event in events:
+                streaming.apply_event(self.sections, event)
+            self.revision += 1
+            self._changed.notify_all()
+
+    def _run(self):
+        with tracing.span("http.request", parent=self.trace_parent,
+                          request_bytes=len(encode_payload(self.payload)),
+                          queued_ms=round((time.perf_counter() - self._created) * 1000, 3)) as span:
+            try:
+                if self._cancel_event.is_set():
+                    raise AnalysisCancelled()
+
+                self._set_state(SENDING)
+                sent = time.perf_counter()
+                # stream=True returns as soon as the headers arrive, so receiving the
+                # body is reported as its own stage and can be interrupted by cancel()
+                response = self.client.analyze(
+                    self.payload,
+                    headers=self.headers,
+                    stream=True,
+                    cancel_event=self._cancel_event,
+                    on_retry=self._on_retry
+                )
+                self._response = response
+                try:
+                    self.status_code = response.status_code
+                    content_type = response.headers.get("Content-Type")
+                    self.streamed = response.status_code == 200 and streaming.is_streaming(content_type)
+                    decoder = streaming.decoder_for(content_type) if self.streamed else None
+                    # Bytes actually sent, after compression
+                    span.set(request_bytes=len(response.request.body or b""),
+                             gzip=response.request.headers.get("Content-Encoding") == "gzip")
+                    span.set(status_code=response.status_code, streamed=self.streamed,
+                             headers_ms=round((time.perf_counter() - sent) * 1000, 3))
+                    self._set_state(RECEIVING)
+
+                    body = bytearray()
+                    # chunk_size=None yields data as the server flushes it, so streamed
+                    # sections are decoded the moment they arrive
+                    for chunk in response.iter_content(chunk_size=None if self.streamed else 64 * 1024):
+                        if self._cancel_event.is_set():
+                            raise AnalysisCancelled()
+                        body.extend(chunk)
+                        if decoder is not None:
+                            self._apply_events(decoder.feed(chunk))
+                    if decoder is not None:
+                        self._apply_events(decoder.close())
+                    self.content = bytes(body)
+                    span.set(response_bytes=len(self.content))
+                finally:
+                    response.close()
+
+                if self._cancel_event.is_set():
+                    raise AnalysisCancelled()
+                final_state = COMPLETE
+            except (AnalysisCancelled, api_client.RequestCancelled):
+                span.set(cancelled=True)
+                final_state = CANCELLED
+            except Exception as e:
+                if self._cancel_event.is_set():
+                    span.set(cancelled=True)
+                    final_state = CANCELLED
+                else:
+                    span.error = type(e).__name__
+                    self.error = e
+                    final_state = FAILED
+            finally:
+                span.set(attempts=self.attempts)
+        # Final state only once the span is recorded, so it is part of the
+        # submission's trace by the time the caller sees the result
+        self.duration_ms = span.duration_ms
+        self._set_state(final_state)
+
+    def _on_retry(self, attempt, reason):
+        self.attempts = attempt + 1
+        self._set_state(RETRYING)
+
+    # Stop the job: a queued job never runs, an in-flight body read is aborted,
+    # and a response that still arrives afterwards is discarded
+    def cancel(self):
+        self._cancel_event.set()
+        if self._future is not None and self._future.cancel():
+            self._set_state(CANCELLED)
+            return
+        response = self._response
+        if response is not None:
+            response.close()
+        if self.state == QUEUED:
+            self._set_state(CANCELLED)
+
+    @property
+    def cancelled(self):
+        return self.state == CANCELLED
+
+    def done(self):
+        return self.state in FINAL_STATES
+
+    # Block until the state changes or new sections arrive; returns the revision
+    def wait_for_update(self, last_revision, timeout=None):
+        with self._changed:
+            self._changed.wait_for(lambda: self.revision != last_revision, timeout=timeout)
+            return self.revision
+
+    # Copy of the sections received so far
+    def snapshot(self):
+        with self._changed:
+            return dict(self.sections)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    # The response body, or for a streamed response the assembled result in the
+    # same shape as the plain JSON one
+    def json(self):
+        if self.streamed:
+            return {"analysis_result": self.snapshot()}
+        return json.loads(self.content)
+
+
+def submit_analysis(payload, headers=None, client=None):
+    return AnalysisJob(payload, headers=headers, client=client).start()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+INDEX_FORMAT_VERSION = 1
+
+# Files making up a saved index directory
+_ARRAYS = ("centroids", "vectors", "ids", "offsets")
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+# Inverted-file (IVF) index for cosine similarity over unit-normalised float32
+# vectors. A spherical k-means quantizer splits the corpus into `nlist` cells;
+# vectors are stored contiguously per cell so a query only scores the `nprobe`
+# cells closest to it. Inserts after the last save go to a small pending buffer
+# that is searched alongside the main lists and merged on the next save().
+class IVFIndex:
+    def __init__(self, dim, nlist=256, nprobe=16):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self._pending_vectors = []
+        self._pending_ids = []
+        self._pending_lists = []
+        self._pending_cache = None
+
+    def __len__(self):
+        return len(self.ids) + len(self._pending_ids)
+
+    @property
+    def is_trained(self):
+        return len(self.centroids) > 0
+
+    # Spherical k-means on (a sample of) the vectors
+    def train(self, vectors, n_iter=10, sample_size=None, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        sample_size = sample_size or self.nlist * 64
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        nlist = max(1, min(self.nlist, len(vectors)))
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignment = self._assign(vectors, centroids)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Per-cell sums via a sort and segmented reduction (much faster than np.add.at)
+            order = np.argsort(assignment, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            filled = np.flatnonzero(counts)
+            sums[filled] = np.add.reduceat(vectors[order], starts[filled], axis=0)
+            # Re-seed empty cells from random vectors so no list stays unused
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+            centroids = _normalize_rows(sums)
+
+        self.nlist = nlist
+        self.centroids = centroids.astype(np.float32)
+        self.offsets = np.zeros(nlist + 1, dtype=np.int64)
+        return self
+
+    @staticmethod
+    def _assign(vectors, centroids, batch_size=65536):
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            assignment[start:start + batch_size] = np.argmax(batch @ centroids.T, axis=1)
+        return assignment
+
+    # Incremental insert; vectors become searchable immediately
+    def add(self, vectors, ids):
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex must be trained before adding vectors")
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(vectors) != len(ids):
+            raise ValueError("vectors and ids must have the same length")
+        self._pending_vectors.append(vectors)
+        self._pending_ids.append(ids)
+        self._pending_lists.append(self._assign(vectors, self.centroids))
+        self._pending_cache = None
+
+    def _pending(self):
+        if self._pending_cache is None:
+            if self._pending_ids:
+                self._pending_cache = (
+                    np.concatenate(self._pending_vectors),
+                    np.concatenate(self._pending_ids),
+                    np.concatenate(self._pending_lists),
+                )
+            else:
+                self._pending_cache = (
+                    np.zeros((0, self.dim), dtype=np.float32),
+                    np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.int64),
+                )
+        return self._pending_cache
+
+    # Fold pending inserts into the contiguous per-list arrays
+    def merge(self):
+        pending_vectors, pending_ids, pending_lists = self._pending()
+        if not len(pending_ids):
+            return
+        main_lists = np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+        lists = np.concatenate([main_lists, pending_lists])
+        order = np.argsort(lists, kind="stable")
+        self.vectors = np.concatenate([np.asarray(self.vectors), pending_vectors])[order]
+        self.ids = np.concatenate([np.asarray(self.ids), pending_ids])[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))]).astype(np.int64)
+        self._pending_vectors, self._pending_ids, self._pending_lists = [], [], []
+        self._pending_cache = None
+
+    # Return (ids, cosine scores) of the approximate k nearest neighbours
+    def search(self, query, k=10, nprobe=None):
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        scores, ids = [], []
+        for cell in probe:
+            start, end = self.offsets[cell], self.offsets[cell + 1]
+            if end > start:
+                scores.append(self.vectors[start:end] @ query)
+                ids.append(self.ids[start:end])
+
+        pending_vectors, pending_ids, pending_lists = self._pending()
+        if len(pending_ids):
+            mask = np.isin(pending_lists, probe)
+            if mask.any():
+                scores.append(pending_vectors[mask] @ query)
+                ids.append(pending_ids[mask])
+
+        if not scores:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = np.concatenate(scores)
+        ids = np.concatenate(ids)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def save(self, directory, metadata=None):
+        self.merge()
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAYS:
+            # Write next to the target and swap in, so readers holding a memory
+            # map of the previous file are never left with a truncated one
+            tmp_path = os.path.join(directory, f".{name}.tmp.npy")
+            np.save(tmp_path, np.ascontiguousarray(getattr(self, name)))
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        meta = {
+            "version": INDEX_FORMAT_VERSION,
+            "dim": self.dim,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "size": int(len(self.ids)),
+            **(metadata or {}),
+        }
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    @staticmethod
+    def read_metadata(directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            return json.load(f)
+
+    # Load a saved index; with mmap=True the vector and id arrays stay on disk
+    # and are paged in only for the cells a query actually probes
+    @classmethod
+    def load(cls, directory, mmap=True):
+        meta = cls.read_metadata(directory)
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version: {meta.get('version')}")
+        index = cls(meta["dim"], nlist=meta["nlist"], nprobe=meta["nprobe"])
+        mode = "r" if mmap else None
+        index.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        index.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        index.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode=mode)
+        index.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode=mode)
+        return index
+
+    @classmethod
+    def build(cls, vectors, ids=None, nlist=None, nprobe=None, **train_kwargs):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if ids is None:
+            ids = np.arange(len(vectors), dtype=np.int64)
+        # sqrt(N) cells is the usual IVF starting point
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        index = cls(vectors.shape[1], nlist=nlist, nprobe=nprobe or max(1, nlist // 8))
+        index.train(vectors, **train_kwargs)
+        index.add(vectors, ids)
+        index.merge()
+        return index
+
+
+# Build and save the index for kdipa_arf.csv:
+#   python ann_index.py --csv kdipa_arf.csv --out .ann_index
+def main():
+    parser = argparse.ArgumentParser(description="Build the ANN index over historical applications")
+    parser.add_argument("--csv", default="kdipa_arf.csv")
+    parser.add_argument("--out", default=".ann_index")
+    args = parser.parse_args()
+
+    from similarity import SimilarityEngine
+
+    started = time.perf_counter()
+    engine = SimilarityEngine.from_csv(args.csv)
+    index = engine.use_persistent_index(args.out, rebuild=True)
+    print(f"Indexed {len(index)} applications into {index.nlist} lists "
+          f"({engine.dimension} dims) at {args.out} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import gzip
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from application import encode_payload
+
+DEFAULT_BASE_URL = "https://webapp-kdipa-ai-ajazdff5c3facrf9.switzerlandnorth-01.azurewebsites.net"
+# Point the app at another deployment or a local mock (see mock_server.py)
+BASE_URL_ENV = "KDIPA_API_URL"
+ANALYZE_PATH = "/analyze-application"
+
+# Status codes worth another attempt; anything else is returned to the caller as-is
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+# Request body compression: "auto" once the service advertises gzip in an
+# Accept-Encoding response header (RFC 7694), "always" or "never"
+GZIP_MODES = ("auto", "always", "never")
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+# Classic three-state breaker: after `failure_threshold` consecutive failures the
+# circuit opens and calls fail fast until `reset_timeout` has passed, then a
+# single trial call decides whether it closes again
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            return self._state
+
+    # Seconds until an open circuit lets a trial call through
+    def retry_after(self):
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow_request(self):
+        state = self.state
+        with self._lock:
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+# Keep-alive sessions handed out LIFO so the warmest connection is reused first
+class SessionPool:
+    def __init__(self, size=8):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @contextmanager
+    def session(self):
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            session = self._new_session() if can_create else self._idle.get()
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Client for the analysis service with pooled connections, bounded retries with
+# full-jitter exponential backoff and a circuit breaker in front of the endpoint
+class AnalysisClient:
+    def __init__(self, base_url=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff_base=None, backoff_max=None, pool_size=None,
+                 breaker=None, gzip_mode=None, gzip_min_bytes=None):
+        self.base_url = (base_url or os.environ.get(BASE_URL_ENV) or DEFAULT_BASE_URL).rstrip("/")
+        self.connect_timeout = connect_timeout if connect_timeout is not None else _env_float("KDIPA_API_CONNECT_TIMEOUT", 5.0)
+        self.read_timeout = read_timeout if read_timeout is not None else _env_float("KDIPA_API_READ_TIMEOUT", 30.0)
+        self.max_retries = max_retries if max_retries is not None else _env_int("KDIPA_API_MAX_RETRIES", 2)
+        self.backoff_base = backoff_base if backoff_base is not None else _env_float("KDIPA_API_BACKOFF_BASE", 0.5)
+        self.backoff_max = backoff_max if backoff_max is not None else _env_float("KDIPA_API_BACKOFF_MAX", 8.0)
+        self.pool = SessionPool(pool_size if pool_size is not None else _env_int("KDIPA_API_POOL_SIZE", 8))
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=_env_int("KDIPA_API_BREAKER_THRESHOLD", 5),
+            reset_timeout=_env_float("KDIPA_API_BREAKER_RESET", 30.0)
+        )
+        self.gzip_mode = gzip_mode or os.environ.get("KDIPA_API_GZIP", "auto")
+        if self.gzip_mode not in GZIP_MODES:
+            raise ValueError(f"gzip_mode must be one of {', '.join(GZIP_MODES)}")
+        # Smaller bodies fit in one packet anyway
+        self.gzip_min_bytes = gzip_min_bytes if gzip_min_bytes is not None else _env_int("KDIPA_API_GZIP_MIN_BYTES", 512)
+        # Whether the service takes gzip bodies: None until a response says
+        self.server_accepts_gzip = None
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def should_gzip(self, size):
+        if self.gzip_mode == "never" or self.server_accepts_gzip is False or size < self.gzip_min_bytes:
+            return False
+        return self.gzip_mode == "always" or self.server_accepts_gzip is True
+
+    # Learn from every response whether request bodies may be compressed
+    def _note_encoding(self, response, gzipped):
+        if gzipped and response.status_code == 415:
+            self.server_accepts_gzip = False
+            return
+        accepted = response.headers.get("Accept-Encoding")
+        if accepted is not None:
+            self.server_accepts_gzip = "gzip" in accepted.lower()
+
+    # POST with retries. The final response is returned whatever its status code,
+    # so callers keep full control over how errors are reported to the user.
+    # `cancel_event` aborts between attempts, `on_retry(attempt, reason)` is
+    # called before every backoff sleep. A `json` body is sent compact and,
+    # when the service accepts it, gzipped; a 415 for a gzipped body is
+    # resent uncompressed right away.
+    def post(self, path, json=None, headers=None, stream=False, cancel_event=None, on_retry=None, **kwargs):
+        url = self.base_url + path
+        body = encode_payload(json) if json is not None else None
+        compressed = None
+        attempt = 0
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled()
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Circuit open for {self.base_url}: too many recent failures")
+
+            try:
+                if body is not None:
+                    gzipped = self.should_gzip(len(body))
+                    if gzipped and compressed is None:
+                        compressed = gzip.compress(body, compresslevel=6)
+                    kwargs["data"] = compressed if gzipped else body
+                    request_headers = {**(headers or {}), "Content-Type": "application/json"}
+                    if gzipped:
+                        request_headers["Content-Encoding"] = "gzip"
+                else:
+                    gzipped = False
+                    request_headers = headers
+                with self.pool.session() as session:
+                    response = session.post(url, headers=request_headers, timeout=self.timeout,
+                                            stream=stream, **kwargs)
+                self._note_encoding(response, gzipped)
+                if gzipped and response.status_code == 415:
+                    self.breaker.record_success()
+                    response.close()
+                    continue
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                reason = e
+            except requests.exceptions.RequestException:
+                # Not worth another attempt (a broken chunked body, too many
+                # redirects, ...), but it still settles a half-open trial;
+                # otherwise the breaker would stay half-open and refuse every call
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    return response
+                response.close()
+                reason = f"HTTP {response.status_code}"
+
+            if on_retry is not None:
+                on_retry(attempt + 1, reason)
+            delay = self.backoff_delay(attempt)
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise RequestCancelled()
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    def analyze(self, payload, **kwargs):
+        return self.post(ANALYZE_PATH, json=payload, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Process-wide client shared by every Streamlit session and worker thread
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AnalysisClient()
+        return _client
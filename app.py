@@ -1,12 +1,28 @@
 import streamlit as st
 import requests
 import json
-import random
-from datetime import datetime
 import pandas as pd
-import uuid
-import pycountry
-import time
+import os
+import hashlib
+
+import analysis_jobs
+import api_client
+import compute
+import cube
+import explorer
+import financial_stats
+import result_cache
+import search_filter
+import sensitivity
+import streaming
+import submission_log
+import tokens
+import tracing
+from application import build_analysis_payload
+from reference_data import COUNTRY_CODES, country_index, country_label
+
+# Imported where first used: only needed once an application is submitted or a batch is run
+#   batch, decision_model, similarity
 
 # Set up page configuration
 st.set_page_config(
@@ -15,190 +31,211 @@ st.set_page_config(
     layout="wide"
 )
 
-# Load CSV data
-@st.cache_data
-def load_csv_data():
+# Where batch runs started from the UI keep their results/checkpoint files
+BATCH_RESULTS_DIR = os.environ.get("KDIPA_BATCH_DIR", "batch_results")
+
+# Confidence above which the local decision model may stand in for the remote analysis (when enabled in the form)
+LOCAL_SKIP_CONFIDENCE = float(os.environ.get("KDIPA_LOCAL_SKIP_CONFIDENCE", "0.9"))
+
+# The export, its indexes and the validation and preparation of applications
+# belong to the compute backend: compute_service.py when KDIPA_COMPUTE_URL is
+# set, otherwise this process (see compute.py)
+def get_compute():
+    return compute.get_compute()
+
+# Choices of the similar-application filter builder, from the distinct values of the export
+@st.cache_resource
+def get_filter_options():
+    return get_compute().filter_options()
+
+# Shape and filter choices of the export for the Debug tab explorer
+@st.cache_resource
+def get_explorer_info():
+    return get_compute().explorer_info()
+
+# Look up known applicants for the name input `key`: its on_change, so the
+# check runs as soon as the name is changed, ahead of the form's rerun
+def check_duplicate_candidates(key, k=5):
+    name = st.session_state.get(key) or ""
+    candidates, error = [], None
+    if name.strip():
+        try:
+            candidates = get_compute().duplicates(name, k=k)
+        except Exception as e:
+            error = str(e)
+    st.session_state.setdefault("duplicate_candidates", {})[key] = (name, candidates, error)
+
+# Known applicants whose name nearly matches the name input `key`, shown under it.
+# Names filled in by "Get Data" have no change event and are looked up here;
+# other reruns of the form reuse the last lookup.
+def render_duplicate_candidates(key, k=5):
+    name = st.session_state.get(key) or ""
+    checked = st.session_state.get("duplicate_candidates", {}).get(key)
+    if checked is None or checked[0] != name:
+        check_duplicate_candidates(key, k=k)
+        checked = st.session_state.duplicate_candidates[key]
+    _, candidates, error = checked
+    if error is not None:
+        st.caption(f"Duplicate name check unavailable: {error}")
+        return
+    if not candidates:
+        return
+    lines = []
+    for candidate in candidates:
+        match = candidate["matches"][0]
+        more = f" (+{len(candidate['matches']) - 1} more)" if len(candidate["matches"]) > 1 else ""
+        lines.append(
+            f"- **{candidate['name']}** ({candidate['similarity']:.0%}): "
+            f"`{match['field']}` of `{match['uuid'] or 'unknown'}`{more}"
+        )
+    st.warning("Possible existing applicant:\n" + "\n".join(lines))
+
+FINANCIAL_LABELS = {
+    "cashAmount": "Cash Amount",
+    "totalCapitalAmount": "Total Capital Amount",
+    "capitalExpenditure": "Capital Expenditure",
+    "operatingExpense": "Operating Expense",
+    "fixedAssets": "Fixed Assets",
+    "totalInvestmentValue": "Total Investment Value",
+}
+
+# Financial amounts of the form compared with historical applications of the same sector and activity
+def render_financial_profile(application_data):
     try:
-        df = pd.read_csv('kdipa_arf.csv')
-        # Clean up the dataframe - remove empty rows
-        df = df.dropna(how='all')
-        return df
+        scores = get_compute().financial_profile(application_data)
     except Exception as e:
-        st.error(f"Error loading CSV file: {str(e)}")
-        return pd.DataFrame()
+        st.caption(f"Financial comparison unavailable: {str(e)}")
+        return
+    if not scores:
+        return
+    unusual = [score for score in scores if score["unusual"]]
+    if unusual:
+        st.warning("Unusual for comparable applications: " + ", ".join(
+            f"{FINANCIAL_LABELS[score['field']]} (above {score['rank']:.0%} of {score['reference']})" if score["z"] > 0
+            else f"{FINANCIAL_LABELS[score['field']]} (below {1 - score['rank']:.0%} of {score['reference']})"
+            for score in unusual
+        ))
+    with st.expander("Compared with historical applications"):
+        st.dataframe(pd.DataFrame([{
+            "Field": FINANCIAL_LABELS[score["field"]],
+            "Amount (KWD)": f"{score['value']:,.2f}",
+            "Median (KWD)": f"{score['median']:,.0f}",
+            "Quantile": f"{score['rank']:.0%}",
+            "Robust z-score": score["z"],
+            "Compared with": f"{score['reference']} ({score['count']})",
+        } for score in scores]), use_container_width=True, hide_index=True)
+        st.caption(f"Robust z-scores of log amounts against the median and MAD of the reference group; "
+                   f"|z| of {financial_stats.ANOMALY_Z} or more is flagged.")
 
-# Get list of country codes for dropdowns
-def get_country_list():
-    countries = [(country.alpha_2, f"{country.name} ({country.alpha_2})") for country in pycountry.countries]
-    countries.sort(key=lambda x: x[1])
-    return countries
-
-COUNTRY_LIST = get_country_list()
-COUNTRY_CODES = [code for code, _ in COUNTRY_LIST]
-COUNTRY_NAMES = {code: name for code, name in COUNTRY_LIST}
+# Find similar historical applications locally; None means fall back to the remote service
+def find_similar_applications(application_data, k=3, filter_expr=None):
+    try:
+        # Narrowed by the same filter as the service's search; the application
+        # becomes part of the corpus for later searches
+        return get_compute().similar(application_data, k=k, filter_expr=filter_expr)
+    except Exception as e:
+        st.warning(f"Local similarity search unavailable: {str(e)}")
+        return None
 
 # IMPROVEMENT 4: Improved random data generation with more realistic values
 def get_random_csv_values():
-    df = load_csv_data()
-    
-    if df.empty:
-        # Fallback to original random generation if CSV is empty
-        return generate_fallback_random_values()
-    
-    # Select a random row
-    random_row = df.sample(1).iloc[0]
-    
-    # Generate fallback random values
-    fallback_values = generate_fallback_random_values()
-    
-    # Map CSV values to form fields, with fallback to random values if field is not in CSV
-    random_values = {}
-    
-    # Company details
-    random_values["companyName"] = random_row.get("companyName") if "companyName" in random_row and pd.notna(random_row["companyName"]) else fallback_values["companyName"]
-    random_values["companyOrigin"] = random_row.get("companyOrigin") if "companyOrigin" in random_row and pd.notna(random_row["companyOrigin"]) else fallback_values["companyOrigin"]
-    random_values["companyCity"] = random_row.get("companyCity") if "companyCity" in random_row and pd.notna(random_row["companyCity"]) else fallback_values["companyCity"]
-    random_values["companyStreet"] = random_row.get("companyStreet") if "companyStreet" in random_row and pd.notna(random_row["companyStreet"]) else fallback_values["companyStreet"]
-    random_values["companyBuilding"] = random_row.get("companyBuilding") if "companyBuilding" in random_row and pd.notna(random_row["companyBuilding"]) else fallback_values["companyBuilding"]
-    random_values["companyPostalAddress"] = random_row.get("companyPostalAddress") if "companyPostalAddress" in random_row and pd.notna(random_row["companyPostalAddress"]) else fallback_values["companyPostalAddress"]
-    random_values["companyOutput"] = random_row.get("companyOutput") if "companyOutput" in random_row and pd.notna(random_row["companyOutput"]) else fallback_values["companyOutput"]
-    
-    # Financial details
-    random_values["cashAmount"] = float(random_row.get("cashAmount")) if "cashAmount" in random_row and pd.notna(random_row["cashAmount"]) else fallback_values["cashAmount"]
-    random_values["contributionAmount"] = float(random_row.get("contributionAmount")) if "contributionAmount" in random_row and pd.notna(random_row["contributionAmount"]) else fallback_values["contributionAmount"]
-    random_values["totalCapitalAmount"] = float(random_row.get("totalCapitalAmount")) if "totalCapitalAmount" in random_row and pd.notna(random_row["totalCapitalAmount"]) else fallback_values["totalCapitalAmount"]
-    random_values["capitalExpenditure"] = float(random_row.get("capitalExpenditure")) if "capitalExpenditure" in random_row and pd.notna(random_row["capitalExpenditure"]) else fallback_values["capitalExpenditure"]
-    random_values["operatingExpense"] = float(random_row.get("operatingExpense")) if "operatingExpense" in random_row and pd.notna(random_row["operatingExpense"]) else fallback_values["operatingExpense"]
-    random_values["fixedAssets"] = float(random_row.get("fixedAssets")) if "fixedAssets" in random_row and pd.notna(random_row["fixedAssets"]) else fallback_values["fixedAssets"]
-    random_values["totalInvestmentValue"] = float(random_row.get("totalInvestmentValue")) if "totalInvestmentValue" in random_row and pd.notna(random_row["totalInvestmentValue"]) else fallback_values["totalInvestmentValue"]
-    
-    # Shareholder information
-    random_values["shareholderCompanyPartnerName"] = random_row.get("shareholderCompanyPartnerName") if "shareholderCompanyPartnerName" in random_row and pd.notna(random_row["shareholderCompanyPartnerName"]) else fallback_values["shareholderCompanyPartnerName"]
-    random_values["shareholderNationality"] = random_row.get("shareholderNationality") if "shareholderNationality" in random_row and pd.notna(random_row["shareholderNationality"]) else fallback_values["shareholderNationality"]
-    random_values["shareValue"] = float(random_row.get("shareValue")) if "shareValue" in random_row and pd.notna(random_row["shareValue"]) else fallback_values["shareValue"]
-    random_values["valueOfEquityOrShares"] = float(random_row.get("valueOfEquityOrShares")) if "valueOfEquityOrShares" in random_row and pd.notna(random_row["valueOfEquityOrShares"]) else fallback_values["valueOfEquityOrShares"]
-    random_values["percentageOfEquityOrShares"] = float(random_row.get("percentageOfEquityOrShares")) if "percentageOfEquityOrShares" in random_row and pd.notna(random_row["percentageOfEquityOrShares"]) else fallback_values["percentageOfEquityOrShares"]
-    random_values["numberOfEquityOrShares"] = int(float(random_row.get("numberOfEquityOrShares"))) if "numberOfEquityOrShares" in random_row and pd.notna(random_row["numberOfEquityOrShares"]) else fallback_values["numberOfEquityOrShares"]
-    
-    # Contribution type
-    if "contributionType_cash" in random_row and pd.notna(random_row["contributionType_cash"]):
-        random_values["contributionType"] = {"cash": bool(random_row["contributionType_cash"])}
-    else:
-        random_values["contributionType"] = fallback_values["contributionType"]
-    
-    # Incentives
-    random_values["incentives"] = bool(random_row.get("incentives")) if "incentives" in random_row and pd.notna(random_row["incentives"]) else fallback_values["incentives"]
-    
-    if "incentiveType_exemptionFromIncomeTax" in random_row and pd.notna(random_row["incentiveType_exemptionFromIncomeTax"]):
-        random_values["incentiveType"] = {"exemptionFromIncomeTax": bool(random_row["incentiveType_exemptionFromIncomeTax"])}
-    else:
-        random_values["incentiveType"] = fallback_values["incentiveType"]
-    
-    random_values["preferredIncentive"] = random_row.get("preferredIncentive") if "preferredIncentive" in random_row and pd.notna(random_row["preferredIncentive"]) else fallback_values["preferredIncentive"]
-    
-    # Terms and conditions
-    random_values["termsAndConditions"] = bool(random_row.get("termsAndConditions")) if "termsAndConditions" in random_row and pd.notna(random_row["termsAndConditions"]) else fallback_values["termsAndConditions"]
-    
-    # Application metadata
-    random_values["appType"] = random_row.get("appType") if "appType" in random_row and pd.notna(random_row["appType"]) else fallback_values["appType"]
-    random_values["licenseType"] = random_row.get("licenseType") if "licenseType" in random_row and pd.notna(random_row["licenseType"]) else fallback_values["licenseType"]
-    random_values["submissionDate"] = random_row.get("submissionDate") if "submissionDate" in random_row and pd.notna(random_row["submissionDate"]) else fallback_values["submissionDate"]
-    
-    # Store the original CSV row for debugging
-    random_values["_original_csv_row"] = random_row.to_dict()
-    
-    return random_values
+    # Fields are mapped by the declarative schema in prefill.FIELD_SCHEMA, falling
+    # back to generated values only for the columns missing from the sampled row
+    return get_compute().prefill(1)[0]
 
-# IMPROVEMENT 4: Better random data generation with more realistic values
-def generate_fallback_random_values():
-    # More realistic company names
-    company_types = ["Technologies", "Solutions", "Industries", "Group", "Holdings", "Investments", "International", "Corporation"]
-    company_prefixes = ["Global", "Advanced", "Elite", "Prime", "Superior", "Next-Gen", "Innovative", "Strategic"]
-    company_core = ["Tech", "Data", "Energy", "Trade", "Construct", "Finance", "Med", "Agri", "Petro", "Eco"]
-    
-    # Generate a more realistic company name
-    company_name = f"{random.choice(company_prefixes)} {random.choice(company_core)} {random.choice(company_types)}"
-    
-    # Ensure financial values are internally consistent
-    share_value = round(random.uniform(10, 100), 2)
-    number_of_shares = random.randint(1000, 10000)
-    value_of_shares = round(share_value * number_of_shares, 2)
-    
-    # Base capital expenditure
-    capital_expenditure = round(random.uniform(500000, 5000000), 2)
-    
-    # Operating expense typically 20-40% of capital expenditure
-    operating_expense = round(capital_expenditure * random.uniform(0.2, 0.4), 2)
-    
-    # Fixed assets typically 40-60% of capital expenditure
-    fixed_assets = round(capital_expenditure * random.uniform(0.4, 0.6), 2)
-    
-    # Total investment = capital + operating + some margin
-    total_investment = round(capital_expenditure + operating_expense + random.uniform(100000, 1000000), 2)
-    
-    random_values = {
-        "companyName": company_name,
-        "companyOrigin": random.choice(COUNTRY_CODES),
-        "companyCity": random.choice(["Dubai", "Abu Dhabi", "Sharjah", "Ajman", "Fujairah", "Kuwait City", "Doha", "Riyadh", "Manama"]),
-        "companyStreet": f"{random.choice(['Sheikh Zayed', 'Al Wasl', 'Jumeirah', 'Al Maktoum', 'Al Fahidi'])} Road",
-        "companyBuilding": f"{random.choice(['Al Fattan', 'Emirates', 'Business Central', 'Dubai Gate', 'Marina Plaza'])} Tower {random.choice(['A', 'B', 'C'])}",
-        "companyPostalAddress": f"P.O. Box {random.randint(10000, 99999)}",
-        "companyOutput": f"Manufacturing and distribution of {random.choice(['advanced electronic components', 'industrial automation systems', 'renewable energy solutions', 'medical equipment', 'construction materials', 'consumer electronics'])}",
-        "cashAmount": round(random.uniform(100000, 1000000), 2),
-        "contributionAmount": round(random.uniform(50000, 500000), 2),
-        "totalCapitalAmount": round(random.uniform(500000, 5000000), 2),
-        "capitalExpenditure": capital_expenditure,
-        "operatingExpense": operating_expense,
-        "fixedAssets": fixed_assets,
-        "totalInvestmentValue": total_investment,
-        "shareholderCompanyPartnerName": f"{random.choice(['Al', 'Bin', 'El', 'Abu'])} {random.choice(['Mohammed', 'Ahmed', 'Saeed', 'Sultan', 'Khalid'])} {random.choice(['Holding', 'Investment', 'Group', 'Partners'])}",
-        "shareholderNationality": random.choice(COUNTRY_CODES),
-        "shareValue": share_value,
-        "valueOfEquityOrShares": value_of_shares,
-        "percentageOfEquityOrShares": round(random.uniform(10, 100), 2),
-        "numberOfEquityOrShares": number_of_shares,
-        "contributionType": {"cash": True},
-        "incentives": random.choice([True, False]),
-        "incentiveType": {"exemptionFromIncomeTax": random.choice([True, False])},
-        "preferredIncentive": random.choice(["Tax Exemption", "Land Allocation", "Reduced Fees", "None"]),
-        "termsAndConditions": True,
-        "appType": "ApplicationInvestmentLicenseA",
-        "licenseType": "ApplicationInvestmentLicenseA",
-        "submissionDate": datetime.now().isoformat()
-    }
-    return random_values
+# Labels shown in the status box for each stage of an analysis job
+ANALYSIS_STATUS_LABELS = {
+    analysis_jobs.QUEUED: "Preparing application data...",
+    analysis_jobs.SENDING: "Sending data for analysis...",
+    analysis_jobs.RETRYING: "Analysis service unavailable, retrying...",
+    analysis_jobs.RECEIVING: "Processing results...",
+}
+
+# Cancel the in-flight analysis job (used as a button callback)
+def cancel_analysis():
+    job = st.session_state.get("analysis_job")
+    if job is not None:
+        job.cancel()
+
+# One-line summary of tokens.estimate_prompt_tokens() for the form and errors
+def describe_token_estimate(estimate):
+    text = f"estimated prompt of ~{estimate['tokens']:,} tokens"
+    if not estimate["exact"]:
+        text += " (approximate, tokenizer not loaded)"
+    if estimate["budget"]:
+        text += f" against a budget of {estimate['budget']:,}"
+    return text + f", {estimate['request_bytes']:,} byte request"
 
 # IMPROVEMENT 1: Enhanced Error Handling
-def analyze_application(application_data):
-    api_url = "https://webapp-kdipa-ai-ajazdff5c3facrf9.switzerlandnorth-01.azurewebsites.net/analyze-application"
-    payload = {
-        "application_data": application_data,
-        "filter_expr": None,
-        "top_similar": 3
-    }
+def analyze_application(application_data, on_update=None, filter_expr=None, top_similar=3):
+    try:
+        payload = build_analysis_payload(application_data, filter_expr=filter_expr, top_similar=top_similar)
+    except search_filter.FilterError as e:
+        st.error(f"Invalid similar-application search: {str(e)}")
+        return None
     
     headers = {
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        # Let the service stream sections (NDJSON/SSE) when it can
+        "Accept": streaming.STREAM_ACCEPT
     }
     
+    # Identical applications (ignoring uuid/submissionDate) reuse the stored result
+    cache = result_cache.get_cache()
+    with tracing.span("cache.lookup") as span:
+        cache_key = result_cache.payload_key(payload)
+        cached = cache.get(cache_key)
+        span.set(hit=cached is not None)
+    if cached is not None:
+        st.status("Analysis complete (cached result)", state="complete")
+        return cached
+    
+    # Applications whose prompt would go over the token budget are not sent
+    with tracing.span("estimate_tokens") as span:
+        estimate = get_compute().estimate(payload)
+        span.set(tokens=estimate["tokens"], exact=estimate["exact"], bytes=estimate["request_bytes"])
+    if tokens.over_budget(estimate):
+        st.error(f"Analysis not sent: {describe_token_estimate(estimate)}. "
+                 "Shorten the longer text fields or raise KDIPA_TOKEN_BUDGET.")
+        return None
+    
     try:
+        # Only one analysis per session may be in flight
+        cancel_analysis()
+        
         # IMPROVEMENT 3: Progress feedback during API call
         with st.status("Analyzing application...") as status:
-            status.update(label="Preparing application data...", state="running", expanded=True)
-            time.sleep(0.5)  # Simulate processing time
-            
-            status.update(label="Connecting to analysis service...", state="running")
-            time.sleep(0.5)  # Simulate connection time
+            # The request runs on a background executor; the status box follows its lifecycle
+            response = analysis_jobs.submit_analysis(payload, headers=headers)
+            st.session_state.analysis_job = response
+            st.button("Cancel Analysis", on_click=cancel_analysis)
             
-            status.update(label="Sending data for analysis...", state="running")
-            response = requests.post(api_url, json=payload, headers=headers, timeout=30)
+            state = None
+            revision = 0
+            while not response.done():
+                if response.state != state:
+                    state = response.state
+                    status.update(label=ANALYSIS_STATUS_LABELS[state], state="running", expanded=True)
+                if on_update is not None and response.streamed:
+                    sections = response.snapshot()
+                    if sections:
+                        on_update(sections)
+                revision = response.wait_for_update(revision, timeout=0.5)
             
-            status.update(label="Processing results...", state="running")
-            time.sleep(0.5)  # Simulate processing time
+            if response.cancelled:
+                status.update(label="Analysis cancelled", state="error")
+                st.warning("The analysis was cancelled.")
+                return None
+            if response.error is not None:
+                status.update(label="Analysis failed", state="error")
+                raise response.error
 
             if response.status_code == 200:
                 status.update(label="Analysis complete!", state="complete")
-                return response.json()
+                with tracing.span("json.decode", bytes=len(response.content)):
+                    result = response.json()
+                cache.put(cache_key, result)
+                return result
             elif response.status_code == 400:
                 status.update(label="Analysis failed - Invalid data", state="error")
                 st.error(f"Bad Request (400): The server couldn't process your application data. Please check your inputs.")
@@ -224,6 +261,9 @@ def analyze_application(application_data):
                 status.update(label="Analysis failed", state="error")
                 st.error(f"Unexpected Error: {response.status_code} - {response.text}")
                 return None
+    except api_client.CircuitOpenError:
+        st.error("Service Unavailable: The analysis service failed repeatedly and requests are paused for a short while. Please try again shortly.")
+        return None
     except requests.exceptions.ConnectionError:
         st.error("Connection Error: Could not connect to the analysis service. Please check your internet connection and try again.")
         return None
@@ -237,31 +277,157 @@ def analyze_application(application_data):
         st.error(f"Unexpected Error: {str(e)}")
         return None
 
-# Function to prepare application data from form input
-def prepare_application_data(form_data):
-    # Clean and prepare the data to match expected schema
-    application_data = {
-        "uuid": str(uuid.uuid4()),
-        **form_data,
-        "submissionDate": datetime.now().isoformat()
-    }
+# Render the similar applications section (local engine results or remote Top3SimilarApplications)
+def render_similar_applications(top_similar):
+    if top_similar and isinstance(top_similar, list) and len(top_similar) > 0:
+        st.write(f"Found {len(top_similar)} similar applications")
+        
+        # Display each similar application in a card-like format
+        for i, app in enumerate(top_similar):
+            with st.container():
+                col1, col2, col3 = st.columns([1, 3, 1])
+                
+                with col1:
+                    # Handle different possible key names for similarity percentage
+                    percentage = app.get("PercentageMatching", 
+                                     app.get("Similarity", 
+                                         app.get("percentage_matching", 
+                                             app.get("similarity", "N/A"))))
+                    
+                    # Clean up percentage format
+                    if isinstance(percentage, str) and "%" in percentage:
+                        percentage = percentage.replace("%", "").strip()
+                    
+                    try:
+                        percentage_value = float(percentage)
+                        st.metric("Match", f"{percentage_value:.1f}%")
+                    except (ValueError, TypeError):
+                        st.metric("Match", str(percentage))
+                
+                with col2:
+                    st.subheader(f"Application #{i+1}")
+                    
+                    # Handle different possible key names for UUID
+                    uuid_value = app.get("UUID", 
+                                     app.get("uuid", 
+                                         app.get("id", "N/A")))
+                    st.markdown(f"**UUID:** {uuid_value}")
+                    
+                    # Handle different possible key names for description
+                    description = app.get("Description", 
+                                      app.get("description", 
+                                          app.get("companyName", 
+                                              app.get("company_name", "N/A"))))
+                    st.markdown(f"**Description:** {description}")
+                
+                with col3:
+                    # Handle different possible key names for status/decision
+                    status = app.get("Status", 
+                                 app.get("status", 
+                                     app.get("Decision", 
+                                         app.get("decision", "N/A"))))
+                    
+                    if status and isinstance(status, str):
+                        status_upper = status.upper()
+                        if "ACCEPT" in status_upper:
+                            st.success("ACCEPTED")
+                        elif "REJECT" in status_upper:
+                            st.error("REJECTED")
+                        else:
+                            st.info(status)
+                    else:
+                        st.info("N/A")
+            
+            st.divider()
+    else:
+        st.info("No similar applications found in the response.")
+
+# Decision summary section of an analysis result, with the local model's prior next to the decision
+def render_decision_section(analysis, prior=None):
+    # Display analysis results
+    st.markdown("## Analysis Results")
     
-    # Ensure numeric values are floats
-    numeric_fields = [
-        "cashAmount", "contributionAmount", "totalCapitalAmount", 
-        "capitalExpenditure", "operatingExpense", "fixedAssets", 
-        "totalInvestmentValue", "shareValue", "valueOfEquityOrShares", 
-        "percentageOfEquityOrShares", "numberOfEquityOrShares"
-    ]
+    # Decision Summary Section
+    st.markdown("### Decision Summary")
     
-    for field in numeric_fields:
-        if field in application_data and application_data[field]:
-            try:
-                application_data[field] = float(application_data[field])
-            except (ValueError, TypeError):
-                application_data[field] = 0.0
+    # Create columns for decision and explanation
+    col1, col2 = st.columns([1, 3])
     
-    return application_data
+    decision = analysis.get("Decision")
+    with col1:
+        if decision == "ACCEPTED":
+            st.success("✅ ACCEPTED")
+        elif decision == "REJECTED":
+            st.error("❌ REJECTED")
+        elif prior is not None:
+            st.info(f"Prior only: {prior.decision}")
+        # else:
+        #     st.warning("⚠️ UNKNOWN")
+        if prior is not None:
+            st.caption(f"Local model: {prior.decision} ({prior.confidence:.0%} confidence)")
+    
+    with col2:
+        with st.expander("Decision Explanation", expanded=True):
+            st.write(analysis.get("DecisionExplanation", "No explanation provided."))
+    
+    # Debug expander for raw response
+    with st.expander("Raw Analysis Response (Debug)", expanded=False):
+        st.json(analysis)
+
+# Recommendations and risk assessment sections; while streaming (final=False)
+# only the sections that have already arrived are shown
+def render_details_section(analysis, final=True):
+    if final or "Recommendations" in analysis:
+        # Recommendations Section
+        st.markdown("### Recommendations")
+        recommendations = analysis.get("Recommendations", "No recommendations provided.")
+    
+        if isinstance(recommendations, list):
+            for rec in recommendations:
+                st.markdown(f"- {rec}")
+        else:
+            st.write(recommendations)
+    
+    if final or "RisksIdentified" in analysis:
+        # Risk Assessment Section
+        st.markdown("### Risk Assessment")
+        risks = analysis.get("RisksIdentified", "No risks identified.")
+
+        # Handle different formats of risks data
+        if isinstance(risks, dict):
+            # If it's a dictionary, convert to string representation
+            risk_text = json.dumps(risks, indent=2)
+            st.code(risk_text)
+        elif isinstance(risks, list):
+            # If it's a list, display as bullet points
+            for risk in risks:
+                st.markdown(f"- {risk}")
+        else:
+            # Convert to string and then lowercase for comparison
+            risks_str = str(risks)
+            risks_lower = risks_str.lower()
+            if "no risk" in risks_lower or "no known risk" in risks_lower or "no potential risk" in risks_lower:
+                st.success(risks_str)
+            else:
+                st.warning(risks_str)
+
+# Fill the decision / similar / details placeholders from a (possibly partial) analysis_result
+def render_analysis_sections(analysis, areas, local_similar=None, final=False, prior=None):
+    decision_area, similar_area, details_area = areas
+    if final or "Decision" in analysis or "DecisionExplanation" in analysis:
+        with decision_area.container(), tracing.span("render.decision", final=final):
+            render_decision_section(analysis, prior)
+    
+    # Fall back to the remote service's similar applications
+    if not local_similar and (final or "Top3SimilarApplications" in analysis):
+        with similar_area.container(), tracing.span("render.similar", final=final):
+            # Similar Applications Section
+            st.markdown("### Similar Applications")
+            render_similar_applications(analysis.get("Top3SimilarApplications", []))
+    
+    if final or "Recommendations" in analysis or "RisksIdentified" in analysis:
+        with details_area.container(), tracing.span("render.details", final=final):
+            render_details_section(analysis, final)
 
 # Function to clear form fields
 def clear_form():
@@ -271,86 +437,588 @@ def clear_form():
     # Clear application data and analysis result
     st.session_state.application_data = None
     st.session_state.analysis_result = None
+    st.session_state.submission = None
+    st.session_state.sensitivity = None
     
     # Rerun the app to refresh the form
     st.rerun()
 
-# IMPROVEMENT 2: Form validation
-def validate_form_data(form_data):
-    errors = []
+# Debug tab. A fragment: its explorer filters and buttons rerun only this panel
+@st.fragment
+def render_debug_panel():
+    st.header("Debugging Information")
+    st.caption(f"Analysis service: {api_client.get_client().base_url}")
+    backend = get_compute()
+    if isinstance(backend, compute.RemoteCompute):
+        st.caption(f"Compute service: {backend.base_url}"
+                   + ("" if backend.remote else " (unreachable, running in this process)"))
+    else:
+        st.caption("Compute: in this process")
+    if backend.error:
+        st.error(backend.error)
     
-    # Required fields validation
-    required_fields = ["companyName", "companyOrigin", "shareholderCompanyPartnerName", "shareholderNationality"]
-    for field in required_fields:
-        if not form_data.get(field):
-            errors.append(f"{field.replace('company', 'Company ').replace('shareholder', 'Shareholder ')} is required.")
+    # CSV Data Debug: filtered, sorted and paged by the compute backend, only the visible page is sent
+    with st.expander("CSV Data", expanded=False):
+        explorer_info = get_explorer_info()
+        if explorer_info["rows"]:
+            filters = {}
+            filter_cols = st.columns(len(explorer_info["index_columns"]))
+            for filter_col, column in zip(filter_cols, explorer_info["index_columns"]):
+                counts = dict(explorer_info["options"][column])
+                with filter_col:
+                    filters[column] = st.multiselect(
+                        column,
+                        options=list(counts),
+                        format_func=lambda value, counts=counts: f"{value} ({counts[value]})",
+                        key=f"explorer_filter_{column}"
+                    )
+            
+            col1, col2, col3 = st.columns([2, 1, 1])
+            with col1:
+                search = st.text_input("Search UUID / company / name", key="explorer_search")
+            with col2:
+                sort_by = st.selectbox("Sort by", options=[None] + explorer_info["columns"],
+                                       format_func=lambda column: "(file order)" if column is None else column,
+                                       key="explorer_sort")
+            with col3:
+                descending = st.checkbox("Descending", key="explorer_descending")
+            columns = st.multiselect("Columns", options=explorer_info["columns"],
+                                     default=[column for column in explorer.DEFAULT_COLUMNS if column in explorer_info["columns"]],
+                                     key="explorer_columns")
+            
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                page_size = st.selectbox("Rows per page", options=[25, 50, 100, 250], index=1, key="explorer_page_size")
+            # The page asked for last time comes back with the match count; a stale
+            # page number from a wider filter is clamped and fetched again
+            page = max(int(st.session_state.get("explorer_page", 1)), 1)
+            page_query = dict(filters=filters, search=search, columns=columns, sort_by=sort_by,
+                              ascending=not descending, page_size=page_size)
+            page_frame, total = backend.explorer_page(page=page, **page_query)
+            pages = max(1, -(-total // page_size))
+            if page > pages:
+                page = pages
+                page_frame, total = backend.explorer_page(page=page, **page_query)
+            with col2:
+                # Not bounded by max_value so the stale value above stays valid
+                st.number_input(f"Page (of {pages})", min_value=1, value=1, step=1, key="explorer_page")
+            st.dataframe(page_frame, use_container_width=True)
+            first = (page - 1) * page_size
+            st.caption(f"Rows {min(first + 1, total)}-{min(first + page_size, total)} of {total} matching ({explorer_info['rows']} total)")
+        else:
+            st.warning("No CSV data loaded")
     
-    # Financial validation
-    if form_data.get("numberOfEquityOrShares", 0) > 0 and form_data.get("shareValue", 0) > 0:
-        calculated_value = form_data.get("numberOfEquityOrShares", 0) * form_data.get("shareValue", 0)
-        declared_value = form_data.get("valueOfEquityOrShares", 0)
+    # Input JSON Debug
+    with st.expander("Input JSON (Application Data)", expanded=False):
+        if st.session_state.application_data:
+            st.json(st.session_state.application_data)
+        else:
+            st.info("No application data available. Submit the form first.")
+            
+    # Output JSON Debug
+    with st.expander("Output JSON (Analysis Result)", expanded=False):
+        if st.session_state.analysis_result:
+            st.json(st.session_state.analysis_result)
+        else:
+            st.info("No analysis result available. Submit the form first.")
+    
+    # Result cache metrics
+    with st.expander("Result Cache", expanded=False):
+        cache_stats = result_cache.get_cache().stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+        col2.metric("Hits (memory / disk)", f"{cache_stats['memory_hits']} / {cache_stats['disk_hits']}")
+        col3.metric("Misses", cache_stats["misses"])
+        col4.metric("Stored results", cache_stats["disk_entries"])
+        st.json(cache_stats)
+        if st.button("Clear Result Cache"):
+            result_cache.get_cache().clear()
+            st.success("Result cache cleared.")
+    
+    # Durable log of submissions and results, looked up by uuid through its sidecar index
+    with st.expander("Submission Log", expanded=False):
+        log = submission_log.get_log()
+        if log is not None:
+            st.caption(f"Log file: {log.path}")
+            lookup_uuid = st.text_input("Look up a uuid", key="submission_log_uuid")
+            if lookup_uuid:
+                logged = log.get(lookup_uuid.strip())
+                if logged is not None:
+                    st.json(logged)
+                else:
+                    st.info("No logged submission with this uuid.")
+            st.json(log.stats())
+        else:
+            st.info("The submission log is disabled (KDIPA_SUBMISSION_LOG is empty).")
+    
+    # Where submission time goes: spans of the recent submissions from this process
+    with st.expander("Timing", expanded=False):
+        tracer = tracing.get_tracer()
+        timing_summary = tracer.summary()
+        if timing_summary:
+            st.dataframe(pd.DataFrame(timing_summary), use_container_width=True, hide_index=True)
+            last_trace = tracer.trace(root="submission")
+            if last_trace:
+                st.markdown("**Latest submission**")
+                st.dataframe(pd.DataFrame(last_trace), use_container_width=True, hide_index=True)
+        else:
+            st.info("No spans recorded yet. Submit the form first.")
+        st.caption(f"Trace file: {tracer.path or '(disabled)'}"
+                   + (f" · Metrics: {tracing.metrics_url()}" if tracing.metrics_url() else ""))
         
-        # Check if there's a significant discrepancy (more than 5%)
-        if abs(calculated_value - declared_value) / (calculated_value + 0.01) > 0.05:
-            errors.append(f"Share value discrepancy detected: {form_data.get('numberOfEquityOrShares')} shares × {form_data.get('shareValue')} KWD per share = {calculated_value} KWD, but declared value is {declared_value} KWD.")
+        st.checkbox("Profile full reruns with cProfile", key="profile_reruns",
+                    help="Takes effect from the next full rerun; reruns are slower while it is on")
+        if st.session_state.get("rerun_profile"):
+            st.code(st.session_state.rerun_profile)
     
-    # Percentage validation
-    if form_data.get("percentageOfEquityOrShares", 0) > 100:
-        errors.append("Percentage of equity/shares cannot exceed 100%.")
+    # Pre-screening rules evaluated over the whole export
+    with st.expander("Rule Audit (CSV)", expanded=False):
+        rule_audit = backend.rule_audit()
+        if rule_audit is not None:
+            st.dataframe(rule_audit, use_container_width=True)
+        else:
+            st.warning("No CSV data loaded")
     
-    # Investment validation
-    total_investment = form_data.get("totalInvestmentValue", 0)
-    cap_ex = form_data.get("capitalExpenditure", 0)
-    op_ex = form_data.get("operatingExpense", 0)
+    # Original CSV Row (if using random from CSV)
+    with st.expander("Original CSV Row", expanded=False):
+        if 'random_values' in st.session_state and '_original_csv_row' in st.session_state.random_values:
+            st.json(st.session_state.random_values['_original_csv_row'])
+        else:
+            st.info("No original CSV row data available.")
+
+# Batch tab: scoring of an uploaded file, rerun on its own
+@st.fragment
+def render_batch_panel():
+    st.header("Batch Scoring")
+    st.markdown("Upload a CSV (same columns as the KDIPA export) or JSONL file (one application per line) to score every application. "
+                "Re-running the same file resumes from the rows that already succeeded.")
     
-    if total_investment > 0 and (cap_ex + op_ex) > 0 and (cap_ex + op_ex) > total_investment * 1.5:
-        errors.append(f"Total investment value ({total_investment} KWD) seems inconsistent with capital expenditure ({cap_ex} KWD) and operating expenses ({op_ex} KWD).")
+    batch_file = st.file_uploader("Applications file", type=["csv", "jsonl"])
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        batch_concurrency = st.number_input("Concurrent requests", min_value=1, max_value=32, value=4, step=1)
+    with col2:
+        batch_rate = st.number_input("Max requests per second (0 = unlimited)", min_value=0.0, value=2.0, step=0.5)
+    with col3:
+        batch_retries = st.number_input("Retries per application", min_value=0, max_value=5, value=2, step=1)
     
-    return errors
+    if batch_file is not None and st.button("Run Batch", type="primary"):
+        import batch
+        
+        try:
+            batch_rows = batch.load_applications(batch_file)
+        except Exception as e:
+            st.error(f"Could not read {batch_file.name}: {str(e)}")
+            batch_rows = []
+        
+        if batch_rows:
+            # One results file per uploaded content, so re-uploading the same file resumes it
+            content_hash = hashlib.sha1(batch_file.getvalue()).hexdigest()[:10]
+            results_path = os.path.join(BATCH_RESULTS_DIR, f"{os.path.splitext(batch_file.name)[0]}-{content_hash}.results.jsonl")
+            already_done = sum(1 for result in batch.read_checkpoint(results_path).values() if result.get("status") in batch.FINISHED_STATUSES)
+            total = len(batch_rows) - already_done
+            st.write(f"{len(batch_rows)} applications, {already_done} already scored.")
+            
+            progress = st.progress(0.0, text="Scoring applications...")
+            results_table = st.empty()
+            batch_results = []
+            # Its own connection pool and circuit breaker: a large or failing batch
+            # neither holds the connections nor opens the breaker of interactive analyses
+            batch_client = api_client.AnalysisClient(pool_size=int(batch_concurrency))
+            try:
+                for result in batch.run_batch(batch_rows, client=batch_client, concurrency=int(batch_concurrency),
+                                              rate=batch_rate, row_retries=int(batch_retries), results_path=results_path):
+                    batch_results.append(batch.summarize(result))
+                    progress.progress(len(batch_results) / max(total, 1), text=f"Scored {len(batch_results)} of {total}")
+                    results_table.dataframe(pd.DataFrame(batch_results), use_container_width=True)
+            finally:
+                batch_client.pool.close()
+            
+            failed = sum(1 for result in batch_results if result["status"] not in batch.FINISHED_STATUSES)
+            rejected = sum(1 for result in batch_results if result["status"] == "rejected")
+            if rejected:
+                st.info(f"{rejected} applications were rejected by local pre-screening and not sent for analysis.")
+            if failed:
+                st.warning(f"{failed} applications failed. Run the batch again to retry them.")
+            else:
+                st.success("All applications scored.")
+            with open(results_path, "rb") as f:
+                st.download_button("Download results (JSONL)", f.read(), file_name=os.path.basename(results_path))
 
-# Application title and description
-st.title("Investment License Analysis")
+DASHBOARD_DIMENSIONS = {
+    "name_sector": "Sector",
+    "shareholderNationality": "Shareholder nationality",
+    "companyOrigin": "Country of origin",
+    "licenseType": "License type",
+    "month": "Submission month",
+}
 
-# IMPROVEMENT 5: Better user experience with context and instructions
-with st.expander("About this application", expanded=False):
-    st.markdown("""
-    ## Investment License Analysis Tool
+# Totals, the grouped table and the monthly trend of the dashboard. Cached on the
+# cube's updated_at, so reruns between submissions skip the queries.
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_dashboard_data(updated_at, group_by, include_missing):
+    portfolio = cube.get_cube()
+    totals = portfolio.query().to_dict("records")[0]
+    table = portfolio.query(group_by)
+    if group_by and not include_missing:
+        table = table[(table[list(group_by)] != cube.MISSING).all(axis=1)]
+    for dimension in set(group_by) & {"shareholderNationality", "companyOrigin"}:
+        table = table.assign(**{dimension: table[dimension].map(lambda code: code if code == cube.MISSING else country_label(code))})
+    table = table.rename(columns={**DASHBOARD_DIMENSIONS, "applications": "Applications", "accepted": "Accepted",
+                                  "rejected": "Rejected", "pending": "Pending", "investment_total": "Total investment",
+                                  "investment_count": "With investment", "acceptance_rate": "Acceptance rate",
+                                  "average_investment": "Average investment"})
+    monthly = portfolio.query(["month"])
+    monthly = monthly[monthly["month"] != cube.MISSING].set_index("month")[["accepted", "rejected", "pending"]]
+    return {"totals": totals, "table": table, "monthly": monthly, "cells": len(portfolio), "applied": portfolio.submissions}
+
+# Dashboard tab: portfolio aggregates over the incrementally maintained cube,
+# built only while the dashboard is switched on
+@st.fragment
+def render_dashboard():
+    st.header("Portfolio Dashboard")
+    if not st.toggle("Show dashboard", value=False, key="show_dashboard"):
+        st.caption("Switch the dashboard on to load the portfolio aggregates.")
+        return
+    try:
+        # Picks up submissions made in other sessions and processes
+        portfolio = cube.get_cube().refresh()
+    except Exception as e:
+        st.error(f"Portfolio aggregates are not available: {str(e)}")
+        return
     
-    This application helps evaluate investment license applications for potential approval. 
+    # The totals go above the grouping controls but need their values first
+    metrics = st.container()
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        group_by = st.multiselect("Group by", list(DASHBOARD_DIMENSIONS), default=["name_sector"], max_selections=2,
+                                  format_func=DASHBOARD_DIMENSIONS.get, key="dashboard_group_by")
+    with col2:
+        include_missing = st.checkbox("Include applications without a value", value=False, key="dashboard_include_missing")
+    data = get_dashboard_data(portfolio.updated_at, tuple(group_by), include_missing)
     
-    ### How to use:
-    1. Fill out the application form with company and investment details
-    2. Use the "Get Data" button to pre-fill with sample data if needed
-    3. Review all fields for accuracy
-    4. Submit your application for analysis
-    5. View results and recommendations
+    totals = data["totals"]
+    col1, col2, col3, col4 = metrics.columns(4)
+    col1.metric("Applications", f"{totals['applications']:,}")
+    col2.metric("Acceptance rate", "N/A" if pd.isna(totals["acceptance_rate"]) else f"{totals['acceptance_rate']:.1%}")
+    col3.metric("Pending", f"{totals['pending']:,}")
+    col4.metric("Total investment (KWD)", f"{totals['investment_total']:,.0f}")
     
-    The analysis will evaluate your application based on multiple factors and provide recommendations.
-    """)
+    table = data["table"]
+    st.dataframe(table.style.format({"Acceptance rate": "{:.1%}", "Total investment": "{:,.0f}", "Average investment": "{:,.0f}"},
+                                    na_rep="N/A"), use_container_width=True, hide_index=True)
+    if len(group_by) == 1 and not table.empty:
+        st.bar_chart(table.set_index(DASHBOARD_DIMENSIONS[group_by[0]])["Acceptance rate"])
+    
+    st.subheader("Monthly trend")
+    if not data["monthly"].empty:
+        st.line_chart(data["monthly"])
+    
+    st.caption(f"{data['cells']:,} aggregate cells over {totals['applications']:,} applications, "
+               f"{data['applied']:,} of them submitted here. Acceptance rates count decided applications only.")
 
-st.markdown("Complete the application form below to analyze your investment license application.")
+# Pre-screening messages of a submission; returns True when it was rejected
+def render_screening(submission):
+    for severity, message in submission["screening"]:
+        if severity != "reject":
+            st.warning(message)
+    rejections = [message for severity, message in submission["screening"] if severity == "reject"]
+    if rejections:
+        for message in rejections:
+            st.error(message)
+        st.error("The application was rejected by local pre-screening and was not sent for analysis.")
+    return bool(rejections)
 
-# Initialize session state for application data
-if 'application_data' not in st.session_state:
-    st.session_state.application_data = None
-
-if 'analysis_result' not in st.session_state:
+# Screen and analyse a submitted application, showing sections as they arrive.
+# Everything needed to show the outcome again is kept in st.session_state.submission.
+def run_submission(application_data, skip_remote_when_confident=False, filter_expr=None, top_similar=3):
+    # Local pre-screening: applications that cannot be valid never reach the paid analysis service.
+    # The ruleset includes the form validation checks of rules.VALIDATION_RULES.
+    with tracing.span("validate") as span:
+        screening = get_compute().screen(application_data)
+        span.set(violations=len(screening))
+    submission = {
+        "application_data": application_data,
+        "screening": screening,
+        "local_similar": None,
+        "prior": None,
+        "analysis_result": None,
+    }
+    st.session_state.submission = submission
+    st.session_state.sensitivity = None
     st.session_state.analysis_result = None
+    
+    # Every submission and result is kept in the append-only log (.log/submissions.jsonl by default)
+    log = submission_log.get_log()
+    if log is not None:
+        log.log_submission(application_data, screening=screening, filter_expr=filter_expr, top_similar=top_similar)
+        # Written now rather than with the next batch, so the compute service's
+        # indexes see it before the duplicate and similarity checks
+        try:
+            log.flush()
+        except OSError as e:
+            st.caption(f"Submission log not written yet: {str(e)}")
+    # Later submissions are checked for duplicates against this one too, and
+    # compared with it financially once it passes pre-screening
+    try:
+        get_compute().register(application_data, rejected=any(severity == "reject" for severity, _ in screening))
+    except Exception as e:
+        st.caption(f"Duplicate name and financial indexes not updated: {str(e)}")
+    if render_screening(submission):
+        return
+    # Placeholders keep the result sections in page order while they fill in at different times
+    decision_area = st.empty()
+    similar_area = st.empty()
+    details_area = st.empty()
+    result_areas = (decision_area, similar_area, details_area)
+    
+    # Similar applications come from the local engine, so they render before the remote analysis returns
+    with tracing.span("similar_search"):
+        local_similar = find_similar_applications(application_data, k=top_similar, filter_expr=filter_expr)
+    submission["local_similar"] = local_similar
+    if local_similar:
+        with similar_area.container():
+            st.markdown("### Similar Applications")
+            render_similar_applications(local_similar)
+    
+    # Instant prior from the local model trained on historical outcomes
+    import decision_model
+    
+    with tracing.span("local_model"):
+        model = decision_model.get_model()
+        prior = model.predict(application_data) if model is not None else None
+    submission["prior"] = prior
+    
+    # Without the remote analysis there is no decision, only the prior: the
+    # model learns proxy labels from a few historical applications
+    prior_only = prior is not None and skip_remote_when_confident and prior.confidence >= LOCAL_SKIP_CONFIDENCE
+    if prior_only:
+        analysis_result = {
+            "analysis_result": {
+                "DecisionExplanation": f"The remote analysis was skipped, so there is no decision yet. The local model trained on "
+                                       f"{model.metadata.get('trained_rows', 'N/A')} historical applications predicts {prior.decision} "
+                                       f"with {prior.confidence:.0%} confidence."
+            }
+        }
+    else:
+        if prior is not None:
+            with decision_area.container():
+                st.markdown("## Analysis Results")
+                st.info(f"Local model prior: {prior.decision} ({prior.confidence:.0%} confidence). Waiting for the remote analysis...")
+        
+        # Analyze the application; streamed sections are shown as soon as they arrive
+        with tracing.span("analyze"):
+            analysis_result = analyze_application(
+                application_data,
+                on_update=lambda sections: render_analysis_sections(sections, result_areas, local_similar, prior=prior),
+                filter_expr=filter_expr,
+                top_similar=top_similar
+            )
+    
+    # Store the analysis result in session state for debugging
+    submission["analysis_result"] = analysis_result
+    st.session_state.analysis_result = analysis_result
+    # Portfolio aggregates count the submission and its decision from the log
+    # the next time the dashboard is shown
+    if log is not None and analysis_result:
+        log.log_result(application_data["uuid"], analysis_result, source="local_model" if prior_only else "service")
+    
+    if analysis_result:
+        # Extract the analysis result
+        analysis = analysis_result.get("analysis_result", {})
+        render_analysis_sections(analysis, result_areas, local_similar, final=True, prior=prior)
 
-if 'form_submitted' not in st.session_state:
-    st.session_state.form_submitted = False
+# Show the last submission again from session state, without repeating the
+# similarity search, the local model or the remote analysis
+def render_submission(submission):
+    if render_screening(submission):
+        return
+    
+    result_areas = (st.empty(), st.empty(), st.empty())
+    local_similar = submission["local_similar"]
+    if local_similar:
+        with result_areas[1].container():
+            st.markdown("### Similar Applications")
+            render_similar_applications(local_similar)
+    
+    analysis_result = submission["analysis_result"]
+    if analysis_result:
+        analysis = analysis_result.get("analysis_result", {})
+        render_analysis_sections(analysis, result_areas, local_similar, final=True, prior=submission["prior"])
+    else:
+        st.warning("The last analysis did not complete. Submit the application again to retry.")
 
-# Create a form with tabs for organization
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["Company Details", "Financial Details", "Shareholder Information", "Submission", "Debug"])
+# Results panel below the tabs. A submission handed over by the form is analysed
+# here on the next full run; every later rerun redraws it from session state.
+@st.fragment
+def render_results_panel():
+    pending = st.session_state.pop("pending_submission", None)
+    pending_sensitivity = st.session_state.pop("pending_sensitivity", None)
+    if pending is not None:
+        # Joins the trace the form started when it prepared the application data
+        with tracing.span("submission", trace_id=pending.pop("trace_id", None)):
+            run_submission(**pending)
+    elif pending_sensitivity is not None:
+        with tracing.span("sensitivity", trace_id=pending_sensitivity.pop("trace_id", None)):
+            run_sensitivity(**pending_sensitivity)
+    elif st.session_state.submission is not None:
+        with tracing.span("redraw"):
+            render_submission(st.session_state.submission)
+    elif st.session_state.sensitivity is not None:
+        with tracing.span("redraw"):
+            run = st.session_state.sensitivity
+            # Pick up variants that finished since the last rerun (e.g. after a cancel)
+            for _ in run.as_completed(timeout=0):
+                pass
+            render_sensitivity(run)
 
-# Create form for user input
-with st.form("application_form", clear_on_submit=False):
-    # Random values generator and Clear Form buttons
-    col1, col2 = st.columns(2)
-    with col1:
-        random_button = st.form_submit_button("Get Data", type="secondary")
-    with col2:
-        clear_button = st.form_submit_button("Clear Form", type="secondary")
+# Grid values shown as they appear in the form
+def format_sensitivity_value(field, value):
+    if field == "totalInvestmentValue":
+        return f"{value:,.0f}"
+    if field == "percentageOfEquityOrShares":
+        return f"{value:g}%"
+    if field == "shareholderNationality":
+        return country_label(value)
+    return value
+
+# Decision matrix of a what-if run; cells whose decision differs from the
+# unmodified application's are highlighted
+def render_sensitivity(run):
+    st.markdown("## What-If Analysis")
+    base = run.base_decision
+    table = run.table()
+    st.write(f"Unmodified application: **{base or run.variants[run.base_key]['state']}**")
+    decisions = {variant["decision"] for variant in run.variants.values() if variant["decision"]}
+    matrix = run.matrix(format_value=format_sensitivity_value)
+    st.dataframe(
+        matrix.style.map(lambda decision: "background-color: #ffe0b2" if base and decision in decisions and decision != base else ""),
+        use_container_width=True
+    )
+    flipped = int(table["Flipped"].sum())
+    if run.done():
+        st.write(f"{flipped} of {len(table)} variants change the decision.")
+    if run.elapsed is not None:
+        st.caption(f"{len(run)} distinct analyses for {len(run.cells)} combinations in {run.elapsed:.1f}s "
+                   f"(about {run.sequential_ms() / 1000:.1f}s one after another)")
+    problems = table[table["Error"].notna()]
+    if not problems.empty:
+        with st.expander(f"{len(problems)} variants without a decision"):
+            st.dataframe(problems.drop(columns=["Flipped"]), use_container_width=True)
+
+def cancel_sensitivity():
+    run = st.session_state.get("sensitivity")
+    if run is not None:
+        run.cancel()
+
+# Fan a grid of variants of the application out to the service and fill in the
+# decision matrix as they come back. The run is kept in st.session_state.sensitivity.
+def run_sensitivity(application_data, axes, filter_expr=None, top_similar=3):
+    st.session_state.submission = None
+    try:
+        run = sensitivity.SensitivityRun(application_data, axes, filter_expr=filter_expr, top_similar=top_similar,
+                                         cache=result_cache.get_cache())
+    except ValueError as e:
+        st.error(f"What-if analysis not started: {str(e)}")
+        return
+    st.session_state.sensitivity = run
+    
+    status = st.status(f"Analyzing {len(run)} variants...", expanded=False)
+    with status:
+        st.button("Cancel What-If Analysis", on_click=cancel_sensitivity)
+    area = st.empty()
+    with area.container():
+        render_sensitivity(run)
+    run.start()
+    for finished, _ in enumerate(run.as_completed(), 1):
+        status.update(label=f"{finished}/{len(run)} variants analyzed")
+        with area.container():
+            render_sensitivity(run)
+    status.update(label=f"What-if analysis complete: {len(run)} variants", state="complete")
+    with area.container():
+        render_sensitivity(run)
+
+# What-if choices in the Submission tab: investment multipliers, equity
+# percentages and nationalities to try instead of the form's values
+def render_sensitivity_options():
+    with st.expander("What-if analysis", expanded=False):
+        st.caption("Analyse variants of this application side by side to see which changes flip the decision. "
+                   "Variants that make the same request are sent once.")
+        multipliers = st.multiselect("Total investment value", sensitivity.INVESTMENT_MULTIPLIERS,
+                                     format_func=lambda m: f"×{m:g}", key="whatif_investment")
+        percentages = st.multiselect("Percentage of equity/shares", sensitivity.EQUITY_PERCENTAGES,
+                                     format_func=lambda p: f"{p:g}%", key="whatif_equity")
+        nationalities = st.multiselect("Shareholder nationality", COUNTRY_CODES,
+                                       format_func=country_label, key="whatif_nationality")
+    return {"multipliers": multipliers, "percentages": percentages, "nationalities": nationalities}
+
+# Filter builder for the service's similar-application search, in the Submission tab.
+# Returns the compiled filter (None searches the whole index), top_similar and
+# the problems that keep the filter from being sent.
+def render_search_options():
+    options = get_filter_options()
+    values = options["values"]
+    with st.expander("Similar application search", expanded=False):
+        st.caption("Narrow the historical applications the analysis compares against. "
+                   "Choices come from the application export.")
+        selected = {}
+        col1, col2 = st.columns(2)
+        with col1:
+            selected["name_sector"] = st.multiselect("Sector", values.get("name_sector", []), key="search_name_sector")
+            activities = values.get("name_activity", [])
+            if selected["name_sector"] and options["activities_by_sector"]:
+                # Only the activities of the chosen sectors, plus anything already picked
+                activities = sorted(
+                    {activity for sector in selected["name_sector"] for activity in options["activities_by_sector"].get(sector, [])}
+                    | set(st.session_state.get("search_name_activity", []))
+                )
+            selected["name_activity"] = st.multiselect("Activity", activities, format_func=str.strip, key="search_name_activity")
+        with col2:
+            selected["licenseType"] = st.multiselect("License type", values.get("licenseType", []), key="search_licenseType")
+            selected["companyOrigin"] = st.multiselect("Country of origin", values.get("companyOrigin", []),
+                                                       format_func=country_label, key="search_companyOrigin")
+        
+        date_from = date_to = None
+        if options["date_range"] is not None and st.checkbox("Limit submission dates", key="search_limit_dates"):
+            picked = st.date_input("Submitted between", value=options["date_range"], key="search_dates")
+            if isinstance(picked, (list, tuple)) and len(picked) == 2:
+                date_from, date_to = picked
+        
+        top_similar = st.slider("Similar applications to retrieve", search_filter.MIN_TOP_SIMILAR,
+                                search_filter.MAX_TOP_SIMILAR, 3, key="search_top_similar")
+        
+        filter_expr = search_filter.build_filter(selected, date_from, date_to)
+        if st.checkbox("Edit the filter expression", key="search_edit_filter"):
+            filter_expr = st.text_area("Filter expression (OData)", value=filter_expr or "", key="search_filter_text").strip() or None
+        problems = search_filter.validate_filter(filter_expr) if filter_expr is not None else []
+        if problems:
+            st.error("Invalid filter: " + " ".join(problems))
+        elif filter_expr is not None:
+            st.code(filter_expr, language=None)
+        else:
+            st.caption("No filter: the whole index is searched.")
+    return filter_expr, top_similar, problems
+
+# Application form, the body of the Application tab. A fragment, so "Get Data"
+# and "Clear Form" rerun the form without redrawing the results or the other tabs.
+@st.fragment
+def render_application_form():
+
+    # Create a form with tabs for organization
+    tab1, tab2, tab3, tab4 = st.tabs(["Company Details", "Financial Details", "Shareholder Information", "Submission"])
+
+    # The form holds only its buttons and the estimates shown with them. The
+    # fields in the tabs above are outside it, so every change reruns this
+    # fragment and the duplicate name check, the estimates and the conditional
+    # fields follow what was entered.
+    form = st.form("application_form", clear_on_submit=False)
+    with form:
+        # Random values generator and Clear Form buttons
+        col1, col2 = st.columns(2)
+        with col1:
+            random_button = st.form_submit_button("Get Data", type="secondary")
+        with col2:
+            clear_button = st.form_submit_button("Clear Form", type="secondary")
     
     if random_button:
         st.session_state.random_values = get_random_csv_values()
@@ -377,14 +1045,18 @@ with st.form("application_form", clear_on_submit=False):
             company_name = st.text_input(
                 "Company Name", 
                 value=get_random_value("companyName"),
-                help="Enter the legal name of the company applying for the license"
+                help="Enter the legal name of the company applying for the license",
+                key="company_name",
+                on_change=check_duplicate_candidates,
+                args=("company_name",)
             )
+            render_duplicate_candidates("company_name")
             
             company_origin = st.selectbox(
                 "Country of Origin", 
-                options=[code for code, _ in COUNTRY_LIST],
-                format_func=lambda x: COUNTRY_NAMES.get(x, x),
-                index=COUNTRY_CODES.index(get_random_value("companyOrigin")) if get_random_value("companyOrigin") in COUNTRY_CODES else 0,
+                options=COUNTRY_CODES,
+                format_func=country_label,
+                index=country_index(get_random_value("companyOrigin")),
                 help="Select the country where the company is legally registered"
             )
             
@@ -418,6 +1090,24 @@ with st.form("application_form", clear_on_submit=False):
                 value=get_random_value("companyOutput"),
                 help="Describe the main products or services the company provides"
             )
+            
+            sector_options = get_filter_options()
+            sectors = [""] + sector_options["values"].get("name_sector", [])
+            name_sector = st.selectbox(
+                "Sector",
+                options=sectors,
+                format_func=lambda value: value.strip() or "Not specified",
+                index=sectors.index(get_random_value("name_sector")) if get_random_value("name_sector") in sectors else 0,
+                help="Sector of the business activity; financial amounts are compared with applications of the same sector"
+            )
+            activities = [""] + sector_options["activities_by_sector"].get(name_sector, [])
+            name_activity = st.selectbox(
+                "Activity",
+                options=activities,
+                format_func=lambda value: value.strip() or "Not specified",
+                index=activities.index(get_random_value("name_activity")) if get_random_value("name_activity") in activities else 0,
+                help="Activity within the sector"
+            )
     
     # Tab 2: Financial Details
     with tab2:
@@ -485,6 +1175,17 @@ with st.form("application_form", clear_on_submit=False):
                 format="%.2f",
                 help="Total value of the investment being proposed"
             )
+        
+        render_financial_profile({
+            "name_sector": name_sector,
+            "name_activity": name_activity,
+            "cashAmount": cash_amount,
+            "totalCapitalAmount": total_capital_amount,
+            "capitalExpenditure": capital_expenditure,
+            "operatingExpense": operating_expense,
+            "fixedAssets": fixed_assets,
+            "totalInvestmentValue": total_investment_value,
+        })
     
     # Tab 3: Shareholder Information
     with tab3:
@@ -495,14 +1196,18 @@ with st.form("application_form", clear_on_submit=False):
             shareholder_name = st.text_input(
                 "Shareholder/Company Partner Name", 
                 value=get_random_value("shareholderCompanyPartnerName"),
-                help="Name of the primary shareholder or partner company"
+                help="Name of the primary shareholder or partner company",
+                key="shareholder_name",
+                on_change=check_duplicate_candidates,
+                args=("shareholder_name",)
             )
+            render_duplicate_candidates("shareholder_name")
             
             shareholder_nationality = st.selectbox(
                 "Nationality", 
-                options=[code for code, _ in COUNTRY_LIST],
-                format_func=lambda x: COUNTRY_NAMES.get(x, x),
-                index=COUNTRY_CODES.index(get_random_value("shareholderNationality")) if get_random_value("shareholderNationality") in COUNTRY_CODES else 0,
+                options=COUNTRY_CODES,
+                format_func=country_label,
+                index=country_index(get_random_value("shareholderNationality")),
                 help="Country of nationality for the shareholder (individual) or registration (company)"
             )
             
@@ -570,6 +1275,15 @@ with st.form("application_form", clear_on_submit=False):
         terms_conditions = st.checkbox("I agree to the Terms and Conditions", 
                                      value=get_random_value("termsAndConditions", False))
         
+        st.header("Analysis Options")
+        skip_remote_when_confident = st.checkbox(
+            f"Skip the remote analysis when the local model is at least {LOCAL_SKIP_CONFIDENCE:.0%} confident",
+            value=False,
+            help="The local model is trained on historical application outcomes and answers instantly"
+        )
+        filter_expr, top_similar, search_problems = render_search_options()
+        what_if = render_sensitivity_options()
+        
         st.header("Application Metadata")
         st.info("These fields will be auto-populated upon submission")
         
@@ -579,217 +1293,167 @@ with st.form("application_form", clear_on_submit=False):
         with col2:
             st.text_input("License Type", value="ApplicationInvestmentLicenseA", disabled=True)
     
-    # Submit button
-    submit_button = st.form_submit_button("Submit Application")
-
-# Tab 5: Debug tab (outside the form)
-with tab5:
-    st.header("Debugging Information")
-    
-    # CSV Data Debug
-    with st.expander("CSV Data", expanded=False):
-        df = load_csv_data()
-        if not df.empty:
-            st.dataframe(df)
-        else:
-            st.warning("No CSV data loaded")
-    
-    # Input JSON Debug
-    with st.expander("Input JSON (Application Data)", expanded=False):
-        if st.session_state.application_data:
-            st.json(st.session_state.application_data)
-        else:
-            st.info("No application data available. Submit the form first.")
-            
-    # Output JSON Debug
-    with st.expander("Output JSON (Analysis Result)", expanded=False):
-        if st.session_state.analysis_result:
-            st.json(st.session_state.analysis_result)
-        else:
-            st.info("No analysis result available. Submit the form first.")
+    form_data = {
+        "companyName": company_name,
+        "companyOrigin": company_origin,
+        "companyCity": company_city,
+        "companyStreet": company_street,
+        "companyBuilding": company_building,
+        "companyPostalAddress": company_postal,
+        "companyOutput": company_output,
+        "name_sector": name_sector or None,
+        "name_activity": name_activity or None,
+        "cashAmount": cash_amount,
+        "contributionAmount": contribution_amount,
+        "totalCapitalAmount": total_capital_amount,
+        "capitalExpenditure": capital_expenditure,
+        "operatingExpense": operating_expense,
+        "fixedAssets": fixed_assets,
+        "totalInvestmentValue": total_investment_value,
+        "shareholderCompanyPartnerName": shareholder_name,
+        "shareholderNationality": shareholder_nationality,
+        "shareValue": share_value,
+        "valueOfEquityOrShares": value_of_shares,
+        "percentageOfEquityOrShares": percentage_of_shares,
+        "numberOfEquityOrShares": number_of_shares,
+        "contributionType": {"cash": cash_contribution},
+        "incentives": incentives_requested,
+        "incentiveType": {"exemptionFromIncomeTax": exemption_income_tax},
+        "preferredIncentive": preferred_incentive,
+        "termsAndConditions": terms_conditions,
+        "appType": "ApplicationInvestmentLicenseA",
+        "licenseType": "ApplicationInvestmentLicenseA"
+    }
     
-    # Original CSV Row (if using random from CSV)
-    with st.expander("Original CSV Row", expanded=False):
-        if 'random_values' in st.session_state and '_original_csv_row' in st.session_state.random_values:
-            st.json(st.session_state.random_values['_original_csv_row'])
+    with form:
+        # Prompt size of the application as it stands, refreshed on every change
+        preview = get_compute().preview(
+            form_data,
+            filter_expr=None if search_problems else filter_expr,
+            top_similar=top_similar
+        )
+        estimate = preview["estimate"]
+        if tokens.over_budget(estimate):
+            st.warning(f"Over the token budget: {describe_token_estimate(estimate)}")
         else:
-            st.info("No original CSV row data available.")
-
-# Process form submission
-if submit_button:
-    # Validate required fields
-    if not company_name or not terms_conditions:
-        st.error("Please fill in all required fields and agree to the terms and conditions.")
-    else:
-        # Prepare application data
-        application_data = prepare_application_data({
-            "companyName": company_name,
-            "companyOrigin": company_origin,
-            "companyCity": company_city,
-            "companyStreet": company_street,
-            "companyBuilding": company_building,
-            "companyPostalAddress": company_postal,
-            "companyOutput": company_output,
-            "cashAmount": cash_amount,
-            "contributionAmount": contribution_amount,
-            "totalCapitalAmount": total_capital_amount,
-            "capitalExpenditure": capital_expenditure,
-            "operatingExpense": operating_expense,
-            "fixedAssets": fixed_assets,
-            "totalInvestmentValue": total_investment_value,
-            "shareholderCompanyPartnerName": shareholder_name,
-            "shareholderNationality": shareholder_nationality,
-            "shareValue": share_value,
-            "valueOfEquityOrShares": value_of_shares,
-            "percentageOfEquityOrShares": percentage_of_shares,
-            "numberOfEquityOrShares": number_of_shares,
-            "contributionType": {"cash": cash_contribution},
-            "incentives": incentives_requested,
-            "incentiveType": {"exemptionFromIncomeTax": exemption_income_tax},
-            "preferredIncentive": preferred_incentive,
-            "termsAndConditions": terms_conditions,
-            "appType": "ApplicationInvestmentLicenseA",
-            "licenseType": "ApplicationInvestmentLicenseA"
-        })
+            st.caption(describe_token_estimate(estimate).capitalize())
         
-        # Store the application data in session state for debugging
-        st.session_state.application_data = application_data
+        # Submit button
+        submit_button = st.form_submit_button("Submit Application")
         
-        # Analyze the application
-        analysis_result = analyze_application(application_data)
-        
-        # Store the analysis result in session state for debugging
-        st.session_state.analysis_result = analysis_result
-        
-        if analysis_result:
-            # Display analysis results
-            st.markdown("## Analysis Results")
-            
-            # Extract the analysis result
-            analysis = analysis_result.get("analysis_result", {})
-            
-            # Decision Summary Section
-            st.markdown("### Decision Summary")
-            
-            # Create columns for decision and explanation
-            col1, col2 = st.columns([1, 3])
-            
-            decision = analysis.get("Decision")
-            with col1:
-                if decision == "ACCEPTED":
-                    st.success("✅ ACCEPTED")
-                elif decision == "REJECTED":
-                    st.error("❌ REJECTED")
-                # else:
-                #     st.warning("⚠️ UNKNOWN")
-            
-            with col2:
-                with st.expander("Decision Explanation", expanded=True):
-                    st.write(analysis.get("DecisionExplanation", "No explanation provided."))
-            
-            # Similar Applications Section
-            st.markdown("### Similar Applications")
-            
-            # Debug expander for raw response
-            with st.expander("Raw Analysis Response (Debug)", expanded=False):
-                st.json(analysis)
-            
-            # Look for the top similar applications in the analysis
-            top_similar = analysis.get("Top3SimilarApplications", [])
-            
-            if top_similar and isinstance(top_similar, list) and len(top_similar) > 0:
-                st.write(f"Found {len(top_similar)} similar applications")
-                
-                # Display each similar application in a card-like format
-                for i, app in enumerate(top_similar):
-                    with st.container():
-                        col1, col2, col3 = st.columns([1, 3, 1])
-                        
-                        with col1:
-                            # Handle different possible key names for similarity percentage
-                            percentage = app.get("PercentageMatching", 
-                                             app.get("Similarity", 
-                                                 app.get("percentage_matching", 
-                                                     app.get("similarity", "N/A"))))
-                            
-                            # Clean up percentage format
-                            if isinstance(percentage, str) and "%" in percentage:
-                                percentage = percentage.replace("%", "").strip()
-                            
-                            try:
-                                percentage_value = float(percentage)
-                                st.metric("Match", f"{percentage_value:.1f}%")
-                            except (ValueError, TypeError):
-                                st.metric("Match", str(percentage))
-                        
-                        with col2:
-                            st.subheader(f"Application #{i+1}")
-                            
-                            # Handle different possible key names for UUID
-                            uuid_value = app.get("UUID", 
-                                             app.get("uuid", 
-                                                 app.get("id", "N/A")))
-                            st.markdown(f"**UUID:** {uuid_value}")
-                            
-                            # Handle different possible key names for description
-                            description = app.get("Description", 
-                                              app.get("description", 
-                                                  app.get("companyName", 
-                                                      app.get("company_name", "N/A"))))
-                            st.markdown(f"**Description:** {description}")
-                        
-                        with col3:
-                            # Handle different possible key names for status/decision
-                            status = app.get("Status", 
-                                         app.get("status", 
-                                             app.get("Decision", 
-                                                 app.get("decision", "N/A"))))
-                            
-                            if status and isinstance(status, str):
-                                status_upper = status.upper()
-                                if "ACCEPT" in status_upper:
-                                    st.success("ACCEPTED")
-                                elif "REJECT" in status_upper:
-                                    st.error("REJECTED")
-                                else:
-                                    st.info(status)
-                            else:
-                                st.info("N/A")
-                    
-                    st.divider()
+        # Size of the what-if grid, when one is set up
+        axes = sensitivity.grid_axes(preview["application_data"], **what_if)
+        if axes:
+            _, cells, variants, _ = sensitivity.build_grid(
+                preview["application_data"], axes, filter_expr=None if search_problems else filter_expr, top_similar=top_similar
+            )
+            if len(variants) > sensitivity.MAX_VARIANTS:
+                st.warning(f"The what-if grid needs {len(variants)} analyses, more than the limit of {sensitivity.MAX_VARIANTS}.")
             else:
-                st.info("No similar applications found in the response.")
+                st.caption(f"What-if grid: {len(cells)} combinations, {len(variants)} distinct analyses sent concurrently")
+        what_if_button = st.form_submit_button("Run What-If Analysis", disabled=not axes)
+
+    # Process form submission (a what-if run takes the same checks)
+    if submit_button or what_if_button:
+        # Validate required fields
+        if not company_name or not terms_conditions:
+            st.error("Please fill in all required fields and agree to the terms and conditions.")
+        elif search_problems:
+            st.error("Fix the similar application search filter in the Submission tab before submitting.")
+        else:
+            # Prepare application data; the trace started here continues in the results panel
+            trace_id = tracing.new_trace_id()
+            with tracing.span("prepare_application_data", trace_id=trace_id) as span:
+                application_data = get_compute().prepare(form_data)
+                span.set(bytes=len(json.dumps(application_data, default=str)))
             
-            # Recommendations Section
-            st.markdown("### Recommendations")
-            recommendations = analysis.get("Recommendations", "No recommendations provided.")
+            # Store the application data in session state for debugging
+            st.session_state.application_data = application_data
             
-            if isinstance(recommendations, list):
-                for rec in recommendations:
-                    st.markdown(f"- {rec}")
+            # The results panel is outside this fragment, so it picks the submission up on a full rerun
+            if what_if_button:
+                st.session_state.pending_sensitivity = {
+                    "application_data": application_data,
+                    "axes": sensitivity.grid_axes(application_data, **what_if),
+                    "filter_expr": filter_expr,
+                    "top_similar": top_similar,
+                    "trace_id": trace_id
+                }
             else:
-                st.write(recommendations)
-            
-            # Risk Assessment Section
-            st.markdown("### Risk Assessment")
-            risks = analysis.get("RisksIdentified", "No risks identified.")
-
-            # Handle different formats of risks data
-            if isinstance(risks, dict):
-                # If it's a dictionary, convert to string representation
-                risk_text = json.dumps(risks, indent=2)
-                st.code(risk_text)
-            elif isinstance(risks, list):
-                # If it's a list, display as bullet points
-                for risk in risks:
-                    st.markdown(f"- {risk}")
-            else:
-                # Convert to string and then lowercase for comparison
-                risks_str = str(risks)
-                risks_lower = risks_str.lower()
-                if "no risk" in risks_lower or "no known risk" in risks_lower or "no potential risk" in risks_lower:
-                    st.success(risks_str)
-                else:
-                    st.warning(risks_str)
+                st.session_state.pending_submission = {
+                    "application_data": application_data,
+                    "skip_remote_when_confident": skip_remote_when_confident,
+                    "filter_expr": filter_expr,
+                    "top_similar": top_similar,
+                    "trace_id": trace_id
+                }
+            st.rerun()
+
+# Application title and description
+st.title("Investment License Analysis")
+
+# IMPROVEMENT 5: Better user experience with context and instructions
+with st.expander("About this application", expanded=False):
+    st.markdown("""
+    ## Investment License Analysis Tool
+    
+    This application helps evaluate investment license applications for potential approval. 
+    
+    ### How to use:
+    1. Fill out the application form with company and investment details
+    2. Use the "Get Data" button to pre-fill with sample data if needed
+    3. Review all fields for accuracy
+    4. Submit your application for analysis
+    5. View results and recommendations
+    
+    The analysis will evaluate your application based on multiple factors and provide recommendations.
+    """)
+
+st.markdown("Complete the application form below to analyze your investment license application.")
+
+# Initialize session state for application data
+if 'application_data' not in st.session_state:
+    st.session_state.application_data = None
+
+if 'analysis_result' not in st.session_state:
+    st.session_state.analysis_result = None
+
+# Outcome of the latest submission, redrawn by the results panel
+if 'submission' not in st.session_state:
+    st.session_state.submission = None
+
+if 'sensitivity' not in st.session_state:
+    st.session_state.sensitivity = None
+
+# Optional cProfile of the whole rerun, switched on in the Debug tab
+rerun_profiler = None
+if st.session_state.get("profile_reruns"):
+    import cProfile
+    
+    rerun_profiler = cProfile.Profile()
+    try:
+        rerun_profiler.enable()
+    except ValueError:
+        # Another profiler is already active in this thread
+        rerun_profiler = None
 
+try:
+    # Each tab body is a fragment of its own and reruns alone when its widgets change
+    application_tab, debug_tab, batch_tab, dashboard_tab = st.tabs(["Application", "Debug", "Batch", "Dashboard"])
+    with debug_tab:
+        render_debug_panel()
+    with batch_tab:
+        render_batch_panel()
+    with dashboard_tab:
+        render_dashboard()
+    # Filled last: a submission ends the run with st.rerun, and the widgets of
+    # panels not drawn yet would lose their state
+    with application_tab:
+        render_application_form()
     
+    # Results of the latest submission
+    render_results_panel()
+finally:
+    if rerun_profiler is not None:
+        rerun_profiler.disable()
+        st.session_state.rerun_profile = tracing.profile_report(rerun_profiler)
@@ -0,0 +1,90 @@
+import json
+import math
+import uuid
+from datetime import datetime
+
+import search_filter
+
+# Function to prepare application data from form input
+def prepare_application_data(form_data):
+    # Clean and prepare the data to match expected schema
+    application_data = {
+        "uuid": str(uuid.uuid4()),
+        **form_data,
+        "submissionDate": datetime.now().isoformat()
+    }
+    
+    # Ensure numeric values are floats
+    numeric_fields = [
+        "cashAmount", "contributionAmount", "totalCapitalAmount", 
+        "capitalExpenditure", "operatingExpense", "fixedAssets", 
+        "totalInvestmentValue", "shareValue", "valueOfEquityOrShares", 
+        "percentageOfEquityOrShares", "numberOfEquityOrShares"
+    ]
+    
+    for field in numeric_fields:
+        if field in application_data and application_data[field]:
+            try:
+                application_data[field] = float(application_data[field])
+            except (ValueError, TypeError):
+                application_data[field] = 0.0
+    
+    return application_data
+
+# Form values that mean "not filled in" for a particular field
+FIELD_DEFAULTS = {"preferredIncentive": "None"}
+
+
+def _compact(value, default=None):
+    if value is None or (default is not None and value == default):
+        return None
+    if isinstance(value, bool):
+        # Unticked checkboxes are the form default
+        return value or None
+    if isinstance(value, float):
+        if not math.isfinite(value) or value == 0:
+            return None
+        # 250000.0 -> 250000; long fractions from the CSV are cut to 4 decimals
+        return int(value) if value.is_integer() else round(value, 4)
+    if isinstance(value, int):
+        return value or None
+    if isinstance(value, str):
+        return value.strip() or None
+    if isinstance(value, dict):
+        compacted = {k: _compact(v, FIELD_DEFAULTS.get(k)) for k, v in value.items()}
+        return {k: v for k, v in compacted.items() if v is not None} or None
+    if isinstance(value, (list, tuple)):
+        compacted = [v for v in (_compact(v) for v in value) if v is not None]
+        return compacted or None
+    return value
+
+
+# Application data without nulls, empty strings, zeros, unticked checkboxes
+# and other form defaults, with numbers in their shortest form. The service
+# forwards the application to an LLM, so every dropped field saves prompt tokens.
+def compact_application_data(application_data):
+    return _compact(application_data) or {}
+
+
+# Request body for the /analyze-application endpoint. A malformed filter or
+# top_similar raises search_filter.FilterError, so it never reaches the service.
+def build_analysis_payload(application_data, filter_expr=None, top_similar=3, compact=True):
+    problems = search_filter.validate_top_similar(top_similar)
+    if filter_expr is not None:
+        problems += search_filter.validate_filter(filter_expr)
+    if problems:
+        raise search_filter.FilterError(" ".join(problems))
+    payload = {
+        "application_data": compact_application_data(application_data) if compact else application_data,
+        "filter_expr": filter_expr,
+        "top_similar": top_similar
+    }
+    if compact and filter_expr is None:
+        del payload["filter_expr"]
+    return payload
+
+
+# JSON bytes sent on the wire: no whitespace, non-ASCII names as UTF-8 rather
+# than \u escapes
+def encode_payload(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
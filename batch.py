@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+
+import api_client
+import financial_stats
+import prefill
+import rules
+import search_filter
+import tokens
+from application import build_analysis_payload, prepare_application_data
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Status codes worth another row-level attempt on top of the client's own retries
+ROW_RETRY_STATUS_CODES = (429,) + api_client.RETRY_STATUS_CODES
+
+# Rows in these states are not scored again when a batch is resumed
+FINISHED_STATUSES = ("ok", "rejected")
+
+
+# Token bucket shared by all workers; rate <= 0 disables limiting
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event=None):
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+# Read a CSV (export columns, see prefill.FIELD_SCHEMA) or JSONL (one form dict,
+# or {"application_data": {...}}, per line) into (row_id, form_data) pairs.
+# Row ids are positional so a re-run of the same file lines up with its checkpoint.
+def load_applications(source, fmt=None):
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    fmt = fmt or ("jsonl" if name.lower().endswith((".jsonl", ".ndjson")) else "csv")
+
+    if fmt == "csv":
+        frame = pd.read_csv(source)
+        frame = frame.dropna(how="all").reset_index(drop=True)
+        records = prefill.frame_to_records(frame, fill_missing=False)
+        return [(f"row-{i}", record) for i, record in enumerate(records)]
+
+    if isinstance(source, str):
+        with open(source, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    else:
+        content = source.read()
+        lines = (content.decode("utf-8") if isinstance(content, bytes) else content).splitlines()
+    rows = []
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        record = record.get("application_data", record)
+        # Fields set by prepare_application_data at submission time
+        record = {k: v for k, v in record.items() if k not in ("uuid", "submissionDate")}
+        rows.append((f"row-{i}", record))
+    return rows
+
+
+# Last result per row id from an existing results file
+def read_checkpoint(path):
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A torn last line from an interrupted run
+                continue
+            done[result.get("row_id")] = result
+    return done
+
+
+def score_row(client, row_id, form_data, limiter=None, row_retries=2, stop_event=None,
+              filter_expr=None, top_similar=3):
+    application_data = prepare_application_data(form_data)
+    payload = build_analysis_payload(application_data, filter_expr=filter_expr, top_similar=top_similar)
+    result = {
+        "row_id": row_id,
+        "uuid": application_data["uuid"],
+        "companyName": application_data.get("companyName"),
+    }
+
+    # Applications that cannot be valid are rejected locally, without a remote call
+    rejected = [message for rule, message in rules.DEFAULT_RULESET.check(application_data) if rule.severity == "reject"]
+    if rejected:
+        return {**result, "status": "rejected", "attempts": 0, "error": " ".join(rejected)}
+    # So are applications whose prompt would go over the token budget
+    try:
+        tokens.check_budget(tokens.estimate_prompt_tokens(payload))
+    except tokens.TokenBudgetExceeded as e:
+        return {**result, "status": "rejected", "attempts": 0, "error": str(e)}
+
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        if limiter is not None and not limiter.acquire(stop_event):
+            return {**result, "status": "cancelled", "attempts": attempt - 1}
+        status_code, error, delay = None, None, None
+        try:
+            response = client.analyze(payload, headers=JSON_HEADERS, cancel_event=stop_event)
+            status_code = response.status_code
+            if status_code == 200:
+                analysis = response.json()
+                return {
+                    **result,
+                    "status": "ok",
+                    "status_code": status_code,
+                    "attempts": attempt,
+                    "latency_ms": round((time.monotonic() - started) * 1000, 1),
+                    "decision": analysis.get("analysis_result", {}).get("Decision"),
+                    "response": analysis,
+                }
+            error = f"HTTP {status_code}: {response.text[:500]}"
+            retryable = status_code in ROW_RETRY_STATUS_CODES
+        except api_client.RequestCancelled:
+            return {**result, "status": "cancelled", "attempts": attempt}
+        except api_client.CircuitOpenError as e:
+            # Wait for the breaker's trial window instead of burning retries
+            error = f"{type(e).__name__}: {e}"
+            retryable = True
+            delay = client.breaker.retry_after()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            error = f"{type(e).__name__}: {e}"
+            retryable = True
+
+        if not retryable or attempt > row_retries or (stop_event is not None and stop_event.is_set()):
+            return {
+                **result,
+                "status": "error",
+                "status_code": status_code,
+                "attempts": attempt,
+                "latency_ms": round((time.monotonic() - started) * 1000, 1),
+                "error": error,
+            }
+        if delay is None:
+            delay = client.backoff_delay(attempt)
+        if stop_event is not None:
+            stop_event.wait(delay)
+        else:
+            time.sleep(delay)
+
+
+# Fields of every row whose amount is unusual for its sector and activity,
+# scored against the precomputed statistics in one vectorized pass
+def unusual_amounts(rows):
+    stats = financial_stats.get_stats()
+    if stats is None or not rows:
+        return {}
+    scores = stats.score_frame(pd.DataFrame([data for _, data in rows]))
+    z = scores[[f"{field}_z" for field in financial_stats.FIELDS]].abs().to_numpy()
+    flagged = z >= financial_stats.ANOMALY_Z
+    return {
+        row_id: [field for field, flag in zip(financial_stats.FIELDS, row) if flag]
+        for (row_id, _), row in zip(rows, flagged.tolist())
+    }
+
+
+# Score rows concurrently and yield each result as soon as it finishes. Every
+# result is appended to `results_path` as it arrives; with resume, rows that
+# already finished (scored or rejected by pre-screening) in that file are skipped.
+def run_batch(rows, client=None, concurrency=4, rate=0, row_retries=2, results_path=None,
+              resume=True, stop_event=None, filter_expr=None, top_similar=3):
+    client = client or api_client.get_client()
+    stop_event = stop_event or threading.Event()
+    limiter = RateLimiter(rate)
+
+    done = read_checkpoint(results_path) if resume else {}
+    pending = [(row_id, data) for row_id, data in rows if done.get(row_id, {}).get("status") not in FINISHED_STATUSES]
+    unusual = unusual_amounts(pending)
+
+    if results_path:
+        os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    out = open(results_path, "a" if resume else "w", encoding="utf-8") if results_path else None
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        futures = [
+            executor.submit(score_row, client, row_id, data, limiter, row_retries, stop_event,
+                            filter_expr, top_similar)
+            for row_id, data in pending
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            result["unusual_amounts"] = unusual.get(result["row_id"], [])
+            if out is not None:
+                out.write(json.dumps(result, default=str) + "\n")
+                out.flush()
+            yield result
+    finally:
+        # Also runs when the consumer stops early (Ctrl-C, a Streamlit rerun)
+        stop_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        if out is not None:
+            os.fsync(out.fileno())
+            out.close()
+
+
+# Compact per-row view for progress tables
+def summarize(result):
+    return {
+        "row": result.get("row_id"),
+        "company": result.get("companyName"),
+        "status": result.get("status"),
+        "decision": result.get("decision"),
+        "attempts": result.get("attempts"),
+        "latency_ms": result.get("latency_ms"),
+        "unusual": ", ".join(result.get("unusual_amounts") or ()),
+        "error": result.get("error"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV or JSONL file of applications against /analyze-application")
+    parser.add_argument("input", help="CSV (export columns) or JSONL (one application per line)")
+    parser.add_argument("--out", help="results JSONL, also the checkpoint for resuming (default: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="max requests per second, 0 for unlimited")
+    parser.add_argument("--retries", type=int, default=2, help="row-level retries on top of the client's own")
+    parser.add_argument("--restart", action="store_true", help="ignore and overwrite an existing results file")
+    parser.add_argument("--filter", help="OData filter narrowing the similar-application search, e.g. \"name_sector eq 'Oil & Gas'\"")
+    parser.add_argument("--top-similar", type=int, default=3, help="similar applications retrieved per analysis")
+    args = parser.parse_args(argv)
+    problems = search_filter.validate_top_similar(args.top_similar)
+    if args.filter is not None:
+        problems += search_filter.validate_filter(args.filter)
+    if problems:
+        parser.error(" ".join(problems))
+
+    results_path = args.out or os.path.splitext(args.input)[0] + ".results.jsonl"
+    rows = load_applications(args.input)
+    done = {} if args.restart else read_checkpoint(results_path)
+    skipped = sum(1 for row_id, _ in rows if done.get(row_id, {}).get("status") in FINISHED_STATUSES)
+    client = api_client.AnalysisClient(pool_size=args.concurrency)
+    print(f"{len(rows)} applications, {skipped} already scored, writing to {results_path}", file=sys.stderr)
+
+    counts = {}
+    started = time.monotonic()
+    try:
+        for i, result in enumerate(run_batch(rows, client=client, concurrency=args.concurrency,
+                                             rate=args.rate, row_retries=args.retries,
+                                             results_path=results_path, resume=not args.restart,
+                                             filter_expr=args.filter, top_similar=args.top_similar), 1):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            detail = result.get("decision") or result.get("error") or ""
+            print(f"[{i}/{len(rows) - skipped}] {result['row_id']} {result['status']} {detail}", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrupted; re-run the same command to resume.", file=sys.stderr)
+    elapsed = time.monotonic() - started
+    print(json.dumps({"elapsed_s": round(elapsed, 2), **counts}))
+    return 0 if not counts.get("error") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Recall and latency of the IVF index against exact search.
+
+    python -m benchmarks.bench_ann --rows 200000 --queries 200 -k 10
+
+The corpus is grown from kdipa_arf.csv encoded by SimilarityEngine: each
+synthetic application is a random blend of two real ones plus a little
+Gaussian noise, so neighbourhoods are realistic rather than exact copies.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+from similarity import SimilarityEngine
+
+
+def synthetic_vectors(csv_path, rows, noise, seed=0):
+    base = SimilarityEngine.from_csv(csv_path).matrix
+    rng = np.random.default_rng(seed)
+    weights = rng.uniform(0, 1, (rows, 1)).astype(np.float32)
+    vectors = weights * base[rng.integers(0, len(base), rows)] + (1 - weights) * base[rng.integers(0, len(base), rows)]
+    vectors = vectors + rng.normal(0, noise, vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def exact_search(vectors, query, k):
+    scores = vectors @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def percentiles(timings):
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return f"p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default="kdipa_arf.csv")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.005)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.csv, args.rows, args.noise)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + rng.normal(0, args.noise, queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    print(f"corpus: {vectors.shape[0]} x {vectors.shape[1]}")
+
+    truth, timings = [], []
+    for query in queries:
+        started = time.perf_counter()
+        truth.append(set(exact_search(vectors, query, args.k)))
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"exact:            {percentiles(timings)}")
+
+    started = time.perf_counter()
+    index = IVFIndex.build(vectors)
+    print(f"build: nlist={index.nlist} in {time.perf_counter() - started:.2f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        index.save(directory)
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        index = IVFIndex.load(directory, mmap=True)
+        loaded = time.perf_counter() - started
+        size_mb = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)) / 1e6
+        print(f"save: {saved:.2f}s, mmap load: {loaded * 1000:.1f}ms, on disk: {size_mb:.1f}MB")
+
+        for nprobe in args.nprobe:
+            hits, timings = 0, []
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                ids, _ = index.search(query, k=args.k, nprobe=nprobe)
+                timings.append((time.perf_counter() - started) * 1000)
+                hits += len(expected.intersection(ids.tolist()))
+            recall = hits / (len(queries) * args.k)
+            print(f"ivf nprobe={nprobe:<3} recall@{args.k}={recall:.3f} {percentiles(timings)}")
+
+        inserts = vectors[:1000]
+        started = time.perf_counter()
+        for i, vector in enumerate(inserts):
+            index.add(vector, [len(vectors) + i])
+        elapsed = time.perf_counter() - started
+        print(f"insert: {len(inserts) / elapsed:.0f} vectors/s "
+              f"(search with {len(inserts)} pending: "
+              f"{percentiles([_timed(index.search, q, args.k) for q in queries])})")
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    main()
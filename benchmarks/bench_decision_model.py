@@ -0,0 +1,66 @@
+"""Training and inference cost of the local decision model on a corpus tiled from kdipa_arf.csv.
+
+    python -m benchmarks.bench_decision_model --rows 100000 --queries 2000
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+import dataset
+from decision_model import DecisionModel, outcome_labels, train
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default="kdipa_arf.csv")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    model = train(args.csv)
+    meta = model.metadata
+    print(f"real data: {meta['trained_rows']} labelled rows, trained in {meta['train_seconds'] * 1000:.1f}ms, "
+          f"cv accuracy={meta['cv_accuracy']} auc={meta['cv_auc']}")
+
+    # Tile the labelled rows and jitter the amounts so the solver has real work to do
+    frame = dataset.load_dataset(args.csv)
+    labels = outcome_labels(frame)
+    labelled = frame[labels.notna()].reset_index(drop=True)
+    reps = max(1, -(-args.rows // len(labelled)))
+    rng = np.random.default_rng(0)
+    big = labelled.loc[np.tile(np.arange(len(labelled)), reps)[:args.rows]].reset_index(drop=True)
+    y = np.tile(labels[labels.notna()].to_numpy(dtype=np.float64), reps)[:args.rows]
+    for col in ("cashAmount", "totalCapitalAmount", "totalInvestmentValue"):
+        big[col] = big[col] * rng.lognormal(0, 0.3, len(big))
+
+    started = time.perf_counter()
+    model = DecisionModel.fit(big, y)
+    print(f"fit: {len(big)} rows x {len(model.feature_names)} features in {time.perf_counter() - started:.3f}s")
+
+    started = time.perf_counter()
+    model.predict_proba(big)
+    elapsed = time.perf_counter() - started
+    print(f"batch predict: {len(big)} rows in {elapsed * 1000:.1f}ms ({elapsed / len(big) * 1e6:.2f}us/row)")
+
+    records = big.sample(args.queries, replace=True, random_state=0).to_dict("records")
+    timings = []
+    for record in records:
+        started = time.perf_counter()
+        model.predict(record)
+        timings.append((time.perf_counter() - started) * 1e6)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f"single predict: p50={p50:.1f}us p95={p95:.1f}us p99={p99:.1f}us over {len(timings)} queries")
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        model.save(directory)
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        DecisionModel.load(directory)
+        print(f"save: {saved * 1000:.1f}ms load: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
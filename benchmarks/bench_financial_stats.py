@@ -0,0 +1,73 @@
+"""Scoring cost of the precomputed financial statistics against a groupby per request.
+
+    python -m benchmarks.bench_financial_stats --rows 100000
+
+Rows are sampled from the export with replacement. The baseline computes the
+median and MAD of the reference group from the raw export for every row, as a
+per-request implementation without precomputed statistics would.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+from financial_stats import FIELDS, FinancialStats
+
+
+def baseline_score(frame, record):
+    group = frame[frame["name_sector"] == record.get("name_sector")] if pd.notna(record.get("name_sector")) else frame
+    scores = {}
+    for field in FIELDS:
+        values = pd.to_numeric(group[field], errors="coerce")
+        values = np.log1p(values[values > 0])
+        value = record.get(field)
+        if len(values) and pd.notna(value) and value > 0:
+            median = values.median()
+            mad = max((values - median).abs().median(), 1e-9)
+            scores[field] = (np.log1p(value) - median) / (1.4826 * mad)
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default="kdipa_arf.csv")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--baseline-rows", type=int, default=500, help="rows also scored by the per-request baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    frame = dataset.load_dataset(args.csv).drop_duplicates(subset="uuid")
+    started = time.perf_counter()
+    stats = FinancialStats.from_frame(frame)
+    print(f"build: {len(stats)} groups from {len(frame)} applications in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    batch = frame.sample(args.rows, replace=True, random_state=args.seed).reset_index(drop=True)
+    started = time.perf_counter()
+    scores = stats.score_frame(batch)
+    elapsed = time.perf_counter() - started
+    print(f"vectorized: {len(scores)} rows in {elapsed:.3f}s ({elapsed / len(scores) * 1e6:.2f}us/row)")
+
+    records = batch.head(args.baseline_rows).to_dict("records")
+    started = time.perf_counter()
+    for record in records:
+        stats.score_application(record)
+    elapsed = time.perf_counter() - started
+    print(f"single application: {elapsed / len(records) * 1000:.2f}ms/row")
+
+    started = time.perf_counter()
+    for record in records:
+        baseline_score(frame, record)
+    elapsed = time.perf_counter() - started
+    print(f"groupby per request: {elapsed / len(records) * 1000:.2f}ms/row, "
+          f"{elapsed / len(records) * args.rows:.1f}s extrapolated to {args.rows} rows")
+
+    started = time.perf_counter()
+    for record in records[:100]:
+        stats.add_application(record)
+    print(f"incremental add: {(time.perf_counter() - started) / 100 * 1000:.2f}ms/application")
+
+
+if __name__ == "__main__":
+    main()
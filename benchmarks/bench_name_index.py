@@ -0,0 +1,90 @@
+"""Build and lookup cost of the MinHash-LSH applicant name index against a linear fuzzy scan.
+
+    python -m benchmarks.bench_name_index --names 200000 --queries 1000
+
+The corpus is the export's applicant names plus synthetic variants (typos,
+transliteration and legal-form changes) until --names distinct names exist.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+import dataset
+from name_index import NAME_COLUMNS, NameIndex
+
+SUFFIXES = ["", " Co.", " W.L.L", " General Trading", " Holding", " LLC", " Est."]
+PREFIXES = ["", "Al ", "El-", "Al-"]
+
+
+def mutate(name, rng):
+    chars = list(name)
+    for _ in range(rng.randint(0, 2)):
+        if len(chars) < 4:
+            break
+        i = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.4:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        elif op < 0.7:
+            del chars[i]
+        else:
+            chars.insert(i, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return rng.choice(PREFIXES) + "".join(chars).strip() + rng.choice(SUFFIXES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default="kdipa_arf.csv")
+    parser.add_argument("--names", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scan-queries", type=int, default=50, help="queries also answered by the linear scan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    frame = dataset.load_dataset(args.csv)
+    seeds = sorted({value.strip() for column in NAME_COLUMNS if column in frame.columns
+                    for value in frame[column].dropna().astype(str) if len(value.strip()) > 3})
+
+    index = NameIndex()
+    started = time.perf_counter()
+    for i, name in enumerate(seeds):
+        index.add(name, f"csv-{i}", "companyName")
+    attempts = 0
+    while len(index) < args.names and attempts < args.names * 3:
+        # Words from two real names, then perturbed, so buckets fill like a real corpus would
+        words = (rng.choice(seeds) + " " + rng.choice(seeds)).split()
+        index.add(mutate(" ".join(rng.sample(words, min(len(words), rng.randint(2, 4)))), rng), f"gen-{attempts}")
+        attempts += 1
+    elapsed = time.perf_counter() - started
+    print(f"build: {len(index)} distinct names in {elapsed:.2f}s ({elapsed / len(index) * 1e6:.1f}us/name)")
+
+    queries = [mutate(rng.choice(seeds), rng) for _ in range(args.queries)]
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.query(query, k=5)
+        timings.append((time.perf_counter() - started) * 1e6)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f"lsh query: p50={p50:.0f}us p95={p95:.0f}us p99={p99:.0f}us over {len(timings)} queries")
+
+    # Same queries against every name, for speed and for how often LSH finds the true best match
+    found = 0
+    scanned = 0
+    scan_timings = []
+    for query in queries[:args.scan_queries]:
+        started = time.perf_counter()
+        exact = index.query_exact(query, k=1)
+        scan_timings.append((time.perf_counter() - started) * 1000)
+        if exact:
+            scanned += 1
+            found += any(match["normalized"] == exact[0][0] for match in index.query(query, k=5))
+    print(f"linear scan: p50={np.median(scan_timings):.1f}ms over {len(scan_timings)} queries")
+    if scanned:
+        print(f"recall: lsh top-5 contains the scan's best match (>= 0.5 jaccard) for {found}/{scanned} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Cold import time of app.py's dependencies and per-rerun latency of the Streamlit script.
+
+    python -m benchmarks.bench_rerun --reruns 30 --budget-ms 150
+
+Also times each st.fragment body during the reruns: an interaction with a widget
+inside a fragment reruns only that fragment, so its time is what the interaction
+costs instead of a full rerun. Exits non-zero when the median rerun exceeds
+--budget-ms (or the imports exceed --import-budget-ms), so it can guard against
+regressions in CI.
+"""
+import argparse
+import ast
+import functools
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+# Modules app.py imports at the top level, i.e. paid before the first render
+def top_level_imports(path=APP_PATH):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+# Import them in a fresh interpreter, as a new server process would
+def cold_import_seconds(modules, cwd):
+    code = (
+        "import time; started = time.perf_counter()\n"
+        + "".join(f"import {module}\n" for module in modules)
+        + "print(time.perf_counter() - started)"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+# Record when each run reaches st.set_page_config (the first Streamlit call of
+# the script, so AppTest's own per-run setup is left out) and how long every
+# st.fragment body takes, under the fragment's function name
+def instrument_script():
+    import streamlit as st
+
+    script_starts = []
+    fragment_timings = defaultdict(list)
+    set_page_config = st.set_page_config
+    fragment = st.fragment
+
+    def timed_set_page_config(*args, **kwargs):
+        script_starts.append(time.perf_counter())
+        return set_page_config(*args, **kwargs)
+
+    def timed_fragment(func=None, **kwargs):
+        if func is None:
+            return lambda f: timed_fragment(f, **kwargs)
+
+        @functools.wraps(func)
+        def timed(*args, **kw):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kw)
+            finally:
+                fragment_timings[func.__name__].append((time.perf_counter() - started) * 1000)
+        return fragment(timed, **kwargs)
+
+    st.set_page_config = timed_set_page_config
+    st.fragment = timed_fragment
+    return script_starts, fragment_timings
+
+
+# A submitted application with its analysis, as the results panel finds it in session state
+SAMPLE_SUBMISSION = {
+    "application_data": {},
+    "screening": [],
+    "local_similar": [
+        {"UUID": f"sample-{i}", "Description": "Sample application", "PercentageMatching": 90 - i, "Status": "ACCEPTED"}
+        for i in range(3)
+    ],
+    "prior": None,
+    "analysis_result": {"analysis_result": {
+        "Decision": "ACCEPTED",
+        "DecisionExplanation": "Sample explanation.",
+        "Recommendations": ["First recommendation", "Second recommendation"],
+        "RisksIdentified": "No risks identified.",
+    }},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=30)
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="max median rerun time")
+    parser.add_argument("--import-budget-ms", type=float, default=None, help="max cold import time")
+    args = parser.parse_args()
+
+    from streamlit.testing.v1 import AppTest
+
+    app_dir = os.path.dirname(APP_PATH)
+    modules = top_level_imports()
+    imports = cold_import_seconds(modules, app_dir) * 1000
+    print(f"cold imports: {imports:.0f}ms for {', '.join(modules)}")
+
+    os.chdir(app_dir)
+    script_starts, fragment_timings = instrument_script()
+    started = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    print(f"first run: {(time.perf_counter() - started) * 1000:.0f}ms")
+    # Fill the form from the CSV so reruns render realistic widget state
+    next(button for button in at.button if button.label == "Get Data").click().run()
+    # and show a submission so the results panel has something to redraw
+    at.session_state["submission"] = SAMPLE_SUBMISSION
+    fragment_timings.clear()
+
+    timings = []
+    script_timings = []
+    for _ in range(args.reruns):
+        started = time.perf_counter()
+        at.run()
+        finished = time.perf_counter()
+        timings.append((finished - started) * 1000)
+        script_timings.append((finished - script_starts[-1]) * 1000)
+    if at.exception:
+        print(f"script raised: {at.exception[0].value}")
+        return 1
+    p50, p95 = np.percentile(timings, [50, 95])
+    print(f"rerun: p50={p50:.1f}ms p95={p95:.1f}ms over {len(timings)} reruns (budget {args.budget_ms:.0f}ms)")
+
+    # What an interaction costs: the whole script, or only the fragment holding the widget
+    full = float(np.median(script_timings))
+    print(f"full rerun script time: {full:.1f}ms")
+    # A fragment's time includes the fragments nested in it
+    for name, runs in sorted(fragment_timings.items(), key=lambda item: -np.median(item[1])):
+        cost = float(np.median(runs))
+        print(f"  {name}: {cost:.1f}ms per rerun, {1 - cost / full:.0%} less than a full rerun")
+
+    failed = p50 > args.budget_ms
+    if args.import_budget_ms is not None and imports > args.import_budget_ms:
+        print(f"cold imports over budget ({args.import_budget_ms:.0f}ms)")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""Query latency of the local similarity engine on a corpus tiled from kdipa_arf.csv.
+
+    python -m benchmarks.bench_similarity --rows 50000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from similarity import SimilarityEngine
+
+
+def tiled_corpus(path, rows):
+    df = pd.read_csv(path).dropna(how="all")
+    reps = max(1, -(-rows // len(df)))
+    big = pd.concat([df] * reps, ignore_index=True).iloc[:rows].copy()
+    big["uuid"] = np.arange(len(big)).astype(str)
+    return big
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default="kdipa_arf.csv")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = tiled_corpus(args.csv, args.rows)
+    started = time.perf_counter()
+    engine = SimilarityEngine(corpus)
+    print(f"build: {len(engine)} rows x {engine.dimension} dims in {time.perf_counter() - started:.2f}s")
+
+    queries = corpus.sample(args.queries, replace=True, random_state=0).to_dict("records")
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        engine.query(query, k=args.k)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f"query: p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms over {len(timings)} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+import math
+import os
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+import api_client
+import dataset
+import explorer
+import financial_stats
+import name_index
+import prefill
+import rules
+import search_filter
+import submission_log
+import tokens
+from application import build_analysis_payload, encode_payload, prepare_application_data
+
+# Data work behind the form: the export, prefill, filter choices, validation,
+# payload preparation, token estimates and the indexes built over the export.
+# LocalCompute does it in the calling process; RemoteCompute asks a
+# compute_service.py worker over keep-alive connections, so the state is built
+# once per worker instead of once per Streamlit process, and falls back to
+# LocalCompute while the service is unreachable. Both return the same values.
+# With a submission log, the indexes take new submissions from the log alone,
+# so every worker and process sharing it answers from the same submissions.
+COMPUTE_URL_ENV = "KDIPA_COMPUTE_URL"
+
+# Saved ANN index location and the corpus size from which it replaces brute force
+ANN_INDEX_DIR = os.environ.get("KDIPA_ANN_INDEX_DIR", ".ann_index")
+ANN_MIN_ROWS = int(os.environ.get("KDIPA_ANN_MIN_ROWS", "20000"))
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Plain JSON values for a response: NaN/NA become null, numpy scalars Python
+# numbers, timestamps and dates ISO strings
+def jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return [jsonable(v) for v in value.tolist()]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if value is None or isinstance(value, (str, int, bool)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+
+def frame_records(frame):
+    return jsonable(frame.to_dict("records"))
+
+
+# In-process data work. Everything is built on first use and shared by all
+# callers (Streamlit sessions, or the requests of one service worker).
+class LocalCompute:
+    def __init__(self, csv_path=dataset.CSV_PATH):
+        self.csv_path = csv_path
+        self.error = None
+        self._state = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # (application_data, rejected) of the submissions read from the log so
+        # far, shared by the indexes built from it, with the log generation and
+        # offset they were read up to and how many of them each index has seen
+        self._logged = []
+        self._log_position = (None, 0)
+        self._log_seen = {}
+        self._log_lock = threading.Lock()
+
+    # Build `name` once; concurrent callers wait for the first build
+    def _resource(self, name, build):
+        if name in self._state:
+            return self._state[name]
+        with self._locks_lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._state:
+                self._state[name] = build()
+            return self._state[name]
+
+    # Typed, pruned export served from the Arrow cache; empty when it cannot be read
+    def dataset(self):
+        def load():
+            try:
+                return dataset.load_dataset(self.csv_path)
+            except Exception as e:
+                self.error = f"Error loading CSV file: {str(e)}"
+                return pd.DataFrame()
+        return self._resource("dataset", load)
+
+    # Read the submissions logged since the last call; only the new lines of
+    # the log are read
+    def _read_log(self):
+        log = submission_log.get_log()
+        with self._log_lock:
+            if log is None:
+                return
+            generation, offset = self._log_position
+            current = log.generation()
+            if current != generation and offset:
+                # Compacted: read it again from the start, into indexes that
+                # skip the applications they already hold
+                self._logged, self._log_seen, offset = [], {}, 0
+            for end, record in log.entries(offset, generation=current):
+                offset = end
+                if isinstance(record.get("application_data"), dict):
+                    rejected = any(severity == "reject" for severity, _ in record.get("screening") or ())
+                    self._logged.append((record["application_data"], rejected))
+            self._log_position = (current, offset)
+
+    # The logged submissions the index `name` has not seen yet
+    def _unseen(self, name):
+        self._read_log()
+        with self._log_lock:
+            start = self._log_seen.get(name, 0)
+            self._log_seen[name] = len(self._logged)
+            return self._logged[start:]
+
+    # Add the submissions logged since the index `name` last looked; those
+    # rejected by pre-screening are only checked for duplicate names
+    def _add_logged(self, name, index):
+        for application_data, rejected in self._unseen(name):
+            if name == "name_index" or not rejected:
+                index.add_application(application_data)
+        return index
+
+    # Similarity engine over the export, brought up to date with the log. The
+    # saved ANN index holds the export only, so submissions are searchable
+    # again after a restart.
+    def similarity_engine(self):
+        def build():
+            df = self.dataset()
+            if df.empty:
+                return None
+            import similarity
+
+            engine = similarity.SimilarityEngine(df)
+            engine.use_persistent_index(ANN_INDEX_DIR, min_rows=ANN_MIN_ROWS)
+            return engine
+        engine = self._resource("similarity", build)
+        return self._add_logged("similarity", engine) if engine is not None else None
+
+    # Near-duplicate applicant names over the export and the submission log
+    def name_index(self):
+        def build():
+            index = name_index.NameIndex()
+            df = self.dataset()
+            if not df.empty:
+                index.add_frame(df)
+            return index
+        return self._add_logged("name_index", self._resource("name_index", build))
+
+    def explorer(self):
+        return self._resource("explorer", lambda: explorer.FrameExplorer(self.dataset()))
+
+    # Everything a first request would otherwise wait for
+    def warm(self):
+        self.dataset()
+        self.filter_options()
+        self.name_index()
+        self.similarity_engine()
+        financial_stats.get_stats()
+        tokens.get_encoding(wait=True)
+
+    def health(self):
+        return {"status": "ok" if self.error is None else "degraded", "applications": len(self.dataset()),
+                "error": self.error}
+
+    # Choices of the similar-application filter builder
+    def filter_options(self):
+        return self._resource("filter_options", lambda: search_filter.filter_options(self.dataset()))
+
+    # `n` form prefills sampled from the export, with the original rows
+    def prefill(self, n=1):
+        return prefill.sample_prefill_records(self.dataset(), n, include_original=True)
+
+    def prepare(self, form_data):
+        return prepare_application_data(form_data)
+
+    # The application as it would be submitted, and its prompt size
+    def preview(self, form_data, filter_expr=None, top_similar=3):
+        application_data = prepare_application_data(form_data)
+        payload = build_analysis_payload(application_data, filter_expr=filter_expr, top_similar=top_similar)
+        return {"application_data": application_data, "estimate": tokens.estimate_prompt_tokens(payload)}
+
+    # Prompt size of a request body built by build_analysis_payload
+    def estimate(self, payload):
+        return tokens.estimate_prompt_tokens(payload)
+
+    # Pre-screening as (severity, message) pairs; includes the form validation
+    def screen(self, application_data):
+        return [(rule.severity, message) for rule, message in rules.DEFAULT_RULESET.check(application_data)]
+
+    # Scores against the export and the submissions logged so far
+    def financial_profile(self, application_data):
+        stats = financial_stats.get_stats()
+        if stats is None:
+            return []
+        financial_stats.catch_up(stats)
+        return stats.score_application(application_data)
+
+    def duplicates(self, name, k=5):
+        return self.name_index().query(name, k=k)
+
+    # Similar historical applications; None when there is nothing to search
+    def similar(self, application_data, k=3, filter_expr=None):
+        engine = self.similarity_engine()
+        if engine is None:
+            return None
+        similar = engine.query(application_data, k=k, filter_expr=filter_expr)
+        # New submissions become part of the corpus for later searches; a
+        # logged one is added from the log
+        if submission_log.get_log() is None:
+            engine.add_application(application_data)
+        return similar or None
+
+    # A submitted application: later duplicate checks include it. With a
+    # submission log the caller logged it already, and every worker picks it
+    # up from there, as do financial comparisons once it passed pre-screening.
+    def register(self, application_data, rejected=False):
+        index = self.name_index()
+        if submission_log.get_log() is None:
+            index.add_application(application_data)
+
+    # Pre-screening audit of the export, computed once
+    def rule_audit(self):
+        def build():
+            df = self.dataset()
+            return rules.DEFAULT_RULESET.audit(df) if not df.empty else None
+        return self._resource("rule_audit", build)
+
+    # Shape of the export and the filter choices of the Debug tab explorer
+    def explorer_info(self):
+        def build():
+            frame_explorer = self.explorer()
+            return {
+                "rows": len(frame_explorer),
+                "columns": frame_explorer.columns,
+                "index_columns": frame_explorer.index_columns,
+                "options": {column: [(value, frame_explorer.count(column, value)) for value in frame_explorer.options(column)]
+                            for column in frame_explorer.index_columns},
+            }
+        return self._resource("explorer_info", build)
+
+    # One filtered, sorted page of the export and the number of matching rows
+    def explorer_page(self, filters=None, search=None, columns=None, sort_by=None, ascending=True, page=1, page_size=50):
+        return self.explorer().page(filters=filters, search=search, columns=columns, sort_by=sort_by,
+                                    ascending=ascending, page=page, page_size=page_size)
+
+
+class ComputeError(Exception):
+    pass
+
+
+# Client of compute_service.py. Any failed request (connection, 5xx, a
+# response that cannot be read) opens a circuit breaker, and read-only calls
+# are answered in process until it lets a trial request through again. Calls
+# that update the service's indexes (register, similar) raise ComputeError
+# instead: an index in this process would hold submissions the service never
+# sees. 4xx responses are raised as ValueError, like the local validation
+# errors they stand for.
+class RemoteCompute:
+    def __init__(self, base_url, timeout=None, pool_size=None, retry_after=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout if timeout is not None else _env_float("KDIPA_COMPUTE_TIMEOUT", 30.0)
+        self.pool = api_client.SessionPool(pool_size if pool_size is not None else _env_int("KDIPA_COMPUTE_POOL_SIZE", 8))
+        self.breaker = api_client.CircuitBreaker(
+            failure_threshold=1,
+            reset_timeout=retry_after if retry_after is not None else _env_float("KDIPA_COMPUTE_RETRY_AFTER", 30.0)
+        )
+        self.fallback = LocalCompute()
+
+    @property
+    def error(self):
+        return self.fallback.error
+
+    @property
+    def remote(self):
+        return self.breaker.state != api_client.CircuitBreaker.OPEN
+
+    # Call `path` on the service, or `name` on the in-process fallback; without
+    # `fallback`, ComputeError when the service cannot answer
+    def _call(self, name, path, body=None, decode=None, fallback=True, **kwargs):
+        if self.breaker.allow_request():
+            # Every way out settles the breaker, or a half-open trial would
+            # keep the service bypassed for good
+            try:
+                with self.pool.session() as session:
+                    if body is None:
+                        response = session.get(self.base_url + path, timeout=self.timeout)
+                    else:
+                        response = session.post(self.base_url + path, data=encode_payload(body),
+                                                headers={"Content-Type": "application/json"}, timeout=self.timeout)
+                if response.status_code >= 500:
+                    raise ComputeError(f"HTTP {response.status_code} from {path}")
+                result = response.json() if response.status_code < 400 else None
+            except (requests.exceptions.RequestException, ComputeError, ValueError):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                if response.status_code >= 400:
+                    try:
+                        detail = response.json().get("detail")
+                    except (ValueError, AttributeError):
+                        detail = response.text
+                    raise ValueError(detail or f"HTTP {response.status_code}")
+                return decode(result) if decode is not None else result
+        if not fallback:
+            raise ComputeError(f"Compute service unavailable for {path}")
+        return getattr(self.fallback, name)(**(body or {}), **kwargs)
+
+    def health(self):
+        return self._call("health", "/health")
+
+    def filter_options(self):
+        def decode(options):
+            if options.get("date_range"):
+                options["date_range"] = tuple(date.fromisoformat(value) for value in options["date_range"])
+            return options
+        return self._call("filter_options", "/filter-options", decode=decode)
+
+    def prefill(self, n=1):
+        return self._call("prefill", "/prefill", {"n": n})
+
+    def prepare(self, form_data):
+        return self._call("prepare", "/prepare", {"form_data": form_data})
+
+    def preview(self, form_data, filter_expr=None, top_similar=3):
+        return self._call("preview", "/preview", {"form_data": form_data, "filter_expr": filter_expr, "top_similar": top_similar})
+
+    def estimate(self, payload):
+        return self._call("estimate", "/estimate", {"payload": payload})
+
+    def screen(self, application_data):
+        return self._call("screen", "/screen", {"application_data": application_data},
+                          decode=lambda screening: [tuple(item) for item in screening])
+
+    def financial_profile(self, application_data):
+        return self._call("financial_profile", "/financial-profile", {"application_data": application_data})
+
+    def duplicates(self, name, k=5):
+        return self._call("duplicates", "/duplicates", {"name": name, "k": k})
+
+    def similar(self, application_data, k=3, filter_expr=None):
+        return self._call("similar", "/similar", {"application_data": application_data, "k": k, "filter_expr": filter_expr},
+                          fallback=False)
+
+    # With a submission log the service catches up from it once it is back
+    def register(self, application_data, rejected=False):
+        self._call("register", "/register", {"application_data": application_data, "rejected": rejected}, fallback=False)
+
+    def rule_audit(self):
+        return self._call("rule_audit", "/rule-audit",
+                          decode=lambda records: pd.DataFrame(records) if records is not None else None)
+
+    def explorer_info(self):
+        return self._call("explorer_info", "/explorer")
+
+    def explorer_page(self, filters=None, search=None, columns=None, sort_by=None, ascending=True, page=1, page_size=50):
+        return self._call("explorer_page", "/explorer/page", {
+            "filters": filters, "search": search, "columns": columns, "sort_by": sort_by,
+            "ascending": ascending, "page": page, "page_size": page_size,
+        }, decode=lambda result: (pd.DataFrame(result["rows"], columns=result["columns"]), result["total"]))
+
+    def close(self):
+        self.pool.close()
+
+
+_compute = None
+_compute_lock = threading.Lock()
+
+
+# Process-wide compute backend: RemoteCompute when KDIPA_COMPUTE_URL is set,
+# otherwise everything runs in this process
+def get_compute():
+    global _compute
+    with _compute_lock:
+        if _compute is None:
+            url = os.environ.get(COMPUTE_URL_ENV)
+            _compute = RemoteCompute(url) if url else LocalCompute()
+        return _compute
@@ -0,0 +1,148 @@
+import argparse
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+import compute
+
+# Local compute tier behind the Streamlit UI. Each worker loads the export and
+# builds the filter choices, name and similarity indexes, financial statistics
+# and tokenizer once at startup; Streamlit processes reach it with
+# KDIPA_COMPUTE_URL and keep their sessions thin:
+#   python compute_service.py --port 8100 --workers 4
+#   gunicorn compute_service:app -k uvicorn.workers.UvicornWorker -w 4 -b 127.0.0.1:8100
+#   KDIPA_COMPUTE_URL=http://127.0.0.1:8100 streamlit run app.py
+# Workers learn about new submissions from the submission log they share with
+# the app (KDIPA_SUBMISSION_LOG), catching up before they answer. Without a log
+# each worker only knows what it registered itself, so run a single worker.
+# Endpoints are plain `def`s, so the CPU work runs on the worker's thread pool.
+service = compute.LocalCompute()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # A worker only accepts requests once its state is built
+    if os.environ.get("KDIPA_COMPUTE_WARM", "1") != "0":
+        service.warm()
+    yield
+
+
+app = FastAPI(title="KDIPA compute service", lifespan=lifespan)
+
+
+# Invalid filters, malformed amounts and the like are the caller's mistake
+@app.exception_handler(ValueError)
+async def invalid_request(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=400)
+
+
+@app.get("/health")
+def health():
+    return {**service.health(), "pid": os.getpid()}
+
+
+@app.get("/filter-options")
+def filter_options():
+    return compute.jsonable(service.filter_options())
+
+
+@app.post("/prefill")
+def prefill(body: dict):
+    return compute.jsonable(service.prefill(int(body.get("n") or 1)))
+
+
+@app.post("/prepare")
+def prepare(body: dict):
+    return compute.jsonable(service.prepare(body["form_data"]))
+
+
+@app.post("/preview")
+def preview(body: dict):
+    return compute.jsonable(service.preview(body["form_data"], filter_expr=body.get("filter_expr"),
+                                            top_similar=body.get("top_similar") or 3))
+
+
+@app.post("/estimate")
+def estimate(body: dict):
+    return compute.jsonable(service.estimate(body["payload"]))
+
+
+@app.post("/screen")
+def screen(body: dict):
+    return compute.jsonable(service.screen(body["application_data"]))
+
+
+@app.post("/financial-profile")
+def financial_profile(body: dict):
+    return compute.jsonable(service.financial_profile(body["application_data"]))
+
+
+@app.post("/duplicates")
+def duplicates(body: dict):
+    return compute.jsonable(service.duplicates(body["name"], k=int(body.get("k") or 5)))
+
+
+@app.post("/similar")
+def similar(body: dict):
+    return compute.jsonable(service.similar(body["application_data"], k=int(body.get("k") or 3),
+                                            filter_expr=body.get("filter_expr")))
+
+
+@app.post("/register")
+def register(body: dict):
+    service.register(body["application_data"], rejected=bool(body.get("rejected")))
+    return {"registered": True}
+
+
+@app.get("/rule-audit")
+def rule_audit():
+    audit = service.rule_audit()
+    return compute.frame_records(audit) if audit is not None else None
+
+
+@app.get("/explorer")
+def explorer_info():
+    return compute.jsonable(service.explorer_info())
+
+
+@app.post("/explorer/page")
+def explorer_page(body: dict):
+    frame, total = service.explorer_page(
+        filters=body.get("filters"), search=body.get("search"), columns=body.get("columns"),
+        sort_by=body.get("sort_by"), ascending=body.get("ascending", True),
+        page=int(body.get("page") or 1), page_size=int(body.get("page_size") or 50)
+    )
+    return {"rows": compute.frame_records(frame), "columns": list(frame.columns), "total": total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local compute service behind the Streamlit UI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    import socket
+
+    import uvicorn
+    from uvicorn.supervisors import Multiprocess
+
+    config = uvicorn.Config("compute_service:app", host=args.host, port=args.port, workers=args.workers,
+                            timeout_keep_alive=75)
+    # Responses go out as a headers write and a body write. The socket uvicorn
+    # binds for its workers does not get TCP_NODELAY, so on a keep-alive
+    # connection the body waited for the client's delayed ACK (~40 ms per
+    # request); accepted connections inherit the option from the listener.
+    sock = config.bind_socket()
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server = uvicorn.Server(config)
+    if config.workers > 1:
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run(sockets=[sock])
+
+
+if __name__ == "__main__":
+    main()
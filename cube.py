@@ -0,0 +1,367 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+
+import pandas as pd
+
+import dataset
+import submission_log
+from decision_model import OUTCOME_LABELS
+
+DEFAULT_PATH = os.path.join(".cube", "portfolio.json")
+FORMAT_VERSION = 2
+# Log lines counted since the last save after which the cube is saved again
+SAVE_EVERY = int(os.environ.get("KDIPA_CUBE_SAVE_EVERY", 64))
+
+# Dimensions of the cube; "month" is the YYYY-MM of submissionDate (UTC)
+DIMENSIONS = ["name_sector", "shareholderNationality", "companyOrigin", "licenseType", "month"]
+# Additive measures kept per cell. Outcomes follow decision_model.OUTCOME_LABELS
+# for historical appState values and the service's Decision for new submissions;
+# applications without either are pending.
+MEASURES = ["applications", "accepted", "rejected", "pending", "investment_total", "investment_count"]
+MISSING = "(missing)"
+
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+PENDING = "pending"
+_MEASURE_INDEX = {name: i for i, name in enumerate(MEASURES)}
+_DECISIONS = {"ACCEPTED": ACCEPTED, "APPROVED": ACCEPTED, "REJECTED": REJECTED, "DECLINED": REJECTED}
+
+
+# Outcome bucket of a Decision or appState value
+def outcome(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return PENDING
+    value = str(value).strip().upper()
+    if value in _DECISIONS:
+        return _DECISIONS[value]
+    label = OUTCOME_LABELS.get(value)
+    return ACCEPTED if label == 1 else REJECTED if label == 0 else PENDING
+
+
+def _dimension_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return MISSING
+    value = str(value).strip()
+    return value or MISSING
+
+
+def _month(value):
+    try:
+        timestamp = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        return MISSING
+    if pd.isna(timestamp):
+        return MISSING
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC")
+    return timestamp.strftime("%Y-%m")
+
+
+# Investment counted towards the totals: positive amounts only, a 0 is a form default
+def _investment(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) and value > 0 else None
+
+
+def cell_key(application_data):
+    return tuple(
+        _month(application_data.get("submissionDate")) if dimension == "month"
+        else _dimension_value(application_data.get(dimension))
+        for dimension in DIMENSIONS
+    )
+
+
+# Size and modification time of the source CSV, with its hash to tell a touched
+# file from a changed one
+def source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"csv": os.path.basename(csv_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _same_source(stored, csv_path):
+    if not stored:
+        return False
+    current = source_signature(csv_path)
+    if stored.get("size") != current["size"]:
+        return False
+    if stored.get("mtime_ns") == current["mtime_ns"]:
+        return True
+    return stored.get("sha256") == dataset.file_sha256(csv_path)
+
+
+# Portfolio aggregates (acceptance counts and investment totals) per
+# combination of DIMENSIONS. The historical export is aggregated once; after
+# that the cube follows the submission log, where every submission and every
+# decision updates a single cell, and queries roll the cells up, so their cost
+# depends on the number of cells rather than applications. The cube keeps the
+# log generation and offset it has counted up to, so processes sharing the log
+# each read only the lines appended since they last looked. It is saved as JSON
+# at `path` every SAVE_EVERY log lines, and a process starting from that save
+# replays only the lines after it.
+class PortfolioCube:
+    def __init__(self, path=None, csv_path=dataset.CSV_PATH):
+        self.path = path
+        self.csv_path = csv_path
+        self.cells = {}
+        self.source = {}
+        self.updated_at = None
+        # Submission log position counted up to, and the submissions counted
+        self.log_generation = None
+        self.log_offset = 0
+        self.submissions = 0
+        self._unsaved = 0
+        self._frame = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.cells)
+
+    @classmethod
+    def from_frame(cls, df, path=None, csv_path=dataset.CSV_PATH):
+        return cls(path, csv_path).add_frame(df)
+
+    # Aggregate a whole frame of historical applications in one pass
+    def add_frame(self, df):
+        if df.empty:
+            return self
+        keys = pd.DataFrame(index=df.index)
+        for dimension in DIMENSIONS:
+            if dimension == "month":
+                months = pd.to_datetime(df.get("submissionDate"), errors="coerce", utc=True)
+                keys[dimension] = months.dt.strftime("%Y-%m").fillna(MISSING) if months is not None else MISSING
+            elif dimension in df.columns:
+                keys[dimension] = df[dimension].astype("string").str.strip().replace("", pd.NA).fillna(MISSING)
+            else:
+                keys[dimension] = MISSING
+        outcomes = df["appState"].map(outcome) if "appState" in df.columns else pd.Series(PENDING, index=df.index)
+        investment = pd.to_numeric(df.get("totalInvestmentValue"), errors="coerce") if "totalInvestmentValue" in df.columns \
+            else pd.Series(float("nan"), index=df.index)
+        investment = investment.where(investment > 0)
+        keys["applications"] = 1
+        for name in (ACCEPTED, REJECTED, PENDING):
+            keys[name] = (outcomes == name).astype(int)
+        keys["investment_total"] = investment.fillna(0.0)
+        keys["investment_count"] = investment.notna().astype(int)
+        grouped = keys.groupby(DIMENSIONS, sort=False)[MEASURES].sum()
+        with self._lock:
+            for key, values in zip(grouped.index, grouped.itertuples(index=False)):
+                cell = self.cells.setdefault(tuple(key), [0] * len(MEASURES))
+                for i, value in enumerate(values):
+                    cell[i] += value
+            self._changed()
+        return self
+
+    def _changed(self):
+        self._frame = None
+        self.updated_at = time.time()
+
+    def _add(self, key, measure, amount):
+        cell = self.cells.setdefault(key, [0] * len(MEASURES))
+        cell[_MEASURE_INDEX[measure]] += amount
+
+    # Count the submissions and decisions logged after the cube's offset.
+    # Applications rejected by pre-screening were never analysed and are left
+    # out; a decision moves its application out of the pending bucket.
+    def catch_up(self, log):
+        with self._lock:
+            generation = log.generation()
+            if generation != self.log_generation and self.log_offset:
+                # A compaction replaced the log, so the offset means nothing in
+                # it: count the export and the whole log again
+                exported = os.path.exists(self.csv_path)
+                self.cells, self.submissions = {}, 0
+                if exported:
+                    self.add_frame(dataset.load_dataset(self.csv_path))
+                self.log_offset = 0
+            self.log_generation = generation
+            keys = {}
+            applied = 0
+            for end, record in log.entries(self.log_offset, generation=generation):
+                self.log_offset = end
+                applied += 1
+                application_data = record.get("application_data")
+                if isinstance(application_data, dict):
+                    if any(severity == "reject" for severity, _ in record.get("screening") or ()):
+                        continue
+                    key = keys[record["uuid"]] = cell_key(application_data)
+                    self._add(key, "applications", 1)
+                    self._add(key, PENDING, 1)
+                    investment = _investment(application_data.get("totalInvestmentValue"))
+                    if investment is not None:
+                        self._add(key, "investment_total", investment)
+                        self._add(key, "investment_count", 1)
+                    self.submissions += 1
+                if isinstance(record.get("analysis_result"), dict):
+                    self._record_decision(log, keys, record)
+            if applied:
+                self._changed()
+                self._unsaved += applied
+                if self.path and self._unsaved >= SAVE_EVERY:
+                    self.save()
+            return applied
+
+    # Move the application of a logged result from pending to its decision;
+    # its cell comes from the submission, counted in this catch-up or earlier.
+    # The local model's prior is not a decision and leaves it pending.
+    def _record_decision(self, log, keys, record):
+        result = outcome(record["analysis_result"].get("analysis_result", {}).get("Decision"))
+        if result == PENDING or record.get("source") == "local_model":
+            return
+        key = keys.get(record["uuid"])
+        if key is None:
+            submitted = log.get(record["uuid"])
+            application_data = (submitted or {}).get("application_data")
+            if not isinstance(application_data, dict) \
+                    or any(severity == "reject" for severity, _ in submitted.get("screening") or ()):
+                return
+            key = cell_key(application_data)
+        self._add(key, PENDING, -1)
+        self._add(key, result, 1)
+
+    # A consistent snapshot, whichever process writes it last: they only
+    # differ in how much of the log is left to replay
+    def save(self):
+        with self._lock:
+            state = {
+                "format_version": FORMAT_VERSION,
+                "dimensions": DIMENSIONS,
+                "measures": MEASURES,
+                "source": self.source,
+                "updated_at": self.updated_at,
+                "cells": [[*key, *values] for key, values in self.cells.items()],
+                "log_generation": self.log_generation,
+                "log_offset": self.log_offset,
+                "submissions": self.submissions,
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
+
+    # Replace the in-memory state with the persisted one; False when there is
+    # none or it was written with other dimensions or measures
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("format_version") != FORMAT_VERSION or state.get("dimensions") != DIMENSIONS \
+                or state.get("measures") != MEASURES:
+            return False
+        width = len(DIMENSIONS)
+        with self._lock:
+            self.cells = {tuple(row[:width]): row[width:] for row in state["cells"]}
+            self.source = state.get("source", {})
+            self.updated_at = state.get("updated_at")
+            self.log_generation = state.get("log_generation")
+            self.log_offset = state.get("log_offset", 0)
+            self.submissions = state.get("submissions", 0)
+            self._unsaved = 0
+            self._frame = None
+        return True
+
+    # Count what was logged since the last look, in this or any other process
+    def refresh(self):
+        catch_up(self)
+        return self
+
+    # The cells as a frame, rebuilt only after a change
+    def frame(self):
+        with self._lock:
+            if self._frame is None:
+                self._frame = pd.DataFrame(
+                    [[*key, *values] for key, values in self.cells.items()],
+                    columns=DIMENSIONS + MEASURES
+                )
+            return self._frame
+
+    # Measures rolled up to `dimensions` (all applications when empty), for the
+    # cells matching `filters` ({dimension: [values]}), with the acceptance
+    # rate among decided applications and the average positive investment
+    def query(self, dimensions=(), filters=None):
+        frame = self.frame()
+        for dimension, values in (filters or {}).items():
+            if values:
+                frame = frame[frame[dimension].isin(values)]
+        dimensions = list(dimensions)
+        if dimensions:
+            result = frame.groupby(dimensions, sort=True)[MEASURES].sum().reset_index()
+        else:
+            result = frame[MEASURES].sum().to_frame().T.astype(frame[MEASURES].dtypes.to_dict())
+        decided = result["accepted"] + result["rejected"]
+        result["acceptance_rate"] = (result["accepted"] / decided).where(decided > 0)
+        result["average_investment"] = (result["investment_total"] / result["investment_count"]).where(result["investment_count"] > 0)
+        return result
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+# Process-wide cube. It is loaded from KDIPA_CUBE_PATH, or rebuilt from the
+# export when there is none or the export changed, then brought up to date
+# with the submission log.
+def get_cube(csv_path=dataset.CSV_PATH):
+    global _cube
+    with _cube_lock:
+        if _cube is None:
+            path = os.environ.get("KDIPA_CUBE_PATH", DEFAULT_PATH) or None
+            exported = os.path.exists(csv_path)
+            cube = PortfolioCube(path, csv_path)
+            if path is None or not cube.load() or (exported and not _same_source(cube.source, csv_path)):
+                cube = PortfolioCube.from_frame(dataset.load_dataset(csv_path), path, csv_path) if exported \
+                    else PortfolioCube(path, csv_path)
+                cube.source = {**source_signature(csv_path), "sha256": dataset.file_sha256(csv_path)} if exported else {}
+                if path:
+                    # Replaces a cube of an older export instead of reloading it
+                    cube.save()
+            catch_up(cube)
+            _cube = cube
+        return _cube
+
+
+# Count what the submission log holds beyond the cube's offset; returns the
+# number of log lines read. Without a log the cube covers the export only.
+def catch_up(cube):
+    log = submission_log.get_log()
+    if log is None:
+        return 0
+    return cube.catch_up(log)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or query the portfolio cube")
+    parser.add_argument("--csv", default=dataset.CSV_PATH)
+    parser.add_argument("--path", default=os.environ.get("KDIPA_CUBE_PATH", DEFAULT_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="aggregate the export again and replay the submission log")
+    query = sub.add_parser("query", help="print the measures rolled up to some dimensions")
+    query.add_argument("dimensions", nargs="*", choices=DIMENSIONS)
+    args = parser.parse_args()
+
+    os.environ["KDIPA_CUBE_PATH"] = args.path
+    if args.command == "rebuild" and os.path.exists(args.path):
+        os.remove(args.path)
+    started = time.perf_counter()
+    cube = get_cube(args.csv)
+    if args.command == "rebuild":
+        print(json.dumps({"cells": len(cube), "submissions": cube.submissions,
+                          "seconds": round(time.perf_counter() - started, 3)}))
+    else:
+        with pd.option_context("display.max_rows", 200, "display.width", 200):
+            print(cube.query(args.dimensions).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
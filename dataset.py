@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+CSV_PATH = "kdipa_arf.csv"
+CACHE_DIR = os.environ.get("KDIPA_CACHE_DIR", ".cache")
+
+# Bump whenever the declared schema below changes so stale caches are rebuilt
+SCHEMA_VERSION = 1
+
+# Repeated strings with few distinct values
+CATEGORY_COLUMNS = [
+    "appType", "appState", "previousState", "appPhase", "processState",
+    "formType", "formState", "licenseType", "type_form_act_sect",
+    "name_activity", "name_sector", "companyOrigin", "companyCity",
+    "shareholderNationality", "incentives", "preferredIncentive"
+]
+FLOAT_COLUMNS = [
+    "activityId", "sectorId", "code",
+    "totalInvestmentValue", "cashAmount", "contributionAmount",
+    "totalCapitalAmount", "capitalExpenditure", "operatingExpense",
+    "fixedAssets", "shareValue", "valueOfEquityOrShares",
+    "percentageOfEquityOrShares", "numberOfEquityOrShares"
+]
+BOOLEAN_COLUMNS = [
+    "contributionType_cash", "contributionType_inKind",
+    "incentiveType_exemptionFromIncomeTax",
+    "incentiveType_exemptionFromCustomTaxesAndDuties",
+    "termsAndConditions"
+]
+DATE_COLUMNS = ["submissionDate"]
+STRING_COLUMNS = [
+    "uuid", "trackId", "companyUuid", "name", "proposedName",
+    "companyName", "companyStreet", "companyBuilding",
+    "companyPostalAddress", "companyOutput", "shareholderCompanyPartnerName"
+]
+
+# Everything else in the export (audit timestamps, Arabic labels, document
+# change logs, ...) is never read by the app and is pruned at load time
+USED_COLUMNS = CATEGORY_COLUMNS + FLOAT_COLUMNS + BOOLEAN_COLUMNS + DATE_COLUMNS + STRING_COLUMNS
+
+COLUMN_DTYPES = {
+    **{col: "category" for col in CATEGORY_COLUMNS},
+    **{col: "float64" for col in FLOAT_COLUMNS},
+    **{col: "boolean" for col in BOOLEAN_COLUMNS},
+    **{col: "string" for col in STRING_COLUMNS + DATE_COLUMNS},
+}
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Parse the CSV with declared dtypes, keeping only the columns the app uses
+def read_csv_typed(path=CSV_PATH):
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [col for col in header if col in COLUMN_DTYPES]
+    df = pd.read_csv(
+        path,
+        usecols=usecols,
+        dtype={col: COLUMN_DTYPES[col] for col in usecols}
+    )
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce", utc=True, format="ISO8601")
+    # Clean up the dataframe - remove empty rows
+    return df.dropna(how="all").reset_index(drop=True)
+
+
+def _cache_paths(csv_path, cache_dir):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, f"{stem}.arrow"), os.path.join(cache_dir, f"{stem}.json")
+
+
+def _read_cache_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_meta(meta_path, meta):
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, indent=2)
+    _write_atomic(meta_path, write)
+
+
+# Uncompressed Arrow IPC so the cache can be memory-mapped instead of parsed
+def _load_cache(cache_path):
+    table = feather.read_table(cache_path, memory_map=True)
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype(), pa.large_string(): pd.StringDtype()}.get)
+
+
+# Load the application export, going through the Arrow cache when it is still
+# valid. The cache is keyed on the CSV's mtime and size; when those change the
+# CSV is hashed and only re-parsed if its content actually changed.
+def load_dataset(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    cache_path, meta_path = _cache_paths(csv_path, cache_dir)
+    stat = os.stat(csv_path)
+    meta = _read_cache_meta(meta_path)
+
+    if meta and meta.get("schema_version") == SCHEMA_VERSION and os.path.exists(cache_path):
+        try:
+            if meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size:
+                return _load_cache(cache_path)
+            if meta.get("sha256") == file_sha256(csv_path):
+                # Touched but unchanged: refresh the key and keep the cache
+                _write_meta(meta_path, {**meta, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+                return _load_cache(cache_path)
+        except (OSError, pa.ArrowException):
+            pass
+
+    df = read_csv_typed(csv_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_atomic(cache_path, lambda tmp_path: feather.write_feather(df, tmp_path, compression="uncompressed"))
+        _write_meta(meta_path, {
+            "schema_version": SCHEMA_VERSION,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": file_sha256(csv_path),
+            "rows": len(df),
+            "columns": list(df.columns),
+        })
+    except OSError:
+        # A read-only checkout still works, it just parses the CSV every time
+        pass
+    return df
@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import dataset
+
+MODEL_DIR = os.environ.get("KDIPA_MODEL_DIR", ".model")
+MODEL_FORMAT_VERSION = 1
+
+# The export has no final ACCEPTED/REJECTED outcome, so appState is mapped to a
+# proxy: applications that moved on to review, registration or payment count as
+# accepted, applications sent back for more data as rejected. NOT_SUBMITTED
+# rows carry no outcome and are left out of training.
+OUTCOME_LABELS = {
+    "HANDLER_REVIEW": 1,
+    "MOCI_PENDING": 1,
+    "PAYMENT_REQUIRED": 1,
+    "DATA_REQUESTED": 0,
+}
+
+# Only fields the applicant fills in; workflow columns such as previousState and
+# processState are unknown for a new submission and would leak the label
+NUMERIC_FEATURES = [
+    "cashAmount", "contributionAmount", "totalCapitalAmount",
+    "capitalExpenditure", "operatingExpense", "fixedAssets",
+    "totalInvestmentValue"
+]
+CATEGORICAL_FEATURES = ["companyOrigin", "shareholderNationality", "licenseType"]
+
+Prior = namedtuple("Prior", ["decision", "confidence", "probability"])
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def _truthy(values):
+    return np.array([str(v).strip().lower() in ("yes", "true", "1") for v in values], dtype=np.float64)
+
+
+def outcome_labels(frame):
+    return frame["appState"].astype("string").map(OUTCOME_LABELS)
+
+
+# L2-regularised logistic regression over applicant-provided fields, fitted with
+# Newton's method (a handful of iterations on a few hundred rows). Classes are
+# reweighted so the rarer outcome is not simply ignored.
+class DecisionModel:
+    def __init__(self, categories, mean, std, weights, metadata=None):
+        self.categories = categories
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.metadata = metadata or {}
+        self.positions = {
+            col: {value: i for i, value in enumerate(values)} for col, values in categories.items()
+        }
+        self.feature_names = (
+            ["intercept", "has_financials", "incentives"] + [f"log_{col}" for col in NUMERIC_FEATURES]
+            + [f"{col}={value}" for col, values in categories.items() for value in values]
+        )
+
+    @classmethod
+    def fit(cls, frame, labels, l2=1.0, n_iter=25, min_count=2):
+        categories = {}
+        for col in CATEGORICAL_FEATURES:
+            counts = frame[col].astype("string").str.strip().value_counts() if col in frame.columns else pd.Series(dtype=int)
+            categories[col] = sorted(counts[counts >= min_count].index)
+        logs = cls._log_amounts(frame)
+        mean = np.nan_to_num(np.nanmean(logs, axis=0)) if np.isfinite(logs).any() else np.zeros(len(NUMERIC_FEATURES))
+        std = np.nan_to_num(np.nanstd(logs, axis=0))
+        std = np.where(std > 0, std, 1.0)
+
+        model = cls(categories, mean, std, np.zeros(0))
+        X = model.features(frame)
+        y = np.asarray(labels, dtype=np.float64)
+        model.weights = _newton(X, y, l2=l2, n_iter=n_iter)
+        return model
+
+    @staticmethod
+    def _log_amounts(frame):
+        values = np.column_stack([
+            pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            if col in frame.columns else np.full(len(frame), np.nan)
+            for col in NUMERIC_FEATURES
+        ])
+        return np.log1p(np.clip(values, 0, None))
+
+    # Design matrix for a frame of CSV rows or submitted applications
+    def features(self, frame):
+        n = len(frame)
+        logs = self._log_amounts(frame)
+        has_financials = np.isfinite(logs).any(axis=1).astype(np.float64)
+        scaled = np.nan_to_num((logs - self.mean) / self.std)
+        incentives = _truthy(frame["incentives"]) if "incentives" in frame.columns else np.zeros(n)
+        blocks = [np.ones((n, 1)), has_financials[:, None], incentives[:, None], scaled]
+        for col, values in self.categories.items():
+            block = np.zeros((n, len(values)))
+            if col in frame.columns and len(values):
+                codes = pd.Index(values).get_indexer(frame[col].astype("string").str.strip().fillna(""))
+                rows = np.flatnonzero(codes >= 0)
+                block[rows, codes[rows]] = 1.0
+            blocks.append(block)
+        return np.hstack(blocks)
+
+    # Single-application fast path of features() without building a DataFrame
+    def features_record(self, record):
+        amounts = []
+        for col in NUMERIC_FEATURES:
+            try:
+                amounts.append(float(record.get(col)))
+            except (TypeError, ValueError):
+                amounts.append(np.nan)
+        logs = np.log1p(np.clip(np.array(amounts), 0, None))
+        vector = [1.0, float(np.isfinite(logs).any()), _truthy([record.get("incentives")])[0]]
+        vector.extend(np.nan_to_num((logs - self.mean) / self.std))
+        for col, positions in self.positions.items():
+            block = [0.0] * len(positions)
+            index = positions.get(str(record.get(col)).strip())
+            if index is not None:
+                block[index] = 1.0
+            vector.extend(block)
+        return np.array(vector)
+
+    def predict_proba(self, frame):
+        return _sigmoid(self.features(frame) @ self.weights)
+
+    # ACCEPTED/REJECTED prior for one application, with the probability of the
+    # predicted side as its confidence
+    def predict(self, record):
+        probability = float(_sigmoid(self.features_record(record) @ self.weights))
+        decision = "ACCEPTED" if probability >= 0.5 else "REJECTED"
+        return Prior(decision, max(probability, 1 - probability), probability)
+
+    def save(self, directory=MODEL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, ".weights.tmp.npz")
+        np.savez(tmp_path, mean=self.mean, std=self.std, weights=self.weights)
+        os.replace(tmp_path, os.path.join(directory, "weights.npz"))
+        with open(os.path.join(directory, "model.json"), "w") as f:
+            json.dump({
+                "version": MODEL_FORMAT_VERSION,
+                "categories": self.categories,
+                "features": self.feature_names,
+                **self.metadata,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, directory=MODEL_DIR):
+        with open(os.path.join(directory, "model.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format version: {meta.get('version')}")
+        arrays = np.load(os.path.join(directory, "weights.npz"))
+        metadata = {k: v for k, v in meta.items() if k not in ("version", "categories", "features")}
+        return cls(meta["categories"], arrays["mean"], arrays["std"], arrays["weights"], metadata)
+
+
+def _newton(X, y, l2=1.0, n_iter=25, tol=1e-6):
+    positives = max(y.sum(), 1.0)
+    negatives = max(len(y) - y.sum(), 1.0)
+    sample_weight = np.where(y == 1, len(y) / (2 * positives), len(y) / (2 * negatives))
+    penalty = np.full(X.shape[1], l2)
+    penalty[0] = 0.0  # the intercept is not regularised
+    w = np.zeros(X.shape[1])
+    for _ in range(n_iter):
+        p = _sigmoid(X @ w)
+        gradient = X.T @ (sample_weight * (p - y)) + penalty * w
+        hessian = (X * (sample_weight * p * (1 - p))[:, None]).T @ X + np.diag(penalty)
+        step = np.linalg.solve(hessian + 1e-9 * np.eye(len(w)), gradient)
+        w -= step
+        if np.max(np.abs(step)) < tol:
+            break
+    return w
+
+
+def _auc(y, scores):
+    order = np.argsort(scores)
+    ranks = np.empty(len(scores))
+    ranks[order] = np.arange(1, len(scores) + 1)
+    positives = y.sum()
+    negatives = len(y) - positives
+    if not positives or not negatives:
+        return None
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+# k-fold estimate of how well the proxy outcome can be predicted
+def cross_validate(frame, labels, folds=5, seed=0, **fit_kwargs):
+    y = np.asarray(labels, dtype=np.float64)
+    order = np.random.default_rng(seed).permutation(len(y))
+    scores = np.zeros(len(y))
+    for fold in np.array_split(order, folds):
+        train = np.setdiff1d(order, fold)
+        model = DecisionModel.fit(frame.iloc[train], y[train], **fit_kwargs)
+        scores[fold] = model.predict_proba(frame.iloc[fold])
+    return {
+        "cv_accuracy": round(float(((scores >= 0.5) == (y == 1)).mean()), 3),
+        "cv_auc": None if _auc(y, scores) is None else round(_auc(y, scores), 3),
+    }
+
+
+# Train on the labelled part of the export and record where the model came from
+def train(csv_path=dataset.CSV_PATH, **fit_kwargs):
+    frame = dataset.load_dataset(csv_path).drop_duplicates(subset="uuid")
+    labels = outcome_labels(frame)
+    labelled = frame[labels.notna()].reset_index(drop=True)
+    y = labels[labels.notna()].to_numpy(dtype=np.float64)
+    if len(np.unique(y)) < 2:
+        raise ValueError("Training needs both accepted-like and rejected-like applications")
+
+    started = time.perf_counter()
+    model = DecisionModel.fit(labelled, y, **fit_kwargs)
+    model.metadata = {
+        "source": os.path.abspath(csv_path),
+        "source_sha256": dataset.file_sha256(csv_path),
+        "trained_rows": int(len(y)),
+        "accepted_share": round(float(y.mean()), 3),
+        "train_seconds": round(time.perf_counter() - started, 4),
+        "label_mapping": OUTCOME_LABELS,
+        **cross_validate(labelled, y, **fit_kwargs),
+    }
+    return model
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+# Process-wide model, loaded from MODEL_DIR on first use and retrained when the
+# saved artifacts are missing or were trained on a different export. Returns
+# None when no model can be built, so callers simply show no prior.
+def get_model(csv_path=dataset.CSV_PATH, directory=MODEL_DIR):
+    global _model
+    with _model_lock:
+        if _model is None:
+            try:
+                model = DecisionModel.load(directory)
+                if model.metadata.get("source_sha256") != dataset.file_sha256(csv_path):
+                    model = None
+            except (OSError, ValueError, KeyError):
+                model = None
+            if model is None:
+                try:
+                    model = train(csv_path)
+                except (OSError, ValueError, KeyError):
+                    return None
+                try:
+                    model.save(directory)
+                except OSError:
+                    pass
+            _model = model
+        return _model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local decision model on historical appState outcomes")
+    parser.add_argument("--csv", default=dataset.CSV_PATH)
+    parser.add_argument("--out", default=MODEL_DIR)
+    args = parser.parse_args()
+
+    model = train(args.csv)
+    model.save(args.out)
+    print(json.dumps(model.metadata, indent=2))
+
+
+if __name__ == "__main__":
+    main()
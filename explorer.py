@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# Columns with a precomputed value -> rows index for filtering
+INDEX_COLUMNS = ["appState", "name_sector", "shareholderNationality"]
+# Free-text search looks in these columns
+SEARCH_COLUMNS = ["uuid", "companyName", "name", "proposedName"]
+DEFAULT_COLUMNS = [
+    "uuid", "companyName", "appState", "name_sector", "shareholderNationality",
+    "totalCapitalAmount", "submissionDate"
+]
+MISSING = "(missing)"
+
+
+# Server-side view over the application export: filtering, sorting and column
+# projection happen here and only the requested page is handed to the browser.
+# Filters on INDEX_COLUMNS are answered from precomputed row-position lists and
+# sorting reuses a per-column order computed once, so a page request is a few
+# vectorized passes over row positions and never copies the whole frame.
+class FrameExplorer:
+    def __init__(self, df, index_columns=None):
+        self.df = df
+        self.index_columns = [col for col in (index_columns or INDEX_COLUMNS) if col in df.columns]
+        self.indexes = {}
+        for col in self.index_columns:
+            values = df[col].astype("string").fillna(MISSING).to_numpy()
+            self.indexes[col] = {
+                value: np.asarray(positions, dtype=np.int64)
+                for value, positions in pd.Series(np.arange(len(df))).groupby(values).groups.items()
+            }
+        self._sort_orders = {}
+        self._search_values = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def columns(self):
+        return list(self.df.columns)
+
+    # Distinct values of an indexed column with their row counts, most frequent first
+    def options(self, column):
+        index = self.indexes.get(column, {})
+        return sorted(index, key=lambda value: (-len(index[value]), value))
+
+    def count(self, column, value):
+        return len(self.indexes.get(column, {}).get(value, ()))
+
+    # Boolean row mask for {column: [values]} filters (OR within a column, AND
+    # across columns) and an optional case-insensitive text search
+    def mask(self, filters=None, search=None):
+        mask = np.ones(len(self.df), dtype=bool)
+        for col, values in (filters or {}).items():
+            if not values:
+                continue
+            if col not in self.indexes:
+                raise KeyError(f"{col} is not an indexed column")
+            selected = np.zeros(len(self.df), dtype=bool)
+            for value in values:
+                selected[self.indexes[col].get(value, [])] = True
+            mask &= selected
+        if search:
+            candidates = np.flatnonzero(mask)
+            found = np.zeros(len(candidates), dtype=bool)
+            for values in self._searchable():
+                found |= values.iloc[candidates].str.contains(search.lower(), regex=False, na=False).to_numpy(dtype=bool)
+            mask[:] = False
+            mask[candidates[found]] = True
+        return mask
+
+    # Lower-cased search columns, converted on first search
+    def _searchable(self):
+        for col in SEARCH_COLUMNS:
+            if col in self.df.columns and col not in self._search_values:
+                self._search_values[col] = self.df[col].astype("string").str.lower().reset_index(drop=True)
+        return [self._search_values[col] for col in SEARCH_COLUMNS if col in self._search_values]
+
+    # Row positions ordered by `column` with missing values last, and the number
+    # of non-missing values; computed once per column
+    def sort_order(self, column):
+        if column not in self._sort_orders:
+            values = self.df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype("string")
+            order = values.reset_index(drop=True).sort_values(kind="stable", na_position="last").index
+            self._sort_orders[column] = (np.asarray(order, dtype=np.int64), int(values.notna().sum()))
+        return self._sort_orders[column]
+
+    # One page of the filtered, sorted and projected frame, plus the total match
+    # count. Pass `row_mask` from mask() to reuse an already computed selection.
+    def page(self, filters=None, search=None, columns=None, sort_by=None, ascending=True,
+             page=1, page_size=50, row_mask=None):
+        mask = row_mask if row_mask is not None else self.mask(filters, search)
+        total = int(mask.sum())
+        if sort_by:
+            order, present = self.sort_order(sort_by)
+            if not ascending:
+                # Keep missing values last when reversing
+                order = np.concatenate([order[:present][::-1], order[present:]])
+            positions = order[mask[order]]
+        else:
+            positions = np.flatnonzero(mask)
+        start = max(page - 1, 0) * page_size
+        positions = positions[start:start + page_size]
+        columns = [col for col in (columns or DEFAULT_COLUMNS) if col in self.df.columns]
+        return self.df.iloc[positions][columns], total
@@ -0,0 +1,446 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import submission_log
+
+# Amounts scored against the applications of the same sector and activity
+FIELDS = ["cashAmount", "totalCapitalAmount", "capitalExpenditure", "operatingExpense", "fixedAssets", "totalInvestmentValue"]
+SECTOR_COLUMN = "name_sector"
+ACTIVITY_COLUMN = "name_activity"
+
+# Reference groups from the most to the least specific. A field is compared
+# with the most specific group that has at least MIN_GROUP_COUNT amounts for it.
+LEVELS = ("activity", "sector", "all")
+MIN_GROUP_COUNT = int(os.environ.get("KDIPA_STATS_MIN_GROUP_COUNT", 20))
+
+# Amounts span several orders of magnitude, so they are summarized as log1p
+# values in a fixed histogram: bins of 0.05 (amounts within ~5% of each other)
+# up to log1p(amount) = 32. The histogram is the quantile sketch: it merges by
+# addition, and the median, MAD and quantile ranks are read off it.
+BIN_WIDTH = 0.05
+NUM_BINS = 640
+# MAD of a normal distribution is 0.6745 standard deviations
+MAD_SCALE = 1.4826
+# Robust z-score from which an amount is reported as unusual (Iglewicz and Hoaglin)
+ANOMALY_Z = 3.5
+
+STATS_DIR = os.environ.get("KDIPA_STATS_DIR", ".stats")
+STATS_FORMAT_VERSION = 2
+# Log lines read since the last save after which the statistics are saved again
+SAVE_EVERY = int(os.environ.get("KDIPA_STATS_SAVE_EVERY", 64))
+_KEY_SEPARATOR = "\x1f"
+
+
+# log1p of the positive amounts of a (rows, FIELDS) array; NaN elsewhere, as
+# zeros are form defaults rather than amounts
+def _log_amounts(values):
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        return np.where(values > 0, np.log1p(np.where(values > 0, values, 0)), np.nan)
+
+
+def _bins(logs):
+    return np.clip(np.nan_to_num(logs / BIN_WIDTH), 0, NUM_BINS - 1).astype(np.intp)
+
+
+def _take(array, index):
+    return np.take_along_axis(array, index[..., None], -1)[..., 0]
+
+
+# Count, median and MAD (both in log1p units) of every histogram in `counts`
+# (..., NUM_BINS); the median is interpolated within its bin
+def _summaries(counts):
+    cumulative = counts.cumsum(-1)
+    n = cumulative[..., -1]
+    half = 0.5 * n
+    median_bin = np.minimum((cumulative < half[..., None]).sum(-1), NUM_BINS - 1)
+    in_bin = _take(counts, median_bin)
+    before = _take(cumulative, median_bin) - in_bin
+    fraction = np.divide(half - before, in_bin, out=np.full(n.shape, 0.5), where=in_bin > 0)
+    median = (median_bin + fraction) * BIN_WIDTH
+
+    # MAD: the weighted median of the bins' distances from the median
+    distance = np.abs((np.arange(NUM_BINS) + 0.5) * BIN_WIDTH - median[..., None])
+    order = np.argsort(distance, axis=-1, kind="stable")
+    ordered = np.take_along_axis(counts, order, -1).cumsum(-1)
+    mad_rank = np.minimum((ordered < half[..., None]).sum(-1), NUM_BINS - 1)
+    mad = _take(np.take_along_axis(distance, order, -1), mad_rank)
+    # Identical amounts would give a MAD of 0; the histogram cannot resolve less than a bin
+    mad = np.maximum(mad, BIN_WIDTH)
+    empty = n == 0
+    return n, np.where(empty, np.nan, median), np.where(empty, np.nan, mad), cumulative
+
+
+def _group_keys(level, sectors, activities):
+    if level == "sector":
+        return sectors
+    return sectors.str.cat(activities, sep=_KEY_SEPARATOR)
+
+
+def _text_column(frame, column):
+    if column not in frame.columns:
+        return pd.Series(pd.NA, index=frame.index, dtype="string")
+    return frame[column].astype("string").str.strip().replace("", pd.NA)
+
+
+# Per-group histograms of the FIELDS amounts of historical applications, with
+# the medians, MADs and cumulative counts derived from them. Groups are every
+# sector, every sector and activity pair, and all applications together.
+# Adding applications only touches their groups' histograms, and only those
+# groups' summaries are derived again. Scoring looks the summaries up for
+# whole arrays of applications at once. Submissions are added from the
+# submission log, read from the generation and offset the statistics were
+# saved at, and the statistics are saved every SAVE_EVERY log lines.
+class FinancialStats:
+    def __init__(self, keys=None, counts=None, metadata=None, log_position=(None, 0)):
+        self.keys = [tuple(key) for key in keys] if keys else [("all", "")]
+        self.counts = counts if counts is not None else np.zeros((len(self.keys), len(FIELDS), NUM_BINS), dtype=np.int64)
+        self.metadata = metadata or {}
+        # Submission log position read up to
+        self.log_generation, self.log_offset = log_position
+        # Where catch_up() saves them, if anywhere
+        self.directory = None
+        self._unsaved = 0
+        self._lock = threading.RLock()
+        self._reindex()
+        self.n, self.median, self.mad, self.cumulative = _summaries(self.counts)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _reindex(self):
+        self._positions = {level: {} for level in LEVELS}
+        for i, (level, name) in enumerate(self.keys):
+            self._positions[level][name] = i
+        self._lookup = {
+            level: (pd.Index(list(positions), dtype=object), np.fromiter(positions.values(), dtype=np.intp, count=len(positions)))
+            for level, positions in self._positions.items()
+        }
+
+    def _new_groups(self, level, keys):
+        new = [key for key in keys if key not in self._positions[level]]
+        if new:
+            self.keys.extend((level, key) for key in new)
+            self.counts = np.concatenate([self.counts, np.zeros((len(new), len(FIELDS), NUM_BINS), dtype=np.int64)])
+            self._reindex()
+
+    # Group position per row for every level ({level: ids}), -1 where a row
+    # has no such group
+    def _frame_ids(self, sectors, activities, create=False):
+        ids = {"all": np.zeros(len(sectors), dtype=np.intp)}
+        for level in ("sector", "activity"):
+            keys = _group_keys(level, sectors, activities)
+            if create:
+                self._new_groups(level, keys.dropna().unique())
+            names, positions = self._lookup[level]
+            found = names.get_indexer(keys.to_numpy(dtype=object, na_value=None))
+            ids[level] = np.where(found >= 0, positions[found], -1) if len(positions) else found
+        return ids
+
+    # _frame_ids of a single application, without building a frame
+    def _record_ids(self, sector, activity, create=False):
+        keys = {
+            "sector": sector,
+            "activity": None if sector is None or activity is None else f"{sector}{_KEY_SEPARATOR}{activity}",
+        }
+        ids = {"all": np.zeros(1, dtype=np.intp)}
+        for level, key in keys.items():
+            if create and key is not None:
+                self._new_groups(level, [key])
+            ids[level] = np.array([self._positions[level].get(key, -1)], dtype=np.intp)
+        return ids
+
+    def _add(self, ids, values):
+        logs = _log_amounts(values)
+        bins = _bins(logs)
+        touched = set()
+        for level in LEVELS:
+            groups = ids[level]
+            rows, fields = np.nonzero(np.isfinite(logs) & (groups >= 0)[:, None])
+            np.add.at(self.counts, (groups[rows], fields, bins[rows, fields]), 1)
+            touched.update(groups[rows].tolist())
+        if len(self.n) < len(self.keys):
+            # New groups: derive everything again so the arrays line up
+            self.n, self.median, self.mad, self.cumulative = _summaries(self.counts)
+        elif touched:
+            touched = np.array(sorted(touched))
+            n, median, mad, cumulative = _summaries(self.counts[touched])
+            self.n[touched], self.median[touched], self.mad[touched], self.cumulative[touched] = n, median, mad, cumulative
+
+    @staticmethod
+    def _frame_arrays(frame):
+        values = np.column_stack([
+            pd.to_numeric(frame[field], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            if field in frame.columns else np.full(len(frame), np.nan)
+            for field in FIELDS
+        ]) if len(frame) else np.zeros((0, len(FIELDS)))
+        return _text_column(frame, SECTOR_COLUMN), _text_column(frame, ACTIVITY_COLUMN), values
+
+    @staticmethod
+    def _record_arrays(record):
+        amounts = []
+        for field in FIELDS:
+            try:
+                amounts.append(float(record.get(field)))
+            except (TypeError, ValueError):
+                amounts.append(np.nan)
+        sector, activity = (
+            value.strip() or None if isinstance(value, str) else None
+            for value in (record.get(SECTOR_COLUMN), record.get(ACTIVITY_COLUMN))
+        )
+        return sector, activity, np.array([amounts])
+
+    def add_frame(self, frame):
+        sectors, activities, values = self._frame_arrays(frame)
+        with self._lock:
+            self._add(self._frame_ids(sectors, activities, create=True), values)
+        return self
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls().add_frame(frame)
+
+    # Add a submitted application
+    def add_application(self, application_data):
+        sector, activity, values = self._record_arrays(application_data)
+        with self._lock:
+            self._add(self._record_ids(sector, activity, create=True), values)
+
+    # Add the submissions logged after the statistics' offset, except those
+    # rejected by pre-screening; returns the number of log lines read
+    def catch_up(self, log):
+        with self._lock:
+            generation = log.generation()
+            if generation != self.log_generation and self.log_offset:
+                # A compaction replaced the log, so the offset means nothing in
+                # it: summarize the export and the whole log again
+                exported = build(self.metadata.get("source", dataset.CSV_PATH))
+                self.keys, self.counts = exported.keys, exported.counts
+                self.n, self.median, self.mad, self.cumulative = exported.n, exported.median, exported.mad, exported.cumulative
+                self._reindex()
+                self.log_offset = 0
+            self.log_generation = generation
+            read = 0
+            for end, record in log.entries(self.log_offset, generation=generation):
+                self.log_offset = end
+                read += 1
+                application_data = record.get("application_data")
+                if isinstance(application_data, dict) \
+                        and not any(severity == "reject" for severity, _ in record.get("screening") or ()):
+                    self.add_application(application_data)
+            self._unsaved += read
+            if self.directory and self._unsaved >= SAVE_EVERY:
+                self.save(self.directory)
+            return read
+
+    def _score(self, ids, values):
+        logs = _log_amounts(values)
+        columns = np.arange(len(FIELDS))
+        groups = np.zeros(logs.shape, dtype=np.intp)
+        levels = np.full(logs.shape, LEVELS.index("all"), dtype=np.int8)
+        for level in ("sector", "activity"):
+            enough = (ids[level] >= 0)[:, None] & (self.n[np.maximum(ids[level], 0)] >= MIN_GROUP_COUNT)
+            groups = np.where(enough, ids[level][:, None], groups)
+            levels = np.where(enough, LEVELS.index(level), levels)
+        n = self.n[groups, columns]
+        median = self.median[groups, columns]
+        mad = self.mad[groups, columns]
+        bins = _bins(logs)
+        in_bin = self.counts[groups, columns, bins]
+        below = self.cumulative[groups, columns, bins] - in_bin
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = (logs - median) / (MAD_SCALE * mad)
+            rank = (below + (logs / BIN_WIDTH - bins).clip(0, 1) * in_bin) / n
+        scored = np.isfinite(logs) & (n > 0)
+        return (np.where(scored, z, np.nan), np.where(scored, rank, np.nan), np.where(scored, levels, -1).astype(np.int8),
+                groups, np.where(scored, n, 0))
+
+    # Robust z-scores ((log amount - median) / (1.4826 * MAD)), quantile ranks
+    # within the reference group (0-1, interpolated within the bin) and the
+    # level of that group, as (rows, FIELDS) arrays. Missing amounts score NaN
+    # with a level of -1.
+    def score_arrays(self, sectors, activities, values):
+        with self._lock:
+            z, rank, levels, _, _ = self._score(self._frame_ids(sectors, activities), values)
+        return z, rank, levels
+
+    # Scores of every row of a frame (export columns): <field>_z, <field>_rank
+    # and <field>_reference per field, and the largest absolute z-score
+    def score_frame(self, frame):
+        z, rank, levels = self.score_arrays(*self._frame_arrays(frame))
+        columns = {}
+        for i, field in enumerate(FIELDS):
+            columns[f"{field}_z"] = z[:, i]
+            columns[f"{field}_rank"] = rank[:, i]
+            columns[f"{field}_reference"] = pd.Categorical.from_codes(levels[:, i], LEVELS)
+        scores = pd.DataFrame(columns, index=frame.index)
+        with np.errstate(invalid="ignore"):
+            scores["max_abs_z"] = np.nanmax(np.abs(z), axis=1, initial=0.0, where=np.isfinite(z))
+        return scores
+
+    # Per-field scores of one application, for display
+    def score_application(self, application_data):
+        sector, activity, values = self._record_arrays(application_data)
+        with self._lock:
+            z, rank, levels, groups, n = self._score(self._record_ids(sector, activity), values)
+            medians = np.expm1(self.median[groups[0], np.arange(len(FIELDS))])
+        references = {"activity": f"{sector} / {activity}", "sector": sector, "all": "all applications"}
+        return [{
+            "field": field,
+            "value": float(values[0, i]),
+            "z": round(float(z[0, i]), 2),
+            "rank": round(float(rank[0, i]), 3),
+            "reference": references[LEVELS[levels[0, i]]],
+            "count": int(n[0, i]),
+            "median": float(medians[i]),
+            "unusual": bool(abs(z[0, i]) >= ANOMALY_Z),
+        } for i, field in enumerate(FIELDS) if np.isfinite(z[0, i])]
+
+    # Held under the lock, so the groups, counts, summaries and log offset
+    # written always belong together even while submissions are being added.
+    # Whichever process saves last, the files are consistent: they only differ
+    # in how much of the log is left to read.
+    def save(self, directory=STATS_DIR):
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            # Most bins are empty, so only the occupied ones are stored
+            occupied = np.flatnonzero(self.counts)
+            tmp_path = os.path.join(directory, f".sketches.{os.getpid()}.tmp.npz")
+            np.savez(tmp_path, occupied=occupied, counts=self.counts.ravel()[occupied],
+                     median=self.median, mad=self.mad)
+            os.replace(tmp_path, os.path.join(directory, "sketches.npz"))
+            tmp_path = os.path.join(directory, f".stats.{os.getpid()}.tmp.json")
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "version": STATS_FORMAT_VERSION,
+                    "fields": FIELDS,
+                    "bin_width": BIN_WIDTH,
+                    "num_bins": NUM_BINS,
+                    "groups": [list(key) for key in self.keys],
+                    "log_generation": self.log_generation,
+                    "log_offset": self.log_offset,
+                    **self.metadata,
+                }, f)
+            os.replace(tmp_path, os.path.join(directory, "stats.json"))
+            if directory == self.directory:
+                self._unsaved = 0
+
+    @classmethod
+    def load(cls, directory=STATS_DIR):
+        with open(os.path.join(directory, "stats.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != STATS_FORMAT_VERSION or meta.get("fields") != FIELDS \
+                or meta.get("bin_width") != BIN_WIDTH or meta.get("num_bins") != NUM_BINS:
+            raise ValueError(f"Unsupported statistics format: {meta.get('version')}")
+        arrays = np.load(os.path.join(directory, "sketches.npz"))
+        counts = np.zeros(len(meta["groups"]) * len(FIELDS) * NUM_BINS, dtype=np.int64)
+        counts[arrays["occupied"]] = arrays["counts"]
+        counts = counts.reshape(len(meta["groups"]), len(FIELDS), NUM_BINS)
+        metadata = {k: v for k, v in meta.items()
+                    if k not in ("version", "fields", "bin_width", "num_bins", "groups", "log_generation", "log_offset")}
+        stats = cls(meta["groups"], counts, metadata, (meta.get("log_generation"), meta.get("log_offset", 0)))
+        if not (np.allclose(stats.median, arrays["median"], equal_nan=True) and np.allclose(stats.mad, arrays["mad"], equal_nan=True)):
+            raise ValueError("Statistics do not match their sketches")
+        return stats
+
+
+# Summarize the export and record where the statistics came from
+def build(csv_path=dataset.CSV_PATH):
+    frame = dataset.load_dataset(csv_path).drop_duplicates(subset="uuid")
+    started = time.perf_counter()
+    stats = FinancialStats.from_frame(frame)
+    stats.metadata = {
+        "source": os.path.abspath(csv_path),
+        "source_sha256": dataset.file_sha256(csv_path),
+        "rows": int(len(frame)),
+        "build_seconds": round(time.perf_counter() - started, 4),
+    }
+    return stats
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+# Process-wide statistics, loaded from STATS_DIR and rebuilt when missing or
+# built from a different export, then brought up to date with the submission
+# log. Returns None when there is nothing to build them from.
+def get_stats(csv_path=dataset.CSV_PATH, directory=STATS_DIR):
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            try:
+                stats = FinancialStats.load(directory)
+                if stats.metadata.get("source_sha256") != dataset.file_sha256(csv_path):
+                    stats = None
+            except (OSError, ValueError, KeyError):
+                stats = None
+            rebuilt = stats is None
+            if rebuilt:
+                try:
+                    stats = build(csv_path)
+                except (OSError, ValueError, KeyError):
+                    return None
+            stats.directory = directory
+            try:
+                if rebuilt:
+                    # Replaces whatever was persisted, rather than reloading it
+                    stats.save(directory)
+                catch_up(stats)
+            except OSError:
+                pass
+            _stats = stats
+        return _stats
+
+
+# Add what the submission log holds beyond the statistics' offset; returns the
+# number of log lines read. Without a log they cover the export only.
+def catch_up(stats):
+    log = submission_log.get_log()
+    if log is None:
+        return 0
+    return stats.catch_up(log)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build financial statistics per sector and activity, or score a file against them")
+    parser.add_argument("--csv", default=dataset.CSV_PATH)
+    parser.add_argument("--dir", default=STATS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="summarize the export again")
+    score = sub.add_parser("score", help="score every row of a CSV (export columns)")
+    score.add_argument("input")
+    score.add_argument("--out", help="CSV of the scores (default: print the unusual rows)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        stats = build(args.csv)
+        stats.directory = args.dir
+        stats.save(args.dir)
+        print(json.dumps({"groups": len(stats), **stats.metadata}, indent=2))
+        return 0
+
+    stats = get_stats(args.csv, args.dir)
+    frame = pd.read_csv(args.input, low_memory=False)
+    started = time.perf_counter()
+    scores = stats.score_frame(frame)
+    elapsed = time.perf_counter() - started
+    if args.out:
+        scores.to_csv(args.out, index=False)
+    else:
+        unusual = scores[scores["max_abs_z"] >= ANOMALY_Z]
+        print(unusual.round(2).to_string())
+    print(json.dumps({"rows": len(frame), "unusual": int((scores["max_abs_z"] >= ANOMALY_Z).sum()),
+                      "score_seconds": round(elapsed, 4)}))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
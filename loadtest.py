@@ -0,0 +1,117 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import api_client
+import dataset
+import prefill
+from application import build_analysis_payload, prepare_application_data
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 1) if len(values) else None
+
+
+# Open-loop load generator: request i is scheduled at start + i / rps whether or
+# not earlier requests have finished, so a slow server shows up as growing
+# response times instead of silently lowering the offered load. Response time is
+# measured from the scheduled send time (queueing included), service time from
+# the moment the request actually went out.
+def run_load(client, payloads, rps, duration, concurrency, stream=False):
+    total = max(1, int(rps * duration))
+    results = [None] * total
+    headers = {**JSON_HEADERS, "Accept": "application/x-ndjson" if stream else "application/json"}
+
+    def send(i, scheduled):
+        payload = payloads[i % len(payloads)]
+        sent = time.perf_counter()
+        status, error, first_byte = None, None, None
+        try:
+            response = client.analyze(payload, headers=headers, stream=True)
+            try:
+                status = response.status_code
+                for chunk in response.iter_content(chunk_size=None):
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+            finally:
+                response.close()
+        except Exception as e:
+            # Anything that kept the request from completing (connection errors, an
+            # open circuit, a broken stream) counts as a failed request
+            error = type(e).__name__
+        done = time.perf_counter()
+        results[i] = {
+            "status": status,
+            "error": error,
+            "response_ms": (done - scheduled) * 1000,
+            "service_ms": (done - sent) * 1000,
+            "first_byte_ms": (first_byte - sent) * 1000 if first_byte else None,
+        }
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load")
+    started = time.perf_counter()
+    for i in range(total):
+        scheduled = started + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        executor.submit(send, i, scheduled)
+    executor.shutdown(wait=True)
+    return results, time.perf_counter() - started
+
+
+def report(results, elapsed, rps):
+    ok = [r for r in results if r["status"] == 200]
+    by_status = {}
+    for r in results:
+        key = str(r["status"]) if r["status"] is not None else r["error"]
+        by_status[key] = by_status.get(key, 0) + 1
+    summary = {
+        "target_rps": rps,
+        "achieved_rps": round(len(results) / elapsed, 2),
+        "requests": len(results),
+        "error_rate": round(1 - len(ok) / len(results), 4),
+        "by_status": by_status,
+    }
+    for name in ("response_ms", "service_ms", "first_byte_ms"):
+        values = [r[name] for r in ok if r[name] is not None]
+        summary[name] = {"p50": percentile(values, 50), "p95": percentile(values, 95),
+                         "p99": percentile(values, 99), "max": percentile(values, 100)}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay prefilled applications against /analyze-application at a target rate")
+    parser.add_argument("--url", help=f"analysis service base URL (default: ${api_client.BASE_URL_ENV} or the production endpoint)")
+    parser.add_argument("--csv", default=dataset.CSV_PATH)
+    parser.add_argument("--rps", type=float, default=5.0, help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=64, help="max requests in flight")
+    parser.add_argument("--samples", type=int, default=200, help="distinct applications to replay")
+    parser.add_argument("--stream", action="store_true", help="request NDJSON streaming and report time to first byte")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # Same records the app's "Get Data" button fills the form with
+    rng = np.random.default_rng(args.seed)
+    records = prefill.sample_prefill_records(dataset.load_dataset(args.csv), args.samples, rng=rng)
+    payloads = [build_analysis_payload(prepare_application_data(record)) for record in records]
+
+    # No retries and a breaker that never opens: every request is measured as sent
+    client = api_client.AnalysisClient(
+        args.url, max_retries=0, pool_size=args.concurrency,
+        breaker=api_client.CircuitBreaker(failure_threshold=float("inf"))
+    )
+    print(f"{args.rps} rps for {args.duration}s against {client.base_url}", file=sys.stderr)
+    results, elapsed = run_load(client, payloads, args.rps, args.duration, args.concurrency, stream=args.stream)
+    print(json.dumps(report(results, elapsed, args.rps), indent=2))
+
+
+if __name__ == "__main__":
+    main()
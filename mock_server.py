@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import os
+import random
+from functools import lru_cache
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import dataset
+import result_cache
+import search_filter
+import streaming
+
+# Local stand-in for the analysis service. Results are drawn from the historical
+# applications in kdipa_arf.csv (appState becomes the Decision) and latency and
+# failures follow configurable distributions, so the front end can be
+# load-tested without touching the real endpoint:
+#   python mock_server.py --port 8000 --workers 4
+#   KDIPA_API_URL=http://127.0.0.1:8000 streamlit run app.py
+# Sections are streamed as NDJSON or SSE when the Accept header allows it;
+# clients that only accept JSON get the whole result at the end.
+CSV_PATH = os.environ.get("KDIPA_MOCK_CSV", dataset.CSV_PATH)
+# Full response time is lognormal around the median, in seconds
+LATENCY_MEDIAN = float(os.environ.get("KDIPA_MOCK_LATENCY", 3.0))
+LATENCY_SIGMA = float(os.environ.get("KDIPA_MOCK_LATENCY_SIGMA", 0.5))
+# Share of requests answered with one of ERROR_CODES instead of a result
+ERROR_RATE = float(os.environ.get("KDIPA_MOCK_ERROR_RATE", 0.0))
+ERROR_CODES = [int(code) for code in os.environ.get("KDIPA_MOCK_ERROR_CODES", "500,502,503,504").split(",")]
+# Share of the response time spent before the first streamed section
+FIRST_SECTION_SHARE = 0.15
+
+RECOMMENDATIONS = {
+    "PAYMENT_REQUIRED": ["Settle the outstanding license fee to complete the application."],
+    "MOCI_PENDING": ["Follow up with the Ministry of Commerce and Industry on the pending registration."],
+    "HANDLER_REVIEW": ["Provide audited financial statements for the shareholders.",
+                       "Detail the expected local employment over the first three years."],
+    "DATA_REQUESTED": ["Submit the documents requested by the handler.",
+                       "Clarify the source of the contributed capital."],
+    "NOT_SUBMITTED": ["Complete and submit the application form."],
+}
+RISKS = {
+    "PAYMENT_REQUIRED": "No known risks identified.",
+    "MOCI_PENDING": "No known risks identified.",
+    "HANDLER_REVIEW": ["Business plan assumptions have not been independently verified."],
+    "DATA_REQUESTED": ["Incomplete documentation", "Unverified capital contribution"],
+    "NOT_SUBMITTED": ["Application is incomplete"],
+}
+
+app = FastAPI(title="KDIPA analysis mock")
+SEED = os.environ.get("KDIPA_MOCK_SEED")
+_rng = random.Random(SEED)
+
+
+# Random source for the result of a request. With KDIPA_MOCK_SEED set, the
+# result depends only on the application (as result_cache keys it), so
+# replays against the mock can be compared run to run; latency stays random.
+def result_rng(payload):
+    if SEED is None:
+        return _rng
+    return random.Random(f"{SEED}:{result_cache.payload_key(payload)}")
+
+
+# Advertise gzip request bodies (RFC 7694), so clients compress from the next request on
+@app.middleware("http")
+async def accept_gzip(request: Request, call_next):
+    response = await call_next(request)
+    response.headers["Accept-Encoding"] = "gzip"
+    return response
+
+
+# Historical applications as plain records, grouped by sector
+@lru_cache(maxsize=1)
+def history():
+    df = dataset.load_dataset(CSV_PATH)
+    df = df[df["appState"].notna()].drop_duplicates(subset="uuid")
+    records = [
+        {
+            "uuid": row.uuid,
+            "appState": str(row.appState),
+            "name_sector": None if row.name_sector is None or row.name_sector != row.name_sector else str(row.name_sector),
+            # Fields the similar-application search can be filtered on
+            **{field: getattr(row, field) for field in search_filter.FIELD_TYPES
+               if field != "name_sector" and isinstance(getattr(row, field), str)},
+            "submissionDate": row.submissionDate,
+            "description": next(
+                (str(v).strip() for v in (row.companyOutput, row.companyName, row.name)
+                 if isinstance(v, str) and v.strip()),
+                "N/A"
+            )[:300],
+        }
+        for row in df[["uuid", "appState", "companyOutput", "companyName", "name", *search_filter.FIELD_TYPES]].itertuples()
+    ]
+    by_sector = {}
+    for record in records:
+        by_sector.setdefault(record["name_sector"], []).append(record)
+    return records, by_sector
+
+
+def sample_latency():
+    return _rng.lognormvariate(math.log(LATENCY_MEDIAN), LATENCY_SIGMA) if LATENCY_MEDIAN > 0 else 0.0
+
+
+# Draw a result from historical applications in the same sector when there are
+# any; similar applications come from those matching the search filter
+def build_analysis(application_data, filter_expr=None, top_similar=3, rng=_rng):
+    records, by_sector = history()
+    pool = by_sector.get(application_data.get("name_sector")) or records
+    if filter_expr:
+        node = search_filter.parse_filter(filter_expr)
+        pool = [record for record in records if search_filter.matches(node, record)] or pool
+    match = rng.choice(pool)
+    state = match["appState"]
+    company = application_data.get("companyName") or "The applicant"
+    similar = rng.sample(pool, min(top_similar, len(pool)))
+    return {
+        "Decision": state,
+        "DecisionExplanation": (
+            f"{company} most closely resembles application {match['uuid']}, which is currently in the "
+            f"{state} state. Comparable applications in {match['name_sector'] or 'the same sector'} "
+            f"followed a similar path."
+        ),
+        "Top3SimilarApplications": sorted([
+            {
+                "UUID": record["uuid"],
+                "PercentageMatching": round(rng.uniform(55, 95), 1),
+                "Description": record["description"],
+                "Status": record["appState"],
+            }
+            for record in similar
+        ], key=lambda app: -app["PercentageMatching"]),
+        "Recommendations": RECOMMENDATIONS.get(state, ["No recommendations."]),
+        "RisksIdentified": RISKS.get(state, "No known risks identified."),
+    }
+
+
+# Decision first, then the explanation in word-sized deltas, then the rest,
+# spread over the sampled response time
+async def analysis_events(analysis, latency):
+    await asyncio.sleep(latency * FIRST_SECTION_SHARE)
+    yield {"Decision": analysis["Decision"]}
+    words = analysis["DecisionExplanation"].split(" ")
+    chunks = [" ".join(words[i:i + 4]) for i in range(0, len(words), 4)]
+    rest = ("Top3SimilarApplications", "Recommendations", "RisksIdentified")
+    step = latency * (1 - FIRST_SECTION_SHARE) / (len(chunks) + len(rest))
+    for i, chunk in enumerate(chunks):
+        await asyncio.sleep(step)
+        yield {"delta": {"DecisionExplanation": chunk + (" " if i + 1 < len(chunks) else "")}}
+    for name in rest:
+        await asyncio.sleep(step)
+        yield {name: analysis[name]}
+
+
+async def ndjson_stream(analysis, latency):
+    async for event in analysis_events(analysis, latency):
+        yield json.dumps(event) + "\n"
+
+
+async def sse_stream(analysis, latency):
+    async for event in analysis_events(analysis, latency):
+        yield f"data: {json.dumps(event)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "applications": len(history()[0])}
+
+
+@app.post("/analyze-application")
+async def analyze_application(request: Request):
+    body = await request.body()
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding != "identity":
+        return JSONResponse({"detail": f"Unsupported Content-Encoding {encoding}"}, status_code=415)
+    payload = json.loads(body)
+    latency = sample_latency()
+
+    if _rng.random() < ERROR_RATE:
+        # Failures tend to come back quicker than full generations
+        await asyncio.sleep(latency * FIRST_SECTION_SHARE)
+        return JSONResponse({"detail": "Simulated upstream failure"}, status_code=_rng.choice(ERROR_CODES))
+
+    try:
+        analysis = build_analysis(payload.get("application_data") or {}, payload.get("filter_expr"),
+                                  int(payload.get("top_similar") or 3), rng=result_rng(payload))
+    except (search_filter.FilterError, ValueError) as e:
+        return JSONResponse({"detail": f"Invalid search parameters: {e}"}, status_code=400)
+    accept = request.headers.get("accept", "")
+    if streaming.NDJSON_TYPES[0] in accept:
+        return StreamingResponse(ndjson_stream(analysis, latency), media_type=streaming.NDJSON_TYPES[0])
+    if streaming.SSE_TYPE in accept:
+        return StreamingResponse(sse_stream(analysis, latency), media_type=streaming.SSE_TYPE)
+    await asyncio.sleep(latency)
+    return JSONResponse({"analysis_result": analysis})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mock analysis service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run("mock_server:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+# Applicant name columns of the export; a submission is checked against all of them
+NAME_COLUMNS = ["companyName", "name", "proposedName", "shareholderCompanyPartnerName"]
+
+# Transliteration variants folded to one spelling before shingling
+VARIANTS = {
+    "el": "al", "ul": "al",
+    "mohamed": "mohammad", "mohammed": "mohammad", "muhammad": "mohammad", "mohamad": "mohammad",
+    "abdel": "abdul", "abdal": "abdul",
+}
+# Legal-form words that say nothing about who the applicant is
+LEGAL_WORDS = frozenset("""
+co company est establishment llc wll ltd limited inc corp corporation group holding holdings
+kscc kscp ksc spc plc sa spa bv gmbh fz fzco fze general trading contracting for and the of
+""".split())
+
+_WORD_RE = re.compile(r"\w+")
+_PRIME = (1 << 31) - 1
+
+
+# Names in the export are partly UTF-8 read as cp1252 ("Ø§Ù„..."); undo that
+# when the text round-trips cleanly
+def _repair(text):
+    try:
+        return text.encode("cp1252").decode("utf-8")
+    except UnicodeError:
+        return text
+
+
+# Canonical form of an applicant name: accents and punctuation removed,
+# transliteration variants folded ("El-Sayed", "Al Sayed" and "Alsayed" all
+# become "alsayed") and legal-form words dropped
+def normalize_name(text):
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize("NFKD", _repair(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    tokens = []
+    run = ""
+    for token in _WORD_RE.findall(text.replace("_", " ")) + [""]:
+        # Dotted abbreviations ("W.L.L", "B.V.") become one word
+        if len(token) == 1 and token.isalpha():
+            run += token
+            continue
+        if run:
+            tokens.append(run)
+            run = ""
+        if token:
+            tokens.append(VARIANTS.get(token, token))
+    words = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "al" and i + 1 < len(tokens):
+            token = "al" + tokens[i + 1]
+            i += 1
+        elif token.startswith("el") and len(token) > 4:
+            token = "al" + token[2:]
+        words.append(token)
+        i += 1
+    core = [word for word in words if word not in LEGAL_WORDS]
+    return " ".join(core or words)
+
+
+# Character n-grams of a normalized name, padded so short names still shingle
+def shingles(normalized, n=3):
+    padded = f" {normalized} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+# MinHash-LSH index over applicant names for near-duplicate lookup.
+# Every distinct normalized name gets a `num_perm` MinHash signature, cut into
+# `bands` bands that are hashed into buckets; a query only looks at names
+# sharing at least one bucket, so lookups do not depend on the corpus size.
+# With the defaults (16 bands of 4 rows) a pair of names with a shingle
+# Jaccard similarity of 0.5 shares a bucket with ~65% probability, at 0.7 with
+# ~99%. Candidates are pre-filtered on their signature agreement (vectorized)
+# and the survivors ranked by exact Jaccard similarity. Names can be added at
+# any time.
+class NameIndex:
+    # How far below min_similarity a signature estimate may fall and still be
+    # checked exactly (about 3 standard deviations of a 64-permutation estimate)
+    ESTIMATE_SLACK = 0.2
+    # Candidates checked exactly per requested result, best estimates first
+    EXACT_PER_RESULT = 4
+
+    def __init__(self, num_perm=64, bands=16, ngram=3, seed=0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.int64)
+
+        self._names = []       # normalized name per id
+        self._shingles = []    # shingle set per id
+        self._sources = []     # [(uuid, field, original text)] per id
+        self._ids = {}         # normalized name -> id
+        self._signatures = np.zeros((0, num_perm), dtype=np.int32)  # row per id, with spare capacity
+        self._buckets = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    # MinHash signatures of many shingle sets at once, in chunks to bound memory
+    def signatures(self, shingle_sets, chunk=4096):
+        if len(shingle_sets) == 1:
+            hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in shingle_sets[0]), dtype=np.int64)
+            return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1).astype(np.int32)[None, :]
+        result = np.empty((len(shingle_sets), self.num_perm), dtype=np.int32)
+        for start in range(0, len(shingle_sets), chunk):
+            sets = shingle_sets[start:start + chunk]
+            lengths = np.fromiter((len(s) for s in sets), dtype=np.int64, count=len(sets))
+            hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for s in sets for g in s), dtype=np.int64, count=int(lengths.sum()))
+            permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            result[start:start + len(sets)] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return result
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    # Add (text, uuid, field) triples; returns the number of new distinct names
+    def add_many(self, items):
+        new_names = {}
+        with self._lock:
+            for text, uuid, field in items:
+                normalized = normalize_name(text)
+                if not normalized:
+                    continue
+                source = (uuid, field, text.strip())
+                name_id = self._ids.get(normalized)
+                if name_id is not None:
+                    if source not in self._sources[name_id]:
+                        self._sources[name_id].append(source)
+                elif normalized in new_names:
+                    if source not in new_names[normalized]:
+                        new_names[normalized].append(source)
+                else:
+                    new_names[normalized] = [source]
+            if not new_names:
+                return 0
+
+            shingle_sets = [shingles(normalized, self.ngram) for normalized in new_names]
+            signatures = self.signatures(shingle_sets)
+            first_id = len(self._names)
+            for offset, (normalized, sources) in enumerate(new_names.items()):
+                self._ids[normalized] = first_id + offset
+                self._names.append(normalized)
+                self._sources.append(sources)
+            self._shingles.extend(shingle_sets)
+            if len(self._names) > len(self._signatures):
+                # Grow by doubling so single-application adds stay cheap
+                grown = np.zeros((max(len(self._names), 2 * len(self._signatures), 1024), self.num_perm), dtype=np.int32)
+                grown[:first_id] = self._signatures[:first_id]
+                self._signatures = grown
+            self._signatures[first_id:len(self._names)] = signatures
+            for offset, signature in enumerate(signatures):
+                for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                    bucket.setdefault(key, []).append(first_id + offset)
+            return len(new_names)
+
+    def add(self, text, uuid=None, field=None):
+        if isinstance(text, str):
+            self.add_many([(text, uuid, field)])
+
+    def add_application(self, application_data, columns=NAME_COLUMNS):
+        self.add_many(
+            (application_data[column], application_data.get("uuid"), column)
+            for column in columns if isinstance(application_data.get(column), str)
+        )
+
+    def add_frame(self, frame, columns=NAME_COLUMNS):
+        uuids = frame["uuid"].astype("string").tolist() if "uuid" in frame.columns else [None] * len(frame)
+        self.add_many(
+            (value, uuid, column)
+            for column in columns if column in frame.columns
+            for uuid, value in zip(uuids, frame[column].tolist()) if isinstance(value, str)
+        )
+        return self
+
+    @classmethod
+    def from_frame(cls, frame, columns=NAME_COLUMNS, **kwargs):
+        return cls(**kwargs).add_frame(frame, columns)
+
+    # Known names most similar to `text`, each with the applications and
+    # columns it appears in
+    def query(self, text, k=5, min_similarity=0.5, exclude_uuid=None):
+        normalized = normalize_name(text)
+        if not normalized:
+            return []
+        shingle_set = shingles(normalized, self.ngram)
+        signature = self.signatures([shingle_set])[0]
+        with self._lock:
+            candidates = set()
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(bucket.get(key, ()))
+            if not candidates:
+                return []
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            estimates = (self._signatures[candidates] == signature).mean(axis=1)
+            keep = np.flatnonzero(estimates >= min_similarity - self.ESTIMATE_SLACK)
+            limit = k * self.EXACT_PER_RESULT
+            if len(keep) > limit:
+                keep = keep[np.argpartition(-estimates[keep], limit)[:limit]]
+            scored = []
+            for name_id in candidates[keep].tolist():
+                other = self._shingles[name_id]
+                common = len(shingle_set & other)
+                similarity = 1.0 if self._names[name_id] == normalized else common / (len(shingle_set) + len(other) - common)
+                if similarity < min_similarity:
+                    continue
+                sources = [s for s in self._sources[name_id] if exclude_uuid is None or s[0] != exclude_uuid]
+                if sources:
+                    scored.append((similarity, name_id, sources))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [{
+            "name": sources[0][2],
+            "normalized": self._names[name_id],
+            "similarity": round(similarity, 3),
+            "matches": [{"uuid": uuid, "field": field, "value": value} for uuid, field, value in sources],
+        } for similarity, name_id, sources in scored[:k]]
+
+    # Reference linear scan: exact Jaccard against every indexed name
+    def query_exact(self, text, k=5, min_similarity=0.5):
+        shingle_set = shingles(normalize_name(text), self.ngram)
+        with self._lock:
+            scores = [(len(shingle_set & other) / len(shingle_set | other), name_id)
+                      for name_id, other in enumerate(self._shingles)]
+        scores = sorted((item for item in scores if item[0] >= min_similarity), key=lambda item: (-item[0], item[1]))
+        return [(self._names[name_id], round(score, 3)) for score, name_id in scores[:k]]
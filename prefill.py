@@ -0,0 +1,203 @@
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from reference_data import COUNTRY_CODES
+
+# One form field filled from the CSV export:
+#   column   - CSV column to read
+#   key      - key in the prefill record / application form
+#   kind     - type coercion applied to the whole column ("str", "float", "int", "bool", "datetime")
+#   fallback - fallback(rng, rows, resolved) -> values for the rows where the column is missing;
+#              `resolved` holds every field resolved so far, so derived values stay consistent
+#   nest     - wrap the value as {nest: value} (contributionType / incentiveType)
+Field = namedtuple("Field", ["column", "key", "kind", "fallback", "nest"], defaults=(None,))
+
+COMPANY_TYPES = ["Technologies", "Solutions", "Industries", "Group", "Holdings", "Investments", "International", "Corporation"]
+COMPANY_PREFIXES = ["Global", "Advanced", "Elite", "Prime", "Superior", "Next-Gen", "Innovative", "Strategic"]
+COMPANY_CORE = ["Tech", "Data", "Energy", "Trade", "Construct", "Finance", "Med", "Agri", "Petro", "Eco"]
+PRODUCTS = ["advanced electronic components", "industrial automation systems", "renewable energy solutions", "medical equipment", "construction materials", "consumer electronics"]
+
+
+def _choice(options):
+    return lambda rng, rows, resolved: rng.choice(np.array(options, dtype=object), len(rows))
+
+
+def _constant(value):
+    return lambda rng, rows, resolved: np.full(len(rows), value, dtype=object)
+
+
+def _uniform(low, high):
+    return lambda rng, rows, resolved: np.round(rng.uniform(low, high, len(rows)), 2)
+
+
+def _joined(*parts, template="{} {} {}"):
+    def generate(rng, rows, resolved):
+        picks = [rng.choice(np.array(options, dtype=object), len(rows)) for options in parts]
+        return np.array([template.format(*values) for values in zip(*picks)], dtype=object)
+    return generate
+
+
+def _fraction_of(key, low, high):
+    return lambda rng, rows, resolved: np.round(resolved[key][rows] * rng.uniform(low, high, len(rows)), 2)
+
+
+def _total_investment(rng, rows, resolved):
+    # Total investment = capital + operating + some margin
+    base = resolved["capitalExpenditure"][rows] + resolved["operatingExpense"][rows]
+    return np.round(base + rng.uniform(100000, 1000000, len(rows)), 2)
+
+
+def _share_total(rng, rows, resolved):
+    return np.round(resolved["shareValue"][rows] * resolved["numberOfEquityOrShares"][rows], 2)
+
+
+def _postal_address(rng, rows, resolved):
+    return np.array([f"P.O. Box {n}" for n in rng.integers(10000, 100000, len(rows))], dtype=object)
+
+
+def _now(rng, rows, resolved):
+    return np.full(len(rows), datetime.now().isoformat(), dtype=object)
+
+
+# Order matters: derived fallbacks (operating expense, total investment, share
+# totals) come after the fields they are computed from
+FIELD_SCHEMA = [
+    # Company details
+    Field("companyName", "companyName", "str", _joined(COMPANY_PREFIXES, COMPANY_CORE, COMPANY_TYPES)),
+    Field("companyOrigin", "companyOrigin", "str", _choice(COUNTRY_CODES)),
+    Field("companyCity", "companyCity", "str", _choice(["Dubai", "Abu Dhabi", "Sharjah", "Ajman", "Fujairah", "Kuwait City", "Doha", "Riyadh", "Manama"])),
+    Field("companyStreet", "companyStreet", "str", _joined(["Sheikh Zayed", "Al Wasl", "Jumeirah", "Al Maktoum", "Al Fahidi"], template="{} Road")),
+    Field("companyBuilding", "companyBuilding", "str", _joined(["Al Fattan", "Emirates", "Business Central", "Dubai Gate", "Marina Plaza"], ["A", "B", "C"], template="{} Tower {}")),
+    Field("companyPostalAddress", "companyPostalAddress", "str", _postal_address),
+    Field("companyOutput", "companyOutput", "str", _joined(PRODUCTS, template="Manufacturing and distribution of {}")),
+    # Most rows of the export have no sector; those are left for the applicant to pick
+    Field("name_sector", "name_sector", "str", _constant(None)),
+    Field("name_activity", "name_activity", "str", _constant(None)),
+
+    # Financial details
+    Field("cashAmount", "cashAmount", "float", _uniform(100000, 1000000)),
+    Field("contributionAmount", "contributionAmount", "float", _uniform(50000, 500000)),
+    Field("totalCapitalAmount", "totalCapitalAmount", "float", _uniform(500000, 5000000)),
+    Field("capitalExpenditure", "capitalExpenditure", "float", _uniform(500000, 5000000)),
+    Field("operatingExpense", "operatingExpense", "float", _fraction_of("capitalExpenditure", 0.2, 0.4)),
+    Field("fixedAssets", "fixedAssets", "float", _fraction_of("capitalExpenditure", 0.4, 0.6)),
+    Field("totalInvestmentValue", "totalInvestmentValue", "float", _total_investment),
+
+    # Shareholder information
+    Field("shareholderCompanyPartnerName", "shareholderCompanyPartnerName", "str", _joined(["Al", "Bin", "El", "Abu"], ["Mohammed", "Ahmed", "Saeed", "Sultan", "Khalid"], ["Holding", "Investment", "Group", "Partners"])),
+    Field("shareholderNationality", "shareholderNationality", "str", _choice(COUNTRY_CODES)),
+    Field("shareValue", "shareValue", "float", _uniform(10, 100)),
+    Field("numberOfEquityOrShares", "numberOfEquityOrShares", "int", lambda rng, rows, resolved: rng.integers(1000, 10001, len(rows))),
+    Field("valueOfEquityOrShares", "valueOfEquityOrShares", "float", _share_total),
+    Field("percentageOfEquityOrShares", "percentageOfEquityOrShares", "float", _uniform(10, 100)),
+    Field("contributionType_cash", "contributionType", "bool", _constant(True), nest="cash"),
+
+    # Incentives
+    Field("incentives", "incentives", "bool", _choice([True, False])),
+    Field("incentiveType_exemptionFromIncomeTax", "incentiveType", "bool", _choice([True, False]), nest="exemptionFromIncomeTax"),
+    Field("preferredIncentive", "preferredIncentive", "str", _choice(["Tax Exemption", "Land Allocation", "Reduced Fees", "None"])),
+
+    # Terms and conditions
+    Field("termsAndConditions", "termsAndConditions", "bool", _constant(True)),
+
+    # Application metadata
+    Field("appType", "appType", "str", _constant("ApplicationInvestmentLicenseA")),
+    Field("licenseType", "licenseType", "str", _constant("ApplicationInvestmentLicenseA")),
+    Field("submissionDate", "submissionDate", "datetime", _now),
+]
+
+_TRUE_STRINGS = {"true", "yes", "y", "1"}
+_FALSE_STRINGS = {"false", "no", "n", "0"}
+
+
+# Coerce a whole column; returns (values, present) where `present` marks the
+# rows that had a usable value. Columns that already carry the target dtype
+# (see dataset.COLUMN_DTYPES) skip the conversion entirely.
+def _coerce(column, kind):
+    if kind == "float" or kind == "int":
+        if not pd.api.types.is_float_dtype(column.dtype):
+            column = pd.to_numeric(column, errors="coerce")
+        numbers = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(numbers)
+        if kind == "int":
+            return np.where(present, numbers, 0).astype(np.int64), present
+        return numbers, present
+    if kind == "bool":
+        if pd.api.types.is_bool_dtype(column.dtype):
+            values = column.to_numpy(dtype=object, na_value=None)
+            return values, ~pd.isna(values)
+        text = column.astype("string").str.strip().str.lower()
+        truthy = text.isin(_TRUE_STRINGS).to_numpy(dtype=bool)
+        falsy = text.isin(_FALSE_STRINGS).to_numpy(dtype=bool)
+        return truthy.astype(object), truthy | falsy
+    if kind == "datetime":
+        if not pd.api.types.is_datetime64_any_dtype(column.dtype):
+            column = pd.to_datetime(column, errors="coerce", utc=True)
+        present = column.notna().to_numpy()
+        return column.dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ").to_numpy(dtype=object), present
+    values = column.to_numpy(dtype=object, na_value=None)
+    present = ~pd.isna(values)
+    if not isinstance(column.dtype, (pd.StringDtype, pd.CategoricalDtype)):
+        values[present] = values[present].astype(str)
+    return values, present
+
+
+def _empty(kind, n):
+    if kind == "float":
+        return np.full(n, np.nan)
+    if kind == "int":
+        return np.zeros(n, dtype=np.int64)
+    return np.empty(n, dtype=object)
+
+
+# Map every row of `frame` to a form record. Each column is coerced once for the
+# whole frame; with fill_missing, fallback generators only run for the rows
+# where their column is missing, otherwise missing fields are left out.
+def frame_to_records(frame, rng=None, fill_missing=True, include_original=False):
+    rng = rng if rng is not None else np.random.default_rng()
+    n = len(frame)
+
+    resolved, present_masks = {}, {}
+    for field in FIELD_SCHEMA:
+        if field.column in frame.columns:
+            values, present = _coerce(frame[field.column], field.kind)
+        else:
+            values, present = _empty(field.kind, n), np.zeros(n, dtype=bool)
+        missing = np.flatnonzero(~present)
+        if fill_missing and len(missing):
+            values[missing] = field.fallback(rng, missing, resolved)
+            present = np.ones(n, dtype=bool)
+        resolved[field.key] = values
+        present_masks[field.key] = present
+
+    columns = {}
+    for field in FIELD_SCHEMA:
+        values = resolved[field.key].tolist()
+        columns[field.key] = [{field.nest: v} for v in values] if field.nest else values
+
+    if fill_missing:
+        records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+    else:
+        masks = [present_masks[key].tolist() for key in columns]
+        records = [
+            {key: value for key, value, keep in zip(columns, row, keeps) if keep}
+            for row, keeps in zip(zip(*columns.values()), zip(*masks))
+        ]
+    if include_original:
+        for record, original in zip(records, frame.to_dict("records")):
+            # Store the original CSV row for debugging
+            record["_original_csv_row"] = original
+    return records
+
+
+# Build `n` prefill records from rows sampled out of the export
+def sample_prefill_records(df, n=1, rng=None, include_original=False):
+    rng = rng if rng is not None else np.random.default_rng()
+    if df is None or df.empty:
+        sample = pd.DataFrame(index=pd.RangeIndex(n))
+    else:
+        sample = df.sample(n, replace=n > len(df), random_state=rng).reset_index(drop=True)
+    return frame_to_records(sample, rng=rng, include_original=include_original)
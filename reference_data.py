@@ -0,0 +1,28 @@
+from functools import lru_cache
+
+
+# Get list of country codes for dropdowns. Built once per process: app.py is
+# re-executed on every rerun but this module is only imported once.
+@lru_cache(maxsize=1)
+def get_country_list():
+    # pycountry loads its JSON database on import; only pay for it here
+    import pycountry
+
+    countries = [(country.alpha_2, f"{country.name} ({country.alpha_2})") for country in pycountry.countries]
+    countries.sort(key=lambda x: x[1])
+    return tuple(countries)
+
+
+COUNTRY_LIST = get_country_list()
+COUNTRY_CODES = tuple(code for code, _ in COUNTRY_LIST)
+COUNTRY_NAMES = {code: name for code, name in COUNTRY_LIST}
+# Position of each code in COUNTRY_CODES, for selectbox defaults
+COUNTRY_INDEX = {code: i for i, code in enumerate(COUNTRY_CODES)}
+
+
+def country_index(code, default=0):
+    return COUNTRY_INDEX.get(code, default)
+
+
+def country_label(code):
+    return COUNTRY_NAMES.get(code, code)
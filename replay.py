@@ -0,0 +1,420 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import numpy as np
+
+import analysis_jobs
+import api_client
+import dataset
+import prefill
+import streaming
+import tokens
+from application import build_analysis_payload, encode_payload, prepare_application_data
+
+REPORT_FORMAT_VERSION = 1
+# The app's request headers, so streamed sections are replayed as well
+HEADERS = {"Content-Type": "application/json", "Accept": streaming.STREAM_ACCEPT}
+# Seed of the --mock service's decisions unless KDIPA_MOCK_SEED sets one
+MOCK_SEED = "replay"
+# Set by prepare_application_data on every replay, so a case leaves them out
+GENERATED_FIELDS = ("uuid", "submissionDate")
+
+# Largest change a run may show against its baseline before it fails. Ratios
+# are relative increases (0.2 = 20% slower or larger); rates are absolute.
+DEFAULT_THRESHOLDS = {
+    "latency_ratio": 0.20,
+    "prepare_ratio": 0.50,
+    "request_bytes_ratio": 0.05,
+    "min_agreement": 0.95,
+    "max_error_rate": 0.02,
+}
+# Summary metrics compared with the baseline, the threshold each is held to
+# and the smallest absolute change that counts, so sub-millisecond jitter on
+# fast stages cannot fail a run
+COMPARED_METRICS = [
+    ("latency_ms", "p50", "latency_ratio", 10.0),
+    ("latency_ms", "p95", "latency_ratio", 10.0),
+    ("first_section_ms", "p50", "latency_ratio", 10.0),
+    ("prepare_ms", "p95", "prepare_ratio", 1.0),
+    ("request_bytes", "mean", "request_bytes_ratio", 8.0),
+    ("request_bytes", "p95", "request_bytes_ratio", 8.0),
+    ("estimated_tokens", "mean", "request_bytes_ratio", 4.0),
+]
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 1) if len(values) else None
+
+
+def _case_form(record):
+    return {k: v for k, v in record.items() if k not in GENERATED_FIELDS and not k.startswith("_")}
+
+
+# Replay cases from export rows, mapped to form records the way the app's
+# "Get Data" button does; the seed fixes both the rows and the generated
+# fallback values
+def corpus_from_csv(csv_path=dataset.CSV_PATH, samples=100, seed=0):
+    rng = np.random.default_rng(seed)
+    records = prefill.sample_prefill_records(dataset.load_dataset(csv_path), samples, rng=rng)
+    return [{"case_id": f"csv-{i}", "form_data": _case_form(record)} for i, record in enumerate(records)]
+
+
+# Replay cases from the submission log, with the search options they were sent
+# with; the logged decision is kept for reference
+def corpus_from_log(limit=None):
+    import submission_log
+
+    log = submission_log.get_log()
+    cases = []
+    for record in log.records() if log is not None else ():
+        application_data = record.get("application_data")
+        if not isinstance(application_data, dict):
+            continue
+        cases.append({
+            "case_id": record["uuid"],
+            "form_data": _case_form(application_data),
+            "filter_expr": record.get("filter_expr"),
+            "top_similar": record.get("top_similar") or 3,
+            "logged_decision": ((record.get("analysis_result") or {}).get("analysis_result") or {}).get("Decision"),
+        })
+    return cases[-limit:] if limit else cases
+
+
+def write_corpus(cases, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for case in cases:
+            f.write(json.dumps(case, ensure_ascii=False, default=str) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def corpus_sha256(cases):
+    canonical = json.dumps(cases, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# First half of a replay, the way a submission goes through the app: the
+# form record is prepared and encoded (timed as prepare_ms). Returns the
+# case's result so far and its payload, which is None when the app would not
+# send it (an invalid filter, over the token budget).
+def prepare_case(case):
+    result = {"case_id": case["case_id"], "status": None, "decision": None, "error": None}
+    started = time.perf_counter()
+    try:
+        application_data = prepare_application_data(case["form_data"])
+        payload = build_analysis_payload(application_data, filter_expr=case.get("filter_expr"),
+                                         top_similar=case.get("top_similar") or 3)
+        body = encode_payload(payload)
+    except ValueError as e:
+        result.update(status="invalid", error=str(e))
+        return result, None
+    estimate = tokens.estimate_prompt_tokens(payload)
+    result.update(
+        prepare_ms=round((time.perf_counter() - started) * 1000, 3),
+        request_bytes=len(body),
+        estimated_tokens=estimate["tokens"],
+    )
+    if tokens.over_budget(estimate):
+        result.update(status="over_budget", error=f"Estimated prompt of {estimate['tokens']:,} tokens")
+        return result, None
+    return result, payload
+
+
+# Second half: the payload is analysed by an AnalysisJob with the app's
+# headers, timing the full response and the first streamed section
+def send_case(result, payload, client, executor=None):
+    sent = time.perf_counter()
+    first_section = None
+    job = analysis_jobs.AnalysisJob(payload, headers=HEADERS, client=client).start(executor)
+    revision = 0
+    while not job.done():
+        revision = job.wait_for_update(revision, timeout=0.5)
+        if first_section is None and job.streamed and job.snapshot():
+            first_section = time.perf_counter()
+    done = time.perf_counter()
+    result.update(
+        latency_ms=round((done - sent) * 1000, 1),
+        first_section_ms=round((first_section - sent) * 1000, 1) if first_section else None,
+        http_status=job.status_code,
+        response_bytes=len(job.content),
+        streamed=job.streamed,
+    )
+    if job.error is not None:
+        result.update(status="error", error=f"{type(job.error).__name__}: {job.error}")
+    elif job.status_code != 200:
+        result.update(status="error", error=f"HTTP {job.status_code}: {job.text[:200]}")
+    else:
+        try:
+            analysis = job.json().get("analysis_result") or {}
+        except ValueError as e:
+            result.update(status="error", error=f"Invalid response: {e}")
+        else:
+            result.update(status="ok", decision=analysis.get("Decision"))
+    return result
+
+
+# Replay every case: all of them are prepared first, one after another, so
+# front-end timings do not compete with requests in flight; then the payloads
+# are sent `concurrency` at a time. Results are in corpus order.
+def run_corpus(cases, client, concurrency=1, progress=None):
+    # Imports and lazily built state (tokenizer, validation rules) are paid
+    # before the clock starts rather than by the first case
+    if cases:
+        prepare_case(cases[0])
+    prepared = [prepare_case(case) for case in cases]
+
+    # One pool runs the requests; send_case waits on its own thread
+    requests_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay-request")
+    lock = threading.Lock()
+    finished = [0]
+
+    def run(item):
+        result, payload = item
+        if payload is not None:
+            send_case(result, payload, client, requests_pool)
+        if progress is not None:
+            with lock:
+                finished[0] += 1
+                progress(finished[0], result)
+        return result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as executor:
+        results = list(executor.map(run, prepared))
+    requests_pool.shutdown(wait=True)
+    return results, time.perf_counter() - started
+
+
+def _distribution(values):
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "max": percentile(values, 100)}
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if r["status"] == "ok"]
+    sent = [r for r in results if r["status"] in ("ok", "error")]
+    by_status = {}
+    decisions = {}
+    for r in results:
+        by_status[r["status"]] = by_status.get(r["status"], 0) + 1
+        if r["decision"] is not None:
+            decisions[r["decision"]] = decisions.get(r["decision"], 0) + 1
+    request_bytes = [r["request_bytes"] for r in results if r.get("request_bytes") is not None]
+    estimated = [r["estimated_tokens"] for r in results if r.get("estimated_tokens") is not None]
+    return {
+        "cases": len(results),
+        "elapsed_s": round(elapsed, 2),
+        "by_status": by_status,
+        "error_rate": round(sum(r["status"] == "error" for r in results) / len(sent), 4) if sent else 0.0,
+        "latency_ms": _distribution([r["latency_ms"] for r in ok]),
+        "first_section_ms": _distribution([r["first_section_ms"] for r in ok if r.get("first_section_ms") is not None]),
+        "prepare_ms": _distribution([r["prepare_ms"] for r in results if r.get("prepare_ms") is not None]),
+        "request_bytes": {"mean": round(float(np.mean(request_bytes)), 1) if request_bytes else None,
+                          "p95": percentile(request_bytes, 95), "total": int(sum(request_bytes))},
+        "response_bytes": {"mean": round(float(np.mean([r["response_bytes"] for r in ok])), 1) if ok else None},
+        "estimated_tokens": {"mean": round(float(np.mean(estimated)), 1) if estimated else None},
+        "decisions": decisions,
+    }
+
+
+def build_report(cases, results, elapsed, base_url, corpus_path=None):
+    return {
+        "format_version": REPORT_FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "base_url": base_url,
+        "corpus": {"path": corpus_path, "cases": len(cases), "sha256": corpus_sha256(cases)},
+        "summary": summarize(results, elapsed),
+        "cases": {r["case_id"]: r for r in results},
+    }
+
+
+def _relative_change(baseline, current):
+    if baseline is None or current is None:
+        return None
+    if baseline == 0:
+        return 0.0 if current == 0 else math.inf
+    return round((current - baseline) / baseline, 4)
+
+
+# Machine-readable comparison of a run with its baseline: every compared
+# metric with its relative change and limit, decision agreement over the
+# cases both runs decided, and the threshold violations. Metrics missing from
+# either run are listed but never fail the run.
+def diff_reports(baseline, current, thresholds=None):
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    violations = []
+    metrics = {}
+    for metric, stat, threshold, floor in COMPARED_METRICS:
+        before = (baseline["summary"].get(metric) or {}).get(stat)
+        after = (current["summary"].get(metric) or {}).get(stat)
+        change = _relative_change(before, after)
+        regressed = change is not None and change > thresholds[threshold] and after - before > floor
+        metrics[f"{metric}.{stat}"] = {"baseline": before, "current": after, "change": change,
+                                       "limit": thresholds[threshold], "regressed": regressed}
+        if regressed:
+            violations.append(f"{metric}.{stat} went from {before} to {after} ({change:+.1%}, limit {thresholds[threshold]:+.0%})")
+
+    common = sorted(set(baseline["cases"]) & set(current["cases"]))
+    changed = []
+    compared = 0
+    for case_id in common:
+        before = baseline["cases"][case_id].get("decision")
+        after = current["cases"][case_id].get("decision")
+        if before is None or after is None:
+            continue
+        compared += 1
+        if before != after:
+            changed.append({"case_id": case_id, "baseline": before, "current": after})
+    agreement = round(1 - len(changed) / compared, 4) if compared else None
+    if agreement is not None and agreement < thresholds["min_agreement"]:
+        violations.append(f"Decision agreement {agreement:.1%} is below {thresholds['min_agreement']:.0%} "
+                          f"({len(changed)} of {compared} decisions changed)")
+    error_rate = current["summary"].get("error_rate", 0.0)
+    if error_rate > thresholds["max_error_rate"]:
+        violations.append(f"Error rate {error_rate:.1%} is above {thresholds['max_error_rate']:.0%}")
+
+    return {
+        "format_version": REPORT_FORMAT_VERSION,
+        "baseline": {"created_at": baseline.get("created_at"), "base_url": baseline.get("base_url"), "corpus": baseline.get("corpus")},
+        "current": {"created_at": current.get("created_at"), "base_url": current.get("base_url"), "corpus": current.get("corpus")},
+        "same_corpus": (baseline.get("corpus") or {}).get("sha256") == (current.get("corpus") or {}).get("sha256"),
+        "thresholds": thresholds,
+        "metrics": metrics,
+        "decisions": {
+            "compared": compared,
+            "agreement": agreement,
+            "changed": changed,
+            "only_in_baseline": sorted(set(baseline["cases"]) - set(current["cases"])),
+            "only_in_current": sorted(set(current["cases"]) - set(baseline["cases"])),
+        },
+        "error_rate": error_rate,
+        "violations": violations,
+        "passed": not violations,
+    }
+
+
+# The mock analysis service on a free local port, for the duration of the
+# block. Its decisions are seeded (KDIPA_MOCK_SEED, else MOCK_SEED) so they
+# depend only on the request and mock runs can be diffed against each other.
+@contextmanager
+def local_mock():
+    import uvicorn
+
+    import mock_server
+
+    if mock_server.SEED is None:
+        mock_server.SEED = MOCK_SEED
+
+    server = uvicorn.Server(uvicorn.Config(mock_server.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="replay-mock", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("The mock analysis service did not start")
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a fixed corpus of applications and compare the run with a baseline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    corpus = sub.add_parser("corpus", help="build a corpus from the export or the submission log")
+    corpus.add_argument("out", help="corpus JSONL to write")
+    corpus.add_argument("--source", choices=("csv", "log"), default="csv")
+    corpus.add_argument("--csv", default=dataset.CSV_PATH)
+    corpus.add_argument("--samples", type=int, default=100, help="export rows to sample (csv) or latest submissions (log)")
+    corpus.add_argument("--seed", type=int, default=0)
+
+    run = sub.add_parser("run", help="replay a corpus; exits 1 when a threshold is exceeded")
+    run.add_argument("corpus", help="corpus JSONL")
+    target = run.add_mutually_exclusive_group()
+    target.add_argument("--url", help=f"analysis service base URL (default: ${api_client.BASE_URL_ENV} or the production endpoint)")
+    target.add_argument("--mock", action="store_true", help="replay against mock_server.py started on a free local port")
+    run.add_argument("--concurrency", type=int, default=1)
+    run.add_argument("--out", help="report JSON of this run, usable as a later baseline")
+    run.add_argument("--baseline", help="report JSON of an earlier run to compare with")
+    run.add_argument("--diff", help="diff report JSON (default: printed)")
+    run.add_argument("--max-latency-regression", type=float, default=DEFAULT_THRESHOLDS["latency_ratio"])
+    run.add_argument("--max-prepare-regression", type=float, default=DEFAULT_THRESHOLDS["prepare_ratio"])
+    run.add_argument("--max-bytes-regression", type=float, default=DEFAULT_THRESHOLDS["request_bytes_ratio"])
+    run.add_argument("--min-agreement", type=float, default=DEFAULT_THRESHOLDS["min_agreement"])
+    run.add_argument("--max-error-rate", type=float, default=DEFAULT_THRESHOLDS["max_error_rate"])
+    args = parser.parse_args(argv)
+
+    if args.command == "corpus":
+        cases = corpus_from_csv(args.csv, args.samples, args.seed) if args.source == "csv" else corpus_from_log(args.samples)
+        write_corpus(cases, args.out)
+        print(json.dumps({"cases": len(cases), "sha256": corpus_sha256(read_corpus(args.out)), "out": args.out}))
+        return 0
+
+    cases = read_corpus(args.corpus)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    thresholds = {
+        "latency_ratio": args.max_latency_regression,
+        "prepare_ratio": args.max_prepare_regression,
+        "request_bytes_ratio": args.max_bytes_regression,
+        "min_agreement": args.min_agreement,
+        "max_error_rate": args.max_error_rate,
+    }
+
+    def progress(done, result):
+        detail = result["decision"] or result["error"] or ""
+        print(f"[{done}/{len(cases)}] {result['case_id']} {result['status']} {result.get('latency_ms', '')} {detail}", file=sys.stderr)
+
+    with (local_mock() if args.mock else nullcontext(args.url)) as url:
+        # No retries and a breaker that never opens: every request is measured as sent
+        client = api_client.AnalysisClient(
+            url, max_retries=0, pool_size=args.concurrency,
+            breaker=api_client.CircuitBreaker(failure_threshold=float("inf"))
+        )
+        print(f"Replaying {len(cases)} cases against {client.base_url}", file=sys.stderr)
+        results, elapsed = run_corpus(cases, client, concurrency=args.concurrency, progress=progress)
+    report = build_report(cases, results, elapsed, client.base_url, corpus_path=args.corpus)
+    if args.out:
+        _write_json(args.out, report)
+
+    if baseline is None:
+        print(json.dumps(report["summary"], indent=2))
+        return 0
+    diff = diff_reports(baseline, report, thresholds)
+    if args.diff:
+        _write_json(args.diff, diff)
+    else:
+        print(json.dumps(diff, indent=2, default=str))
+    for violation in diff["violations"]:
+        print(f"REGRESSION: {violation}", file=sys.stderr)
+    return 0 if diff["passed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Fields stamped fresh on every submission; they never change the analysis
+VOLATILE_FIELDS = ("uuid", "submissionDate")
+
+
+def _canonical(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        # 100 from a CSV row and 100.0 from a number_input hash the same
+        return float(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return str(value)
+
+
+# Cache key for an /analyze-application payload: a hash of the canonical JSON
+# with the volatile application fields left out
+def payload_key(payload):
+    payload = dict(payload)
+    application_data = payload.get("application_data") or {}
+    payload["application_data"] = {k: v for k, v in application_data.items() if k not in VOLATILE_FIELDS}
+    canonical = json.dumps(_canonical(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Two-tier cache of analysis results: a small in-process LRU in front of a
+# SQLite file shared by every worker process. Entries expire after `ttl`
+# seconds; the LRU is bounded by entry count and the SQLite tier by the total
+# size of the stored results (least recently used rows go first). Both tiers
+# hold the encoded JSON, so every get() returns a fresh copy that callers may
+# change without touching what other sessions read.
+class ResultCache:
+    def __init__(self, path, ttl=24 * 3600, memory_entries=256, max_disk_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "evictions": 0, "expired": 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.metrics["memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+                self.metrics["expired"] += 1
+
+            row = self._db.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.metrics["misses"] += 1
+                return None
+            value, created = row
+            if now - created > self.ttl:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.metrics["expired"] += 1
+                self.metrics["misses"] += 1
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._remember(key, created, value)
+            self.metrics["disk_hits"] += 1
+            return json.loads(value)
+
+    def put(self, key, value):
+        now = time.time()
+        encoded = json.dumps(value)
+        with self._lock:
+            self._remember(key, now, encoded)
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), now, now)
+            )
+            self.metrics["puts"] += 1
+            self._evict_disk(now)
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def _evict_disk(self, now):
+        expired = self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,)).rowcount
+        self.metrics["expired"] += max(expired, 0)
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        while total > self.max_disk_bytes:
+            row = self._db.execute("SELECT key, size FROM results ORDER BY accessed LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.metrics["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM results")
+
+    def stats(self):
+        with self._lock:
+            disk_entries, disk_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+            hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+            lookups = hits + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Process-wide cache shared by every Streamlit session
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(
+                os.environ.get("KDIPA_RESULT_CACHE_PATH", os.path.join(".cache", "results.sqlite")),
+                ttl=float(os.environ.get("KDIPA_RESULT_CACHE_TTL", 24 * 3600)),
+                memory_entries=int(os.environ.get("KDIPA_RESULT_CACHE_ENTRIES", 256)),
+                max_disk_bytes=int(os.environ.get("KDIPA_RESULT_CACHE_BYTES", 64 * 1024 * 1024))
+            )
+        return _cache
@@ -0,0 +1,223 @@
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# A pre-screening rule. `check(cols, params)` returns a boolean array that is True
+# for every application violating the rule, computed over whole columns at once;
+# `message(record, params)` explains the violation for a single application.
+# Rules with severity "reject" mark applications that cannot be valid and are
+# refused before the remote analysis call; "warn" rules are only reported.
+Rule = namedtuple("Rule", ["name", "check", "message", "severity"])
+
+# Thresholds used by the default rules; override per RuleSet
+DEFAULT_PARAMS = {
+    "share_value_tolerance": 0.05,
+    "investment_ratio": 1.5,
+    "max_percentage": 100.0,
+}
+
+FINANCIAL_FIELDS = [
+    "cashAmount", "contributionAmount", "totalCapitalAmount",
+    "capitalExpenditure", "operatingExpense", "fixedAssets",
+    "totalInvestmentValue", "shareValue", "valueOfEquityOrShares",
+    "percentageOfEquityOrShares", "numberOfEquityOrShares"
+]
+
+
+# Column access shared by DataFrames and single form dicts, so one rule
+# definition serves a whole-file audit and the per-submission check. A dict
+# yields NumPy scalars rather than 1-element arrays, which keeps a single check
+# in the microsecond range. Missing numbers read as 0, like form_data.get(field, 0).
+class Columns:
+    def __init__(self, data):
+        self._data = data
+        self._is_frame = isinstance(data, pd.DataFrame)
+        self.size = len(data) if self._is_frame else 1
+        self._cache = {}
+
+    def num(self, name):
+        key = ("num", name)
+        if key not in self._cache:
+            if self._is_frame:
+                values = self._data[name] if name in self._data.columns else pd.Series(0.0, index=self._data.index)
+                values = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                try:
+                    value = float(self._data.get(name) or 0)
+                except (TypeError, ValueError):
+                    value = 0.0
+                self._cache[key] = np.float64(0.0 if value != value else value)
+                return self._cache[key]
+            self._cache[key] = np.nan_to_num(values, nan=0.0)
+        return self._cache[key]
+
+    # True where the field is absent or empty
+    def missing(self, name):
+        key = ("missing", name)
+        if key not in self._cache:
+            if self._is_frame:
+                if name not in self._data.columns:
+                    values = np.ones(self.size, dtype=bool)
+                else:
+                    column = self._data[name]
+                    values = (column.isna() | (column.astype("string") == "")).to_numpy(dtype=bool, na_value=True)
+            else:
+                value = self._data.get(name)
+                values = np.bool_(not value or (isinstance(value, float) and np.isnan(value)))
+            self._cache[key] = values
+        return self._cache[key]
+
+
+def _required(field):
+    label = field.replace("company", "Company ").replace("shareholder", "Shareholder ")
+    return Rule(
+        f"required_{field}",
+        lambda cols, params: cols.missing(field),
+        lambda record, params: f"{label} is required.",
+        "warn"
+    )
+
+
+def _share_value_check(cols, params):
+    count, price, declared = cols.num("numberOfEquityOrShares"), cols.num("shareValue"), cols.num("valueOfEquityOrShares")
+    calculated = count * price
+    return (count > 0) & (price > 0) & (np.abs(calculated - declared) / (calculated + 0.01) > params["share_value_tolerance"])
+
+
+def _share_value_message(record, params):
+    calculated_value = record.get("numberOfEquityOrShares", 0) * record.get("shareValue", 0)
+    declared_value = record.get("valueOfEquityOrShares", 0)
+    return (f"Share value discrepancy detected: {record.get('numberOfEquityOrShares')} shares × "
+            f"{record.get('shareValue')} KWD per share = {calculated_value} KWD, but declared value is {declared_value} KWD.")
+
+
+def _investment_check(cols, params):
+    total, spend = cols.num("totalInvestmentValue"), cols.num("capitalExpenditure") + cols.num("operatingExpense")
+    return (total > 0) & (spend > 0) & (spend > total * params["investment_ratio"])
+
+
+def _investment_message(record, params):
+    return (f"Total investment value ({record.get('totalInvestmentValue', 0)} KWD) seems inconsistent with capital "
+            f"expenditure ({record.get('capitalExpenditure', 0)} KWD) and operating expenses ({record.get('operatingExpense', 0)} KWD).")
+
+
+def _negative_check(cols, params):
+    violation = False
+    for field in FINANCIAL_FIELDS:
+        violation = violation | (cols.num(field) < 0)
+    return violation
+
+
+def _negative_message(record, params):
+    fields = [field for field in FINANCIAL_FIELDS if isinstance(record.get(field), (int, float)) and record[field] < 0]
+    return f"Financial amounts cannot be negative: {', '.join(fields)}."
+
+
+# The form validation checks, with the messages the form has always shown
+VALIDATION_RULES = [
+    _required("companyName"),
+    _required("companyOrigin"),
+    _required("shareholderCompanyPartnerName"),
+    _required("shareholderNationality"),
+    Rule("share_value_discrepancy", _share_value_check, _share_value_message, "warn"),
+    Rule(
+        "percentage_over_limit",
+        lambda cols, params: cols.num("percentageOfEquityOrShares") > params["max_percentage"],
+        lambda record, params: f"Percentage of equity/shares cannot exceed {params['max_percentage']:g}%.",
+        "reject"
+    ),
+    Rule("investment_inconsistent", _investment_check, _investment_message, "warn"),
+]
+
+DEFAULT_RULES = VALIDATION_RULES + [
+    Rule("negative_amount", _negative_check, _negative_message, "reject"),
+    Rule(
+        "contribution_exceeds_capital",
+        lambda cols, params: (cols.num("totalCapitalAmount") > 0) &
+                             (cols.num("contributionAmount") > cols.num("totalCapitalAmount")),
+        lambda record, params: (f"Contribution amount ({record.get('contributionAmount', 0)} KWD) exceeds the total "
+                                f"capital ({record.get('totalCapitalAmount', 0)} KWD)."),
+        "warn"
+    ),
+]
+
+
+# An ordered set of rules; rule i owns bit i of the violation mask
+class RuleSet:
+    def __init__(self, rules=None, params=None):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        if len(self.rules) > 64:
+            raise ValueError("A RuleSet holds at most 64 rules")
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.bits = {rule.name: np.uint64(1) << np.uint64(i) for i, rule in enumerate(self.rules)}
+        self.reject_mask = np.uint64(0)
+        for rule in self.rules:
+            if rule.severity == "reject":
+                self.reject_mask |= self.bits[rule.name]
+
+    # Per-application violation bitmasks for a DataFrame (or one form dict)
+    def evaluate(self, data):
+        cols = Columns(data)
+        if not isinstance(data, pd.DataFrame):
+            mask = 0
+            for i, rule in enumerate(self.rules):
+                if rule.check(cols, self.params):
+                    mask |= 1 << i
+            return np.array([mask], dtype=np.uint64)
+        masks = np.zeros(cols.size, dtype=np.uint64)
+        for rule in self.rules:
+            masks |= np.where(rule.check(cols, self.params), self.bits[rule.name], np.uint64(0))
+        return masks
+
+    def rules_in(self, mask):
+        mask = np.uint64(mask)
+        return [rule for rule in self.rules if mask & self.bits[rule.name]]
+
+    # (rule, message) for every rule a single application violates
+    def check(self, record):
+        return [(rule, rule.message(record, self.params)) for rule in self.rules_in(self.evaluate(record)[0])]
+
+    def is_rejected(self, mask):
+        return bool(np.uint64(mask) & self.reject_mask)
+
+    # One boolean column per rule, indexed like the input frame
+    def violations(self, frame):
+        masks = self.evaluate(frame)
+        return pd.DataFrame(
+            {rule.name: (masks & self.bits[rule.name]) != 0 for rule in self.rules},
+            index=frame.index
+        )
+
+    # Violation counts per rule over a whole frame
+    def audit(self, frame):
+        table = self.violations(frame)
+        return pd.DataFrame({
+            "severity": [rule.severity for rule in self.rules],
+            "violations": table.sum().to_numpy(),
+            "share": (table.mean() if len(table) else table.sum()).to_numpy(),
+        }, index=table.columns)
+
+
+DEFAULT_RULESET = RuleSet()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit an application export against the pre-screening rules")
+    parser.add_argument("--csv", default="kdipa_arf.csv")
+    args = parser.parse_args()
+
+    import dataset
+
+    frame = dataset.load_dataset(args.csv)
+    started = time.perf_counter()
+    audit = DEFAULT_RULESET.audit(frame)
+    elapsed = time.perf_counter() - started
+    print(audit.to_string())
+    print(f"{len(frame)} applications screened in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
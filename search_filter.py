@@ -0,0 +1,313 @@
+import re
+from datetime import datetime, time, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+# Index fields the similar-application search can be narrowed by, with their
+# labels in the form. They carry the export's column names.
+FILTER_FIELDS = [
+    ("name_sector", "Sector"),
+    ("name_activity", "Activity"),
+    ("licenseType", "License type"),
+    ("companyOrigin", "Country of origin"),
+]
+DATE_FIELD = "submissionDate"
+FIELD_TYPES = {**{field: "string" for field, _ in FILTER_FIELDS}, DATE_FIELD: "datetime"}
+# Operators allowed per field type; ordering strings makes no sense for these fields
+OPERATORS = {"string": ("eq", "ne"), "datetime": ("eq", "ne", "gt", "ge", "lt", "le")}
+
+# Range of the top_similar payload field
+MIN_TOP_SIMILAR = 1
+MAX_TOP_SIMILAR = 10
+
+# Longest filter sent to the service
+MAX_FILTER_LENGTH = 8000
+IN_DELIMITER = "|"
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<datetime>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:\d{2}))
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)
+  | (?P<punct>[(),])
+""", re.VERBOSE)
+_KEYWORDS = {"true": True, "false": False, "null": None}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _datetime_literal(value):
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# OData filter (Azure AI Search syntax) for the selected values of each
+# FILTER_FIELDS field and an inclusive submission date range; None when
+# nothing is selected. Values of one field are ORed, fields are ANDed.
+def build_filter(values=None, date_from=None, date_to=None):
+    clauses = []
+    for field, _ in FILTER_FIELDS:
+        selected = [str(value) for value in (values or {}).get(field) or ()]
+        if not selected:
+            continue
+        if len(selected) == 1:
+            clauses.append(f"{field} eq {_quote(selected[0])}")
+        elif any(IN_DELIMITER in value for value in selected):
+            clauses.append("(" + " or ".join(f"{field} eq {_quote(value)}" for value in selected) + ")")
+        else:
+            clauses.append(f"search.in({field}, {_quote(IN_DELIMITER.join(selected))}, {_quote(IN_DELIMITER)})")
+    if date_from is not None:
+        start = datetime.combine(date_from, time.min, tzinfo=timezone.utc)
+        clauses.append(f"{DATE_FIELD} ge {_datetime_literal(start)}")
+    if date_to is not None:
+        end = datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        clauses.append(f"{DATE_FIELD} lt {_datetime_literal(end)}")
+    return " and ".join(clauses) or None
+
+
+def _tokenize(expr):
+    tokens = []
+    position = 0
+    while position < len(expr):
+        match = _TOKEN_RE.match(expr, position)
+        if match is None:
+            raise FilterError(f"Unexpected character {expr[position]!r} at position {position}")
+        kind = match.lastgroup
+        if kind != "space":
+            tokens.append((kind, match.group(), position))
+        position = match.end()
+    tokens.append(("end", "", position))
+    return tokens
+
+
+# Recursive-descent parser for the subset of OData used by the search:
+# comparisons, search.in(), and/or/not and parentheses. Produces nested tuples:
+# ("or"|"and", [nodes]), ("not", node), ("cmp", field, op, value), ("in", field, [values])
+class _Parser:
+    def __init__(self, expr):
+        self.tokens = _tokenize(expr)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, kind, text=None, description=None):
+        token = self.next()
+        if token[0] != kind or (text is not None and token[1] != text):
+            raise FilterError(f"Expected {description or repr(text)} at position {token[2]}, "
+                              f"found {token[1] or 'end of filter'!r}")
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        token = self.peek()
+        if token[0] != "end":
+            raise FilterError(f"Unexpected {token[1]!r} at position {token[2]}")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek()[:2] == ("name", "or"):
+            self.next()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek()[:2] == ("name", "and"):
+            self.next()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not(self):
+        if self.peek()[:2] == ("name", "not"):
+            self.next()
+            return ("not", self.parse_not())
+        if self.peek()[:2] == ("punct", "("):
+            self.next()
+            node = self.parse_or()
+            self.expect("punct", ")")
+            return node
+        return self.parse_predicate()
+
+    def field(self):
+        token = self.expect("name", description="a field name")
+        if token[1] not in FIELD_TYPES:
+            raise FilterError(f"Unknown field {token[1]!r} at position {token[2]}; "
+                              f"filterable fields are {', '.join(FIELD_TYPES)}")
+        return token[1]
+
+    def literal(self, field):
+        kind, text, position = self.next()
+        field_type = FIELD_TYPES[field]
+        if kind == "name" and text in _KEYWORDS:
+            if _KEYWORDS[text] is not None:
+                raise FilterError(f"{field} cannot be compared with {text} (position {position})")
+            return None
+        if field_type == "string" and kind == "string":
+            return text[1:-1].replace("''", "'")
+        if field_type == "datetime" and kind == "datetime":
+            try:
+                return datetime.fromisoformat(text.replace("Z", "+00:00"))
+            except ValueError:
+                raise FilterError(f"Invalid date-time {text!r} at position {position}")
+        expected = "a quoted string" if field_type == "string" else "a date-time such as 2024-01-31T00:00:00Z"
+        raise FilterError(f"{field} must be compared with {expected}, found {text or 'end of filter'!r} at position {position}")
+
+    def parse_predicate(self):
+        token = self.peek()
+        if token[:2] == ("name", "search.in"):
+            self.next()
+            self.expect("punct", "(")
+            field = self.field()
+            if FIELD_TYPES[field] != "string":
+                raise FilterError(f"search.in() only applies to text fields, not {field}")
+            self.expect("punct", ",")
+            values = self.expect("string", description="a quoted list of values")[1][1:-1].replace("''", "'")
+            delimiters = " ,"
+            if self.peek()[:2] == ("punct", ","):
+                self.next()
+                delimiters = self.expect("string", description="quoted delimiters")[1][1:-1].replace("''", "'")
+                if not delimiters:
+                    raise FilterError("search.in() delimiters cannot be empty")
+            self.expect("punct", ")")
+            items = [value for value in re.split("[" + re.escape(delimiters) + "]", values) if value]
+            if not items:
+                raise FilterError(f"search.in() on {field} has no values")
+            return ("in", field, items)
+        field = self.field()
+        op = self.expect("name", description="an operator")
+        allowed = OPERATORS[FIELD_TYPES[field]]
+        if op[1] not in allowed:
+            raise FilterError(f"Operator {op[1]!r} at position {op[2]} is not allowed for {field} "
+                              f"(use {', '.join(allowed)})")
+        return ("cmp", field, op[1], self.literal(field))
+
+
+# Syntax tree of a filter, raising FilterError when it is malformed, uses an
+# unknown field or compares a field with the wrong type of value
+def parse_filter(expr):
+    if not isinstance(expr, str) or not expr.strip():
+        raise FilterError("The filter is empty")
+    if len(expr) > MAX_FILTER_LENGTH:
+        raise FilterError(f"The filter is longer than {MAX_FILTER_LENGTH} characters")
+    return _Parser(expr).parse()
+
+
+# Problems with a filter as messages, empty when it can be sent
+def validate_filter(expr):
+    try:
+        parse_filter(expr)
+    except FilterError as e:
+        return [str(e)]
+    return []
+
+
+def validate_top_similar(top_similar):
+    if isinstance(top_similar, bool) or not isinstance(top_similar, int) \
+            or not MIN_TOP_SIMILAR <= top_similar <= MAX_TOP_SIMILAR:
+        return [f"top_similar must be a whole number from {MIN_TOP_SIMILAR} to {MAX_TOP_SIMILAR}"]
+    return []
+
+
+def _as_datetime(value):
+    if value is None or value is pd.NaT or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, str):
+        value = pd.Timestamp(value)
+    if isinstance(value, datetime):
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+_COMPARE = {
+    "eq": lambda a, b: a == b, "ne": lambda a, b: a != b,
+    "gt": lambda a, b: a > b, "ge": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b, "le": lambda a, b: a <= b,
+}
+
+
+# Whether a record (dict of field values) satisfies a parsed filter; lets the
+# mock service and local tools apply the same filters as the search index
+def matches(node, record):
+    kind = node[0]
+    if kind == "or":
+        return any(matches(child, record) for child in node[1])
+    if kind == "and":
+        return all(matches(child, record) for child in node[1])
+    if kind == "not":
+        return not matches(node[1], record)
+    if kind == "in":
+        return record.get(node[1]) in node[2]
+    _, field, op, value = node
+    actual = record.get(field)
+    if FIELD_TYPES[field] == "datetime":
+        actual = _as_datetime(actual)
+    elif actual is not None and actual == actual:
+        actual = str(actual)
+    else:
+        actual = None
+    if value is None or actual is None:
+        return _COMPARE[op](actual, value) if op in ("eq", "ne") else False
+    return _COMPARE[op](actual, value)
+
+
+# Boolean row mask of a DataFrame for a parsed filter, the vectorized
+# counterpart of matches(); missing columns count as null
+def mask(node, frame):
+    kind = node[0]
+    if kind in ("or", "and"):
+        masks = [mask(child, frame) for child in node[1]]
+        return np.logical_or.reduce(masks) if kind == "or" else np.logical_and.reduce(masks)
+    if kind == "not":
+        return ~mask(node[1], frame)
+    field = node[1]
+    if field not in frame.columns:
+        column = pd.Series([None] * len(frame), index=frame.index, dtype=object)
+    else:
+        column = frame[field]
+    if FIELD_TYPES[field] == "datetime":
+        column = pd.to_datetime(column, errors="coerce", utc=True)
+    else:
+        column = column.astype("string")
+    if kind == "in":
+        return column.isin(node[2]).fillna(False).to_numpy(dtype=bool)
+    _, _, op, value = node
+    if value is None:
+        missing = column.isna().to_numpy(dtype=bool)
+        return missing if op == "eq" else ~missing if op == "ne" else np.zeros(len(frame), dtype=bool)
+    if FIELD_TYPES[field] == "datetime":
+        value = pd.Timestamp(value)
+    # A missing value differs from every value and compares false otherwise
+    return _COMPARE[op](column, value).fillna(op == "ne").to_numpy(dtype=bool)
+
+
+# Choices for the filter builder from the distinct values of the export:
+# values per FILTER_FIELDS field, the activities of each sector and the range
+# of submission dates
+def filter_options(df):
+    options = {"values": {}, "activities_by_sector": {}, "date_range": None}
+    for field, _ in FILTER_FIELDS:
+        if field in df.columns:
+            options["values"][field] = sorted(df[field].dropna().astype(str).unique().tolist())
+    if "name_sector" in df.columns and "name_activity" in df.columns:
+        pairs = df[["name_sector", "name_activity"]].dropna().astype(str).drop_duplicates()
+        for sector, group in pairs.groupby("name_sector"):
+            options["activities_by_sector"][sector] = sorted(group["name_activity"].tolist())
+    if DATE_FIELD in df.columns:
+        dates = pd.to_datetime(df[DATE_FIELD], errors="coerce", utc=True).dropna()
+        if len(dates):
+            options["date_range"] = (dates.min().date(), dates.max().date())
+    return options
@@ -0,0 +1,232 @@
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import analysis_jobs
+import result_cache
+import rules
+import tokens
+from application import build_analysis_payload
+
+# Fields analysts vary to see whether the Decision flips
+SENSITIVITY_FIELDS = ["totalInvestmentValue", "percentageOfEquityOrShares", "shareholderNationality"]
+# Choices offered for the numeric fields
+INVESTMENT_MULTIPLIERS = [0.25, 0.5, 0.75, 1.5, 2.0, 4.0]
+EQUITY_PERCENTAGES = [10.0, 25.0, 49.0, 50.0, 51.0, 75.0, 100.0]
+# Largest grid, counted in distinct payloads, one run may send
+MAX_VARIANTS = int(os.environ.get("KDIPA_SENSITIVITY_MAX_VARIANTS", 48))
+# Whole results only; sections of a variant are not shown as they stream
+JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+# Variant requests of every session share this pool, so a large grid cannot
+# starve the single analyses running on the analysis_jobs pool
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("KDIPA_SENSITIVITY_CONCURRENCY", 8)),
+    thread_name_prefix="sensitivity"
+)
+
+# Variant states
+PENDING = "pending"
+OK = "ok"
+CACHED = "cached"
+REJECTED = "rejected"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (OK, CACHED, REJECTED, ERROR, CANCELLED)
+
+
+# Axes for build_grid from the values an analyst wants to try instead of the
+# application's own. Each axis keeps the application's value too, so every row
+# and column of the matrix has its baseline.
+def grid_axes(application_data, multipliers=(), percentages=(), nationalities=()):
+    axes = {}
+    if multipliers:
+        base = float(application_data.get("totalInvestmentValue") or 0)
+        axes["totalInvestmentValue"] = sorted({base, *(round(base * m, 2) for m in multipliers)})
+    if percentages:
+        base = float(application_data.get("percentageOfEquityOrShares") or 0)
+        axes["percentageOfEquityOrShares"] = sorted({base, *(float(p) for p in percentages)})
+    if nationalities:
+        base = application_data.get("shareholderNationality")
+        axes["shareholderNationality"] = ([base] if base else []) + [n for n in nationalities if n != base]
+    return axes
+
+
+# Grid cells for every combination of the `axes` values ({field: [values]}),
+# and the distinct payloads behind them keyed by their result cache key.
+# Cells that only differ in ways the payload does not (a multiplier of a zero
+# investment, a value equal to the form's) share one payload. The unmodified
+# application is always among the payloads, as the baseline.
+def build_grid(application_data, axes, filter_expr=None, top_similar=3):
+    fields = [field for field, values in axes.items() if values]
+    variants = {}
+
+    def variant_key(overrides):
+        data = {**application_data, **overrides, "uuid": str(uuid.uuid4())}
+        payload = build_analysis_payload(data, filter_expr=filter_expr, top_similar=top_similar)
+        key = result_cache.payload_key(payload)
+        if key not in variants:
+            variants[key] = {
+                "key": key,
+                "application_data": data,
+                "payload": payload,
+                "state": PENDING,
+                "decision": None,
+                "result": None,
+                "error": None,
+                "duration_ms": None,
+            }
+        return key
+
+    base_key = variant_key({})
+    cells = [
+        {"overrides": dict(zip(fields, combo)), "key": variant_key(dict(zip(fields, combo)))}
+        for combo in itertools.product(*(axes[field] for field in fields))
+    ]
+    return fields, cells, variants, base_key
+
+
+# One what-if run: the grid of variants of an application, each distinct
+# payload analysed once, concurrently on the shared sensitivity pool.
+# Variants that pre-screening rejects, that are over the token budget or
+# whose result is already cached finish without a request.
+class SensitivityRun:
+    def __init__(self, application_data, axes, filter_expr=None, top_similar=3, client=None, cache=None):
+        self.fields, self.cells, self.variants, self.base_key = build_grid(
+            application_data, axes, filter_expr=filter_expr, top_similar=top_similar
+        )
+        if len(self.variants) > MAX_VARIANTS:
+            raise ValueError(f"{len(self.variants)} distinct variants, more than the limit of {MAX_VARIANTS}")
+        self.application_data = application_data
+        self.client = client
+        self.cache = cache
+        self.started = None
+        self.elapsed = None
+        self._jobs = {}
+        self._finished = queue.Queue()
+        self._collected = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.variants)
+
+    def _finish(self, variant, state, result=None, error=None):
+        variant.update(state=state, result=result, error=error)
+        if result is not None:
+            variant["decision"] = (result.get("analysis_result") or {}).get("Decision")
+
+    def start(self):
+        self.started = time.perf_counter()
+        for key, variant in self.variants.items():
+            rejected = [message for rule, message in rules.DEFAULT_RULESET.check(variant["application_data"])
+                        if rule.severity == "reject"]
+            estimate = tokens.estimate_prompt_tokens(variant["payload"])
+            cached = self.cache.get(key) if self.cache is not None else None
+            if rejected:
+                self._finish(variant, REJECTED, error=" ".join(rejected))
+            elif cached is not None:
+                self._finish(variant, CACHED, result=cached)
+            elif tokens.over_budget(estimate):
+                self._finish(variant, REJECTED, error=f"Estimated prompt of {estimate['tokens']:,} tokens is over the budget")
+            else:
+                job = analysis_jobs.AnalysisJob(variant["payload"], headers=JSON_HEADERS, client=self.client)
+                with self._lock:
+                    self._jobs[key] = job
+                job.start(_EXECUTOR)
+                job.add_done_callback(lambda _, key=key: self._finished.put(key))
+                continue
+            self._finished.put(key)
+        return self
+
+    # Turn a finished job into the variant's result (on the caller's thread)
+    def _collect(self, key):
+        variant = self.variants[key]
+        job = self._jobs.get(key)
+        if job is None:
+            return variant
+        variant["duration_ms"] = job.duration_ms
+        if job.cancelled or not job.done():
+            self._finish(variant, CANCELLED)
+        elif job.error is not None:
+            self._finish(variant, ERROR, error=f"{type(job.error).__name__}: {job.error}")
+        elif job.status_code != 200:
+            self._finish(variant, ERROR, error=f"HTTP {job.status_code}: {job.text[:200]}")
+        else:
+            try:
+                result = job.json()
+            except ValueError as e:
+                self._finish(variant, ERROR, error=f"Invalid response: {e}")
+            else:
+                if self.cache is not None:
+                    self.cache.put(key, result)
+                self._finish(variant, OK, result=result)
+        return variant
+
+    # Yield each variant as it finishes, in completion order
+    def as_completed(self, timeout=None):
+        while self._collected < len(self.variants):
+            try:
+                key = self._finished.get(timeout=timeout)
+            except queue.Empty:
+                return
+            self._collected += 1
+            yield self._collect(key)
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self.started
+
+    def cancel(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+
+    def done(self):
+        return all(variant["state"] in FINISHED_STATES for variant in self.variants.values())
+
+    @property
+    def base_decision(self):
+        return self.variants[self.base_key]["decision"]
+
+    # Time the requests would have taken one after another
+    def sequential_ms(self):
+        return sum(variant["duration_ms"] or 0 for variant in self.variants.values())
+
+    # One row per grid cell: the varied values, the decision (or state while
+    # it is not known) and whether it differs from the unmodified application
+    def table(self):
+        base = self.base_decision
+        rows = []
+        for cell in self.cells:
+            variant = self.variants[cell["key"]]
+            decision = variant["decision"]
+            rows.append({
+                **cell["overrides"],
+                "Decision": decision or variant["state"],
+                "Flipped": decision is not None and base is not None and decision != base,
+                "Error": variant["error"],
+            })
+        return pd.DataFrame(rows, columns=[*self.fields, "Decision", "Flipped", "Error"])
+
+    # Decisions with the first varied field down the side and every
+    # combination of the others across the top
+    def matrix(self, format_value=None):
+        table = self.table()
+        if table.empty:
+            return table
+        format_value = format_value or (lambda field, value: value)
+        for field in self.fields:
+            table[field] = [format_value(field, value) for value in table[field]]
+        if len(self.fields) == 1:
+            return table.set_index(self.fields[0])[["Decision"]]
+        columns = table[self.fields[1:]].astype(str).agg(" / ".join, axis=1)
+        table = table.assign(_column=columns)
+        matrix = table.pivot_table(index=self.fields[0], columns="_column", values="Decision", aggfunc="first", sort=False)
+        matrix.columns.name = " / ".join(self.fields[1:])
+        return matrix
@@ -0,0 +1,340 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import search_filter
+from ann_index import IVFIndex
+
+# Columns used to describe an application in the similarity space
+CATEGORICAL_COLUMNS = ["name_sector", "name_activity", "shareholderNationality"]
+FINANCIAL_COLUMNS = [
+    "cashAmount", "contributionAmount", "totalCapitalAmount",
+    "capitalExpenditure", "operatingExpense", "fixedAssets",
+    "totalInvestmentValue"
+]
+TEXT_COLUMN = "companyOutput"
+
+# Relative weight of each feature block in the final cosine similarity
+DEFAULT_WEIGHTS = {"categorical": 1.0, "financial": 1.0, "text": 1.0}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this
+to will with we our which their they be been company companies
+""".split())
+
+
+def tokenize(text):
+    if not isinstance(text, str):
+        return []
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in _STOP_WORDS]
+
+
+# Minimal TF-IDF over a capped vocabulary (most frequent terms by document frequency)
+class TfidfVectorizer:
+    def __init__(self, max_features=512):
+        self.max_features = max_features
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+
+    def fit(self, texts):
+        docs = [set(tokenize(t)) for t in texts]
+        df_counts = Counter(term for doc in docs for term in doc)
+        terms = sorted(df_counts, key=lambda t: (-df_counts[t], t))[:self.max_features]
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        n_docs = max(len(docs), 1)
+        self.idf = np.array(
+            [math.log((1 + n_docs) / (1 + df_counts[t])) + 1.0 for t in terms],
+            dtype=np.float32
+        )
+        return self
+
+    def transform(self, texts):
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, count in Counter(tokenize(text)).items():
+                col = self.vocabulary.get(term)
+                if col is not None:
+                    matrix[row, col] = count
+        matrix *= self.idf
+        return _normalize_rows(matrix)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+# In-process k-nearest-neighbour search over historical applications.
+# Every application becomes one row of a dense float32 matrix made of three
+# unit-normalised blocks (one-hot categoricals, standardised log financials and
+# TF-IDF of companyOutput), so a query is a single matrix-vector product.
+class SimilarityEngine:
+    def __init__(self, df, max_text_features=256, weights=None):
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        if "uuid" in df.columns:
+            df = df.drop_duplicates(subset="uuid")
+        self.corpus = df.reset_index(drop=True)
+
+        # Fit encoders on the corpus
+        self.categories = {
+            col: pd.Index(sorted(self.corpus[col].dropna().astype(str).str.strip().unique()))
+            for col in CATEGORICAL_COLUMNS if col in self.corpus.columns
+        }
+        logs = self._log_financials(self.corpus)
+        self.financial_mean = np.nanmean(logs, axis=0) if len(logs) else np.zeros(len(FINANCIAL_COLUMNS))
+        self.financial_std = np.nanstd(logs, axis=0) if len(logs) else np.ones(len(FINANCIAL_COLUMNS))
+        self.financial_mean = np.nan_to_num(self.financial_mean)
+        self.financial_std = np.where(np.nan_to_num(self.financial_std) > 0, self.financial_std, 1.0)
+        self.text_vectorizer = TfidfVectorizer(max_text_features).fit(
+            self._column(self.corpus, TEXT_COLUMN).tolist()
+        )
+
+        self.category_positions = {
+            col: {value: i for i, value in enumerate(categories)}
+            for col, categories in self.categories.items()
+        }
+        self.uuids = self._column(self.corpus, "uuid").to_numpy()
+
+        self.matrix = self.encode(self.corpus)
+        self.index = None
+        # Applications submitted after the engine was built, kept out of the
+        # corpus matrix and uuid array so an insert never copies them
+        self._added = []
+        self._added_vectors = []
+        self._added_uuids = []
+        self._added_positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path="kdipa_arf.csv", **kwargs):
+        return cls(dataset.load_dataset(path), **kwargs)
+
+    def __len__(self):
+        return len(self.corpus) + len(self._added)
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1]
+
+    # Identifies the corpus and fitted encoders, so a persisted index is only
+    # reused with vectors produced by an identical engine
+    @property
+    def fingerprint(self):
+        digest = hashlib.sha1()
+        digest.update(json.dumps({
+            "rows": len(self.corpus),
+            "vocabulary": sorted(self.text_vectorizer.vocabulary),
+            "categories": {col: list(values) for col, values in self.categories.items()},
+            "weights": self.weights,
+        }, sort_keys=True).encode())
+        digest.update("\n".join(map(str, self.uuids)).encode())
+        return digest.hexdigest()
+
+    # Build an approximate index over the corpus matrix (see ann_index.IVFIndex)
+    def build_index(self, **kwargs):
+        return IVFIndex.build(self.matrix, **kwargs)
+
+    # Route searches through an ANN index instead of the brute-force matrix product
+    def attach_index(self, index):
+        if index.dim != self.dimension:
+            raise ValueError(f"Index dimension {index.dim} does not match engine dimension {self.dimension}")
+        if len(index) != len(self.corpus):
+            raise ValueError(f"Index holds {len(index)} vectors but the corpus has {len(self.corpus)} rows")
+        with self._lock:
+            if self._added_vectors:
+                index.add(np.vstack(self._added_vectors), np.arange(len(self.corpus), len(self)))
+            self.index = index
+
+    # Reuse the index saved in `directory` when it was built from this exact
+    # corpus; otherwise build and save one once the corpus is large enough for
+    # brute force to matter. Returns the attached index or None.
+    def use_persistent_index(self, directory, min_rows=20000, rebuild=False):
+        meta_path = os.path.join(directory, "meta.json")
+        if not rebuild and os.path.exists(meta_path) and \
+                IVFIndex.read_metadata(directory).get("fingerprint") == self.fingerprint:
+            index = IVFIndex.load(directory)
+        elif rebuild or len(self.corpus) >= min_rows:
+            index = self.build_index()
+            index.save(directory, metadata={"fingerprint": self.fingerprint})
+        else:
+            return None
+        self.attach_index(index)
+        return index
+
+    # Make a newly submitted application searchable without rebuilding
+    # anything. An application already added (same uuid) keeps its position.
+    def add_application(self, application_data):
+        uuid = application_data.get("uuid")
+        vector = self.encode_application(application_data)
+        with self._lock:
+            if uuid is not None and uuid in self._added_positions:
+                return self._added_positions[uuid]
+            position = len(self)
+            self._added.append(dict(application_data))
+            self._added_uuids.append(uuid)
+            if uuid is not None:
+                self._added_positions[uuid] = position
+            self._added_vectors.append(vector)
+            if self.index is not None:
+                self.index.add(vector[None, :], [position])
+        return position
+
+    @staticmethod
+    def _column(frame, column):
+        if column in frame.columns:
+            return frame[column]
+        return pd.Series([None] * len(frame), index=frame.index, dtype=object)
+
+    def _log_financials(self, frame):
+        values = np.column_stack([
+            pd.to_numeric(self._column(frame, col), errors="coerce").to_numpy(dtype=np.float64)
+            for col in FINANCIAL_COLUMNS
+        ]) if len(frame) else np.zeros((0, len(FINANCIAL_COLUMNS)))
+        return np.log1p(np.clip(values, 0, None))
+
+    def _encode_categorical(self, frame):
+        blocks = []
+        for col, categories in self.categories.items():
+            block = np.zeros((len(frame), len(categories)), dtype=np.float32)
+            values = self._column(frame, col).astype("string").str.strip()
+            codes = categories.get_indexer(values.fillna(""))
+            rows = np.flatnonzero(codes >= 0)
+            block[rows, codes[rows]] = 1.0
+            blocks.append(block)
+        if not blocks:
+            return np.zeros((len(frame), 0), dtype=np.float32)
+        return _normalize_rows(np.hstack(blocks))
+
+    def _encode_financial(self, frame):
+        scaled = (self._log_financials(frame) - self.financial_mean) / self.financial_std
+        # Missing amounts sit at the corpus mean and so contribute nothing
+        return _normalize_rows(np.nan_to_num(scaled).astype(np.float32))
+
+    # Encode a frame of applications (CSV rows or submitted application_data)
+    def encode(self, frame):
+        blocks = [
+            self._encode_categorical(frame) * math.sqrt(self.weights["categorical"]),
+            self._encode_financial(frame) * math.sqrt(self.weights["financial"]),
+            self.text_vectorizer.transform(self._column(frame, TEXT_COLUMN).tolist()) * math.sqrt(self.weights["text"]),
+        ]
+        return _normalize_rows(np.hstack(blocks).astype(np.float32))
+
+    # Single-record fast path of encode() that avoids building a DataFrame per query
+    def encode_application(self, application_data):
+        categorical = []
+        for col, positions in self.category_positions.items():
+            block = np.zeros(len(positions), dtype=np.float32)
+            value = application_data.get(col)
+            index = positions.get(str(value).strip()) if value is not None else None
+            if index is not None:
+                block[index] = 1.0
+            categorical.append(block)
+        categorical = _normalize_rows(np.concatenate(categorical or [np.zeros(0, dtype=np.float32)])[None, :])
+
+        amounts = np.array([
+            _to_float(application_data.get(col)) for col in FINANCIAL_COLUMNS
+        ], dtype=np.float64)
+        scaled = (np.log1p(np.clip(amounts, 0, None)) - self.financial_mean) / self.financial_std
+        financial = _normalize_rows(np.nan_to_num(scaled).astype(np.float32)[None, :])
+
+        text = self.text_vectorizer.transform([application_data.get(TEXT_COLUMN)])
+
+        vector = np.hstack([
+            categorical * math.sqrt(self.weights["categorical"]),
+            financial * math.sqrt(self.weights["financial"]),
+            text * math.sqrt(self.weights["text"]),
+        ])
+        return _normalize_rows(vector)[0]
+
+    # Rows (corpus, then added applications) matching an OData search filter
+    def filter_mask(self, filter_expr):
+        node = search_filter.parse_filter(filter_expr)
+        mask = search_filter.mask(node, self.corpus)
+        with self._lock:
+            added = list(self._added)
+        if added:
+            mask = np.concatenate([mask, [search_filter.matches(node, record) for record in added]])
+        return mask
+
+    # Return the k nearest historical applications as (corpus positions, cosine scores).
+    # With a row `mask` only those rows are searched, exactly.
+    def search(self, vector, k=3, exclude_uuid=None, mask=None):
+        # Fetch one extra candidate in case the query itself is part of the corpus
+        n = k + 1 if exclude_uuid is not None else k
+        if self.index is not None and mask is None:
+            top, scores = self.index.search(vector, k=n)
+        else:
+            top, scores = self.search_exact(vector, k=n, mask=mask)
+        if exclude_uuid is not None:
+            keep = np.array([self._uuid_at(position) != exclude_uuid for position in top.tolist()], dtype=bool)
+            top, scores = top[keep], scores[keep]
+        return top[:k], scores[:k]
+
+    def _uuid_at(self, position):
+        if position < len(self.uuids):
+            return self.uuids[position]
+        return self._added_uuids[position - len(self.uuids)]
+
+    # Applications added after `mask` was computed are not in it and are left out
+    def search_exact(self, vector, k=3, mask=None):
+        with self._lock:
+            added_vectors = list(self._added_vectors)
+        scores = self.matrix @ vector
+        if added_vectors:
+            scores = np.concatenate([scores, np.vstack(added_vectors) @ vector])
+        if mask is not None:
+            mask = np.concatenate([mask[:len(scores)], np.zeros(max(len(scores) - len(mask), 0), dtype=bool)])
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    # Same shape as the remote service's Top3SimilarApplications entries
+    def describe(self, position, score):
+        if position < len(self.corpus):
+            row = self.corpus.iloc[position]
+        else:
+            row = pd.Series(self._added[position - len(self.corpus)])
+        description = next(
+            (row[col] for col in ("companyOutput", "companyName", "name")
+             if col in row and pd.notna(row[col]) and str(row[col]).strip()),
+            "N/A"
+        )
+        description = str(description).strip()
+        if len(description) > 300:
+            description = description[:297] + "..."
+        return {
+            "UUID": row.get("uuid", "N/A"),
+            "PercentageMatching": round(max(float(score), 0.0) * 100, 1),
+            "Description": description,
+            "Status": row.get("appState", "N/A") if pd.notna(row.get("appState")) else "N/A",
+        }
+
+    def query(self, application_data, k=3, filter_expr=None):
+        positions, scores = self.search(
+            self.encode_application(application_data), k=k,
+            exclude_uuid=application_data.get("uuid"),
+            mask=self.filter_mask(filter_expr) if filter_expr else None
+        )
+        return [self.describe(p, s) for p, s in zip(positions, scores) if s > 0]
@@ -0,0 +1,107 @@
+import json
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+SSE_TYPE = "text/event-stream"
+
+# Ask for a streamed body; a server that only knows plain JSON ignores this
+STREAM_ACCEPT = f"{NDJSON_TYPES[0]}, {SSE_TYPE};q=0.9, application/json;q=0.5"
+
+
+class StreamError(Exception):
+    pass
+
+
+def media_type(content_type):
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def is_streaming(content_type):
+    kind = media_type(content_type)
+    return kind in NDJSON_TYPES or kind == SSE_TYPE
+
+
+# Incremental decoder for a chunked NDJSON body: one JSON object per line.
+# feed() takes raw bytes as they arrive and returns the complete events so far.
+class NDJSONDecoder:
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def close(self):
+        line, self._buffer = self._buffer, b""
+        return [json.loads(line)] if line.strip() else []
+
+
+# Incremental decoder for Server-Sent Events. Each event's data lines are joined
+# and parsed as JSON; an `event: error` is surfaced as {"error": data}.
+class SSEDecoder:
+    def __init__(self):
+        self._buffer = b""
+        self._event = None
+        self._data = []
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        events = []
+        for line in lines:
+            event = self._line(line.rstrip(b"\r").decode("utf-8"))
+            if event is not None:
+                events.append(event)
+        return events
+
+    def close(self):
+        events = self.feed(b"\n\n") if self._buffer or self._data else []
+        self._buffer = b""
+        return events
+
+    def _line(self, line):
+        if not line:
+            return self._dispatch()
+        if line.startswith(":"):
+            return None
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            self._event = value
+        elif field == "data":
+            self._data.append(value)
+        return None
+
+    def _dispatch(self):
+        event, data = self._event, "\n".join(self._data)
+        self._event, self._data = None, []
+        if not data or data == "[DONE]":
+            return None
+        if event == "error":
+            return {"error": data}
+        return json.loads(data)
+
+
+def decoder_for(content_type):
+    return SSEDecoder() if media_type(content_type) == SSE_TYPE else NDJSONDecoder()
+
+
+# Fold one streamed event into the analysis_result being assembled. An event is
+# a partial analysis_result ({"Decision": ...}), optionally wrapped in
+# {"analysis_result": ...}; {"delta": {"DecisionExplanation": "..."}} appends
+# text to a section as it is generated. Returns the names of updated sections.
+def apply_event(sections, event):
+    if not isinstance(event, dict):
+        raise StreamError(f"Unexpected stream event: {event!r}")
+    if event.get("error"):
+        raise StreamError(str(event["error"]))
+    updated = []
+    for name, text in (event.get("delta") or {}).items():
+        sections[name] = (sections.get(name) or "") + str(text)
+        updated.append(name)
+    partial = event.get("analysis_result", event)
+    for name, value in partial.items():
+        if name not in ("delta", "done", "error", "analysis_result"):
+            sections[name] = value
+            updated.append(name)
+    return updated
@@ -0,0 +1,446 @@
+import argparse
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+DEFAULT_PATH = os.path.join(".log", "submissions.jsonl")
+
+# Record kinds: one event line per submission and per result, merged into a
+# single "record" line per uuid by compaction
+SUBMISSION = "submission"
+RESULT = "result"
+RECORD = "record"
+KINDS = (SUBMISSION, RESULT, RECORD)
+
+
+def _parse(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or record.get("kind") not in KINDS or not record.get("uuid"):
+        return None
+    return record
+
+
+# Append-only JSONL log of submitted applications and their analysis results.
+#
+# append() only queues the line; a background thread writes everything queued
+# in one write + fsync every `flush_interval` seconds (or as soon as
+# `flush_records` lines are waiting). Writers in any process serialize on an
+# flock of `<path>.lock`, so lines from gunicorn/Streamlit workers never
+# interleave, and record each line's (offset, length) in the `<path>.idx`
+# sidecar while they hold the lock. Lookups by uuid read the sidecar into
+# memory (catching up on what other processes appended) and then pread only
+# the lines of that uuid. Lines that are not log records are skipped.
+#
+# Readers that follow the log (the indexes and aggregates built from it) keep
+# the byte offset they have read up to and ask entries() for the lines after
+# it, together with generation(): offsets stay valid until a compaction
+# replaces the file.
+class SubmissionLog:
+    def __init__(self, path=DEFAULT_PATH, flush_interval=1.0, flush_records=64, fsync=True):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.lock_path = path + ".lock"
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.fsync = fsync
+
+        self._pending = []
+        self._pending_lock = threading.Condition()
+        self._flusher = None
+        self._closed = False
+
+        # uuid -> {kind: (offset, length)} for the log file identified by _inode,
+        # and the (offset, length) of every indexed line in log order
+        self._index = {}
+        self._entries = []
+        self._inode = None
+        self._index_pos = 0
+        self._covered = 0
+        self._index_lock = threading.Lock()
+        self.metrics = {"appended": 0, "flushes": 0, "lookups": 0, "index_misses": 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def _file_lock(self, exclusive=True):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, kind, uuid, **fields):
+        record = {"uuid": uuid, "kind": kind, "logged_at": datetime.now().isoformat(), **fields}
+        line = (json.dumps(record, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError(f"{self.path} is closed")
+            self._pending.append((uuid, kind, line))
+            self.metrics["appended"] += 1
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="submission-log", daemon=True)
+                self._flusher.start()
+            if len(self._pending) >= self.flush_records:
+                self._pending_lock.notify_all()
+
+    def log_submission(self, application_data, **fields):
+        self.append(SUBMISSION, application_data["uuid"], application_data=application_data, **fields)
+
+    def log_result(self, uuid, analysis_result, **fields):
+        self.append(RESULT, uuid, analysis_result=analysis_result, **fields)
+
+    def _flush_loop(self):
+        while True:
+            with self._pending_lock:
+                self._pending_lock.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.flush_records,
+                    timeout=self.flush_interval
+                )
+                closed = self._closed
+            try:
+                self.flush()
+            except OSError:
+                # Keep the lines queued and try again on the next tick
+                pass
+            if closed:
+                return
+
+    # Write everything queued so far with a single write and fsync
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        data = b"".join(line for _, _, line in pending)
+        written = False
+        try:
+            with self._file_lock():
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    offset = os.fstat(fd).st_size
+                    os.write(fd, data)
+                    written = True
+                    if self.fsync:
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+                entries = []
+                for uuid, kind, line in pending:
+                    entries.append(f"{uuid}\t{kind}\t{offset}\t{len(line)}\n")
+                    offset += len(line)
+                # The sidecar can always be rebuilt from the log, so it is not fsynced
+                with open(self.index_path, "a", encoding="utf-8") as f:
+                    f.write("".join(entries))
+        except OSError:
+            if written:
+                # The lines are in the log, and queueing them again would log them
+                # twice; readers index whatever the sidecar misses from the log itself
+                self.metrics["flushes"] += 1
+                return len(pending)
+            with self._pending_lock:
+                self._pending[:0] = pending
+            raise
+        self.metrics["flushes"] += 1
+        return len(pending)
+
+    def close(self):
+        with self._pending_lock:
+            self._closed = True
+            self._pending_lock.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _reset(self, inode=None):
+        self._index, self._entries, self._inode, self._index_pos, self._covered = {}, [], inode, 0, 0
+
+    # Bring the in-memory index up to date with the files on disk: re-read it
+    # after a compaction replaced the log, pick up sidecar lines appended by
+    # other processes and scan any part of the log the sidecar does not cover
+    # (its tail, or the lines of a sidecar write that failed)
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if stat.st_ino == self._inode and stat.st_size == self._covered:
+            return
+        with self._file_lock(exclusive=False):
+            stat = os.stat(self.path)
+            if stat.st_ino != self._inode:
+                self._reset(stat.st_ino)
+            try:
+                with open(self.index_path, "rb") as f:
+                    f.seek(self._index_pos)
+                    for raw in f:
+                        if not raw.endswith(b"\n"):
+                            break
+                        self._index_pos += len(raw)
+                        try:
+                            uuid, kind, offset, length = raw.decode("utf-8").rstrip("\n").split("\t")
+                            offset, length = int(offset), int(length)
+                        except ValueError:
+                            # Torn by a failed write; the gap is scanned from the log
+                            continue
+                        if offset < self._covered:
+                            continue
+                        if offset > self._covered:
+                            self._scan(self._covered, offset)
+                        self._add_entry(uuid, kind, offset, length)
+            except FileNotFoundError:
+                pass
+            if stat.st_size > self._covered:
+                self._scan(self._covered, stat.st_size)
+
+    def _add_entry(self, uuid, kind, offset, length):
+        self._index.setdefault(uuid, {})[kind] = (offset, length)
+        self._entries.append((offset, length))
+        self._covered = offset + length
+
+    def _scan(self, start, end):
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            offset = start
+            while offset < end:
+                raw = f.readline()
+                if not raw.endswith(b"\n"):
+                    break
+                record = _parse(raw)
+                if record is not None:
+                    self._add_entry(record["uuid"], record["kind"], offset, len(raw))
+                offset += len(raw)
+            self._covered = offset
+
+    # All logged fields of one application (its submission and result merged),
+    # or None when the uuid was never logged
+    def get(self, uuid):
+        self.flush()
+        with self._index_lock:
+            self.metrics["lookups"] += 1
+            self._refresh()
+            record = self._read(uuid)
+            if record is False:
+                # The sidecar no longer matches the log; rebuild from the log itself
+                self.metrics["index_misses"] += 1
+                self._rebuild()
+                record = self._read(uuid)
+            return record or None
+
+    # Merged lines of `uuid`, None when it is not indexed, False when the
+    # indexed offsets do not point at its lines
+    def _read(self, uuid):
+        entries = self._index.get(uuid)
+        if not entries:
+            return None
+        record = {}
+        with open(self.path, "rb") as f:
+            for offset, length in sorted(entries.values()):
+                line = _parse(os.pread(f.fileno(), length, offset))
+                if line is None or line["uuid"] != uuid:
+                    return False
+                record.update(line)
+        record["kind"] = RECORD
+        return record
+
+    def _rebuild(self):
+        with self._file_lock(exclusive=False):
+            self._reset(os.stat(self.path).st_ino)
+            try:
+                self._index_pos = os.path.getsize(self.index_path)
+            except FileNotFoundError:
+                pass
+            self._scan(0, os.path.getsize(self.path))
+
+    def __contains__(self, uuid):
+        self.flush()
+        with self._index_lock:
+            self._refresh()
+            return uuid in self._index
+
+    def __len__(self):
+        self.flush()
+        with self._index_lock:
+            self._refresh()
+            return len(self._index)
+
+    # The log file offsets refer to, None before anything was logged. Pending
+    # lines are written first, so it is the file entries() goes on to read.
+    def generation(self):
+        self.flush()
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+    # Log record lines from byte `start` on, in log order, as (end, record)
+    # pairs, where `end` is the offset to continue from. The sidecar locates
+    # the lines, so nothing before `start` is read. Nothing is returned when
+    # the log is no longer `generation`.
+    def entries(self, start=0, generation=None):
+        self.flush()
+        with self._index_lock:
+            self._refresh()
+            inode = self._inode
+            lines = self._entries[bisect.bisect_left(self._entries, (start, 0)):]
+        if not lines or (generation is not None and generation != inode):
+            return
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != inode:
+                # Replaced by a compaction since the sidecar was read
+                return
+            position = None
+            for offset, length in lines:
+                if offset != position:
+                    f.seek(offset)
+                raw = f.read(length)
+                position = offset + length
+                record = _parse(raw)
+                if record is not None:
+                    yield position, record
+
+    # Every application logged from byte `start` on, in log order, merged per uuid
+    def records(self, start=0):
+        merged = {}
+        for _, record in self.entries(start):
+            merged.setdefault(record["uuid"], {}).update(record)
+        for record in merged.values():
+            record["kind"] = RECORD
+            yield record
+
+    # Rewrite the log with one merged line per uuid, optionally dropping
+    # applications last logged more than `keep_days` ago. Lines that are not
+    # log records are kept at the top. The new log and sidecar replace the old
+    # ones atomically while every writer is locked out.
+    def compact(self, keep_days=None):
+        self.flush()
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat() if keep_days is not None else None
+        with self._file_lock():
+            try:
+                with open(self.path, "rb") as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                return {"lines_before": 0, "lines_after": 0, "bytes_before": 0, "bytes_after": 0, "dropped": 0}
+            foreign = []
+            merged = {}
+            for raw in lines:
+                if not raw.endswith(b"\n"):
+                    break
+                record = _parse(raw)
+                if record is None:
+                    foreign.append(raw)
+                else:
+                    merged.setdefault(record["uuid"], {}).update(record)
+            dropped = 0
+            if cutoff is not None:
+                kept = {uuid: record for uuid, record in merged.items() if record.get("logged_at", "") >= cutoff}
+                dropped = len(merged) - len(kept)
+                merged = kept
+
+            tmp_path = self.path + ".compact.tmp"
+            tmp_index = self.index_path + ".compact.tmp"
+            offset = 0
+            with open(tmp_path, "wb") as out, open(tmp_index, "w", encoding="utf-8") as index:
+                for raw in foreign:
+                    out.write(raw)
+                    offset += len(raw)
+                for uuid, record in merged.items():
+                    record["kind"] = RECORD
+                    raw = (json.dumps(record, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+                    out.write(raw)
+                    index.write(f"{uuid}\t{RECORD}\t{offset}\t{len(raw)}\n")
+                    offset += len(raw)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_index, self.index_path)
+            os.replace(tmp_path, self.path)
+        with self._index_lock:
+            self._reset()
+        return {
+            "lines_before": len(lines),
+            "lines_after": len(foreign) + len(merged),
+            "bytes_before": sum(len(raw) for raw in lines),
+            "bytes_after": offset,
+            "dropped": dropped,
+        }
+
+    def stats(self):
+        with self._pending_lock:
+            pending = len(self._pending)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return {**self.metrics, "pending": pending, "applications": len(self), "log_bytes": size}
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+# Process-wide log, or None when KDIPA_SUBMISSION_LOG is set to an empty string.
+# Queued lines are flushed when the process exits.
+def get_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            path = os.environ.get("KDIPA_SUBMISSION_LOG", DEFAULT_PATH)
+            if not path:
+                return None
+            _log = SubmissionLog(
+                path,
+                flush_interval=float(os.environ.get("KDIPA_SUBMISSION_LOG_FLUSH_INTERVAL", 1.0)),
+                flush_records=int(os.environ.get("KDIPA_SUBMISSION_LOG_FLUSH_RECORDS", 64))
+            )
+            atexit.register(_log.close)
+        return _log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or compact the submission log")
+    parser.add_argument("--path", default=os.environ.get("KDIPA_SUBMISSION_LOG", DEFAULT_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact = sub.add_parser("compact", help="merge each application into one line")
+    compact.add_argument("--keep-days", type=float, default=None, help="drop applications logged before this many days ago")
+    get = sub.add_parser("get", help="print the logged submission and result of a uuid")
+    get.add_argument("uuid")
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    log = SubmissionLog(args.path)
+    if args.command == "compact":
+        started = time.perf_counter()
+        result = log.compact(keep_days=args.keep_days)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        print(json.dumps(result, indent=2))
+    elif args.command == "get":
+        record = log.get(args.uuid)
+        if record is None:
+            print(f"{args.uuid} not found")
+            return 1
+        print(json.dumps(record, indent=2))
+    else:
+        print(json.dumps(log.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,71 @@
+import pytest
+
+import api_client
+from api_client import CircuitBreaker
+
+
+# Time as seen by the breaker, moved by hand
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(api_client.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == pytest.approx(10)
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 9.5
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_after() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.retry_after() == 0.0
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_trial_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_trial_failure_opens_again_for_a_full_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10)
+    for _ in range(5):
+        breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    clock[0] += 9
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 1
+    assert breaker.allow_request()
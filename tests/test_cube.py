@@ -0,0 +1,94 @@
+import pytest
+
+import cube
+from submission_log import SubmissionLog
+
+KEY = ("Information Technology", "KW", "US", "Company", "2024-06")
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = SubmissionLog(str(tmp_path / "submissions.jsonl"), flush_interval=60, fsync=False)
+    yield log
+    log.close()
+
+
+def _cube(tmp_path, path=None):
+    # No export: the cube counts the log alone
+    return cube.PortfolioCube(path, csv_path=str(tmp_path / "missing.csv"))
+
+
+def _application(uuid, investment=100):
+    return {"uuid": uuid, "name_sector": "Information Technology", "shareholderNationality": "KW",
+            "companyOrigin": "US", "licenseType": "Company", "submissionDate": "2024-06-15T00:00:00Z",
+            "totalInvestmentValue": investment}
+
+
+def _measures(portfolio):
+    return dict(zip(cube.MEASURES, portfolio.cells[KEY]))
+
+
+def test_catch_up_counts_each_line_once(tmp_path, log):
+    portfolio = _cube(tmp_path)
+    log.log_submission(_application("a"), screening=[])
+    log.log_submission(_application("b", investment=0), screening=[])
+    log.log_result("a", {"analysis_result": {"Decision": "ACCEPTED"}}, source="service")
+    assert portfolio.catch_up(log) == 3
+    counted = _measures(portfolio)
+    assert counted == {"applications": 2, "accepted": 1, "rejected": 0, "pending": 1,
+                       "investment_total": 100, "investment_count": 1}
+    assert portfolio.catch_up(log) == 0
+    assert _measures(portfolio) == counted
+    assert portfolio.submissions == 2
+
+
+def test_decision_logged_in_a_later_catch_up(tmp_path, log):
+    portfolio = _cube(tmp_path)
+    log.log_submission(_application("a"), screening=[])
+    portfolio.catch_up(log)
+    log.log_result("a", {"analysis_result": {"Decision": "REJECTED"}}, source="service")
+    assert portfolio.catch_up(log) == 1
+    assert _measures(portfolio)["pending"] == 0 and _measures(portfolio)["rejected"] == 1
+
+
+def test_rejected_by_screening_and_prior_only_results(tmp_path, log):
+    portfolio = _cube(tmp_path)
+    log.log_submission(_application("rejected"), screening=[("reject", "Negative amounts")])
+    log.log_result("rejected", {"analysis_result": {"Decision": "REJECTED"}})
+    log.log_submission(_application("prior"), screening=[])
+    log.log_result("prior", {"analysis_result": {"Decision": "ACCEPTED"}}, source="local_model")
+    portfolio.catch_up(log)
+    measures = _measures(portfolio)
+    assert measures["applications"] == 1 and measures["pending"] == 1 and measures["accepted"] == 0
+
+
+def test_saved_cube_replays_only_the_rest_of_the_log(tmp_path, log, monkeypatch):
+    monkeypatch.setattr(cube, "SAVE_EVERY", 2)
+    path = str(tmp_path / "portfolio.json")
+    portfolio = _cube(tmp_path, path)
+    for uuid in ("a", "b", "c"):
+        log.log_submission(_application(uuid), screening=[])
+    log.log_result("a", {"analysis_result": {"Decision": "ACCEPTED"}})
+    portfolio.catch_up(log)
+    log.log_result("b", {"analysis_result": {"Decision": "ACCEPTED"}})
+    assert portfolio.catch_up(log) == 1
+
+    restarted = _cube(tmp_path, path)
+    assert restarted.load()
+    assert restarted.log_offset < portfolio.log_offset
+    assert restarted.catch_up(log) == 1
+    assert restarted.cells == portfolio.cells
+    assert restarted.submissions == 3
+
+
+def test_compaction_counts_the_log_again(tmp_path, log):
+    portfolio = _cube(tmp_path)
+    log.log_submission(_application("a"), screening=[])
+    log.log_result("a", {"analysis_result": {"Decision": "ACCEPTED"}})
+    log.log_submission(_application("b"), screening=[])
+    portfolio.catch_up(log)
+    counted = _measures(portfolio)
+    log.compact()
+    assert portfolio.catch_up(log) == 2
+    assert _measures(portfolio) == counted
+    assert portfolio.submissions == 2
@@ -0,0 +1,77 @@
+import re
+from datetime import date, datetime, timezone
+
+import pandas as pd
+import pytest
+
+from search_filter import FilterError, build_filter, mask, matches, parse_filter
+
+RECORDS = [
+    {"name_sector": "Oil & Gas", "licenseType": "Branch", "submissionDate": "2024-03-01T10:00:00Z"},
+    {"name_sector": "Information Technology", "licenseType": "Company", "submissionDate": "2024-06-15T00:00:00Z"},
+    {"name_sector": "O'Neil Sector", "licenseType": None, "submissionDate": None},
+    {"licenseType": "Company"},
+]
+
+
+def test_parse_comparisons_and_precedence():
+    node = parse_filter("name_sector eq 'A' or not licenseType ne 'B' and submissionDate ge 2024-01-01T00:00:00Z")
+    assert node == ("or", [
+        ("cmp", "name_sector", "eq", "A"),
+        ("and", [
+            ("not", ("cmp", "licenseType", "ne", "B")),
+            ("cmp", "submissionDate", "ge", datetime(2024, 1, 1, tzinfo=timezone.utc)),
+        ]),
+    ])
+
+
+def test_parse_search_in_quotes_and_null():
+    assert parse_filter("search.in(name_sector, 'A|B C', '|')") == ("in", "name_sector", ["A", "B C"])
+    assert parse_filter("search.in(name_sector, 'A, B')") == ("in", "name_sector", ["A", "B"])
+    assert parse_filter("(name_sector eq 'O''Neil')") == ("cmp", "name_sector", "eq", "O'Neil")
+    assert parse_filter("licenseType eq null") == ("cmp", "licenseType", "eq", None)
+
+
+@pytest.mark.parametrize("expr, message", [
+    ("", "empty"),
+    ("bogus eq 'A'", "Unknown field 'bogus'"),
+    ("name_sector gt 'A'", "not allowed"),
+    ("name_sector eq 3", "quoted string"),
+    ("submissionDate lt '2024-01-01'", "date-time"),
+    ("name_sector eq 'A' and", "field name"),
+    ("(name_sector eq 'A'", "')'"),
+    ("name_sector eq 'A' licenseType", "Unexpected"),
+    ("name_sector eq true", "cannot be compared with true"),
+    ("search.in(submissionDate, 'A')", "only applies to text fields"),
+    ("name_sector eq 'A' ; drop", "Unexpected character"),
+])
+def test_parse_rejects(expr, message):
+    with pytest.raises(FilterError, match=re.escape(message)):
+        parse_filter(expr)
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("name_sector eq 'Oil & Gas'", [True, False, False, False]),
+    ("name_sector ne 'Oil & Gas'", [False, True, True, True]),
+    ("name_sector eq 'O''Neil Sector'", [False, False, True, False]),
+    ("licenseType eq null", [False, False, True, False]),
+    ("licenseType ne null", [True, True, False, True]),
+    ("search.in(licenseType, 'Branch|Company', '|')", [True, True, False, True]),
+    ("submissionDate ge 2024-06-01T00:00:00Z", [False, True, False, False]),
+    ("submissionDate lt 2024-06-01T00:00:00Z", [True, False, False, False]),
+    ("not (licenseType eq 'Company' or name_sector eq 'Oil & Gas')", [False, False, True, False]),
+])
+def test_matches_and_mask_agree(expr, expected):
+    node = parse_filter(expr)
+    assert [matches(node, record) for record in RECORDS] == expected
+    assert mask(node, pd.DataFrame(RECORDS)).tolist() == expected
+
+
+def test_built_filters_parse_and_match():
+    expr = build_filter({"name_sector": ["Oil & Gas", "Information Technology"], "licenseType": ["Company"]},
+                        date_from=date(2024, 6, 1), date_to=date(2024, 6, 15))
+    assert expr == ("search.in(name_sector, 'Oil & Gas|Information Technology', '|') and licenseType eq 'Company' "
+                    "and submissionDate ge 2024-06-01T00:00:00Z and submissionDate lt 2024-06-16T00:00:00Z")
+    node = parse_filter(expr)
+    assert [matches(node, record) for record in RECORDS] == [False, True, False, False]
+    assert build_filter({}) is None
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from submission_log import RECORD, SubmissionLog
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "submissions.jsonl")
+
+
+def _open(path):
+    # A long interval keeps the background flusher out of the way
+    return SubmissionLog(path, flush_interval=60, fsync=False)
+
+
+def test_append_is_queued_until_flush(path):
+    log = _open(path)
+    log.log_submission({"uuid": "a", "companyName": "Alpha"})
+    assert not os.path.exists(path)
+    assert log.flush() == 1
+    assert log.flush() == 0
+    with open(path, "rb") as f:
+        assert f.read().count(b"\n") == 1
+    log.close()
+
+
+def test_get_merges_submission_and_result(path):
+    log = _open(path)
+    log.log_submission({"uuid": "a", "companyName": "Alpha"}, screening=[])
+    log.log_submission({"uuid": "b", "companyName": "Beta"})
+    log.log_result("a", {"analysis_result": {"Decision": "ACCEPTED"}}, source="service")
+    record = log.get("a")
+    assert record["kind"] == RECORD
+    assert record["application_data"]["companyName"] == "Alpha"
+    assert record["analysis_result"]["analysis_result"]["Decision"] == "ACCEPTED"
+    assert log.get("missing") is None
+    assert len(log) == 2 and "b" in log
+    log.close()
+
+
+def test_reopen_reads_what_was_written(path):
+    log = _open(path)
+    for name in ("a", "b", "c"):
+        log.log_submission({"uuid": name})
+    log.close()
+
+    reopened = _open(path)
+    assert len(reopened) == 3
+    assert reopened.get("b")["application_data"] == {"uuid": "b"}
+    reopened.log_result("b", {"analysis_result": {}})
+    reopened.close()
+    assert [record["uuid"] for record in _open(path).records()] == ["a", "b", "c"]
+
+
+def test_entries_continue_from_an_offset(path):
+    log = _open(path)
+    log.log_submission({"uuid": "a"})
+    log.log_submission({"uuid": "b"})
+    generation = log.generation()
+    (end, first), (offset, second) = log.entries(0, generation=generation)
+    assert (first["uuid"], second["uuid"]) == ("a", "b")
+    log.log_result("a", {"analysis_result": {}})
+    assert [(record["uuid"], record["kind"]) for _, record in log.entries(offset, generation=generation)] \
+        == [("a", "result")]
+    assert [record["uuid"] for _, record in log.entries(end)] == ["b", "a"]
+    log.close()
+
+
+def test_lines_a_failed_sidecar_write_missed_are_indexed(path):
+    log = _open(path)
+    log.log_submission({"uuid": "a"})
+    log.flush()
+    # The sidecar cannot be opened, but the lines are in the log already
+    os.rename(log.index_path, log.index_path + ".bak")
+    os.mkdir(log.index_path)
+    log.log_submission({"uuid": "b"})
+    assert log.flush() == 1
+    assert log.flush() == 0
+    os.rmdir(log.index_path)
+    os.rename(log.index_path + ".bak", log.index_path)
+    log.log_submission({"uuid": "c"})
+    log.close()
+
+    reopened = _open(path)
+    assert [record["uuid"] for _, record in reopened.entries()] == ["a", "b", "c"]
+    assert reopened.get("b")["application_data"] == {"uuid": "b"}
+    with open(path, "rb") as f:
+        assert f.read().count(b"\n") == 3
+
+
+def test_compaction_changes_the_generation(path):
+    log = _open(path)
+    log.log_submission({"uuid": "a"})
+    log.log_result("a", {"analysis_result": {"Decision": "REJECTED"}})
+    before = log.generation()
+    stats = log.compact()
+    assert (stats["lines_before"], stats["lines_after"]) == (2, 1)
+    assert log.generation() != before
+    assert list(log.entries(0, generation=before)) == []
+    [(_, record)] = log.entries(0, generation=log.generation())
+    assert record["kind"] == RECORD and record["application_data"] == {"uuid": "a"}
+    log.close()
@@ -0,0 +1,98 @@
+import math
+import os
+import threading
+
+from application import encode_payload
+
+# tiktoken encoding of the model behind the analysis service
+DEFAULT_ENCODING = "o200k_base"
+# Used until (or instead of, when offline) the tokenizer is available. JSON
+# keys, digits and punctuation split into more tokens than prose, so this
+# errs on the high side of the usual ~4 characters per token.
+BYTES_PER_TOKEN = 3.5
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class TokenBudgetExceeded(ValueError):
+    pass
+
+
+_encoding = None
+_encoding_thread = None
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding(name):
+    global _encoding
+    try:
+        import tiktoken
+
+        # Downloads the BPE ranks on first use unless TIKTOKEN_CACHE_DIR has them
+        _encoding = tiktoken.get_encoding(name)
+    except Exception:
+        _encoding = None
+
+
+# The tokenizer, or None while it is still loading (or could not be loaded).
+# Loading may need a download, so it happens on a background thread and never
+# holds up a rerun; estimates fall back to BYTES_PER_TOKEN meanwhile.
+def get_encoding(wait=False):
+    global _encoding_thread
+    with _encoding_lock:
+        if _encoding_thread is None:
+            _encoding_thread = threading.Thread(
+                target=_load_encoding, args=(os.environ.get("KDIPA_TOKEN_ENCODING", DEFAULT_ENCODING),),
+                name="tiktoken-load", daemon=True
+            )
+            _encoding_thread.start()
+    if wait:
+        _encoding_thread.join()
+    return _encoding
+
+
+# Number of tokens in `text` and whether it was counted by the tokenizer
+def count_tokens(text, wait=False):
+    encoding = get_encoding(wait)
+    if encoding is None:
+        return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN), False
+    return len(encoding.encode(text, disallowed_special=())), True
+
+
+# Maximum estimated prompt tokens per analysis; 0 disables the check
+def token_budget():
+    return _env_int("KDIPA_TOKEN_BUDGET", 0)
+
+
+# Estimated prompt cost of an /analyze-application payload. The service puts
+# the application and `top_similar` retrieved applications of about the same
+# size into the prompt, after instructions of KDIPA_PROMPT_OVERHEAD_TOKENS.
+def estimate_prompt_tokens(payload, wait=False):
+    body = encode_payload(payload)
+    application_tokens, exact = count_tokens(encode_payload(payload.get("application_data") or {}).decode("utf-8"), wait)
+    top_similar = payload.get("top_similar") or 0
+    return {
+        "tokens": _env_int("KDIPA_PROMPT_OVERHEAD_TOKENS", 0) + application_tokens * (1 + top_similar),
+        "application_tokens": application_tokens,
+        "exact": exact,
+        "request_bytes": len(body),
+        "budget": token_budget(),
+    }
+
+
+def over_budget(estimate):
+    return bool(estimate["budget"]) and estimate["tokens"] > estimate["budget"]
+
+
+# Raise TokenBudgetExceeded when the estimate is over the configured budget
+def check_budget(estimate):
+    if over_budget(estimate):
+        raise TokenBudgetExceeded(
+            f"Estimated prompt of {estimate['tokens']:,} tokens exceeds the budget of {estimate['budget']:,} tokens"
+        )
+    return estimate
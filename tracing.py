@@ -0,0 +1,324 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Upper bounds (seconds) of the duration histogram exported to Prometheus
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Span attributes holding a payload size; they are summed per span name
+BYTES_ATTRIBUTES = ("request_bytes", "response_bytes", "bytes")
+
+_current_span = contextvars.ContextVar("kdipa_current_span", default=None)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_span():
+    return _current_span.get()
+
+
+# One timed stage. Durations come from perf_counter (monotonic); the wall-clock
+# start is only kept to place the span on a timeline when reading the trace file.
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "started_at", "duration_ms",
+                 "attributes", "error", "thread", "_started")
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.thread = threading.current_thread().name
+        self.started_at = time.time()
+        self.duration_ms = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self):
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.started_at, 6),
+            "duration_ms": round(self.duration_ms, 3),
+            "thread": self.thread,
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        if self.attributes:
+            record["attributes"] = self.attributes
+        return record
+
+
+# Per span name counters for the metrics endpoint
+class _SpanMetrics:
+    __slots__ = ("count", "errors", "seconds", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+    def add(self, span):
+        seconds = span.duration_ms / 1000
+        self.count += 1
+        self.seconds += seconds
+        if span.error is not None:
+            self.errors += 1
+        for name in BYTES_ATTRIBUTES:
+            value = span.attributes.get(name)
+            if isinstance(value, (int, float)):
+                self.bytes += int(value)
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+# Collects spans from every session and worker thread of the process. Finished
+# spans go to an in-memory window (for the Debug tab), to cumulative metrics
+# (for Prometheus) and, buffered, to a JSONL trace file that is appended to
+# whenever a root span ends or `flush_spans` spans are waiting. The file is
+# rotated to `<path>.1` once it grows past `max_bytes`.
+class Tracer:
+    def __init__(self, path=None, recent=2000, flush_spans=100, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.flush_spans = flush_spans
+        self.max_bytes = max_bytes
+        self.recent = deque(maxlen=recent)
+        self.metrics = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # Time the enclosed block. The span nests under the current span of this
+    # thread unless `parent` (a Span, e.g. handed to a worker thread) or a
+    # `trace_id` (to join a trace started in an earlier rerun) is given.
+    @contextmanager
+    def span(self, name, parent=None, trace_id=None, **attributes):
+        if parent is None and trace_id is None:
+            parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent is not None else (trace_id or new_trace_id()),
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=attributes
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self.record(span)
+
+    def record(self, span):
+        with self._lock:
+            self.recent.append(span)
+            metrics = self.metrics.get(span.name)
+            if metrics is None:
+                metrics = self.metrics[span.name] = _SpanMetrics()
+            metrics.add(span)
+            if not self.path:
+                return
+            self._pending.append(span)
+            if span.parent_id is not None and len(self._pending) < self.flush_spans:
+                return
+            pending, self._pending = self._pending, []
+        self._write(pending)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        self._write(pending)
+
+    def _write(self, spans):
+        if not spans or not self.path:
+            return
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._write_lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError:
+                # Tracing must never break a submission
+                pass
+
+    # Latency and size summary per span name over the in-memory window
+    def summary(self):
+        with self._lock:
+            spans = list(self.recent)
+        by_name = {}
+        for span in spans:
+            by_name.setdefault(span.name, []).append(span)
+        rows = []
+        for name, group in by_name.items():
+            durations = np.array([span.duration_ms for span in group])
+            sizes = [sum(span.attributes.get(key, 0) for key in BYTES_ATTRIBUTES
+                         if isinstance(span.attributes.get(key), (int, float))) for span in group]
+            p50, p95 = np.percentile(durations, [50, 95])
+            rows.append({
+                "span": name,
+                "count": len(group),
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "max_ms": round(float(durations.max()), 2),
+                "total_ms": round(float(durations.sum()), 1),
+                "avg_bytes": int(np.mean(sizes)) if any(sizes) else None,
+                "errors": sum(1 for span in group if span.error is not None),
+            })
+        rows.sort(key=lambda row: -row["total_ms"])
+        return rows
+
+    # Spans of one trace in start order, with the offset of each from the start
+    # of the trace. Without a trace_id, the latest trace with a root span named
+    # `root` (any name when None) is returned.
+    def trace(self, trace_id=None, root=None):
+        with self._lock:
+            spans = list(self.recent)
+        if trace_id is None:
+            roots = [span for span in spans if span.parent_id is None and root in (None, span.name)]
+            if not roots:
+                return []
+            trace_id = roots[-1].trace_id
+        spans = sorted((span for span in spans if span.trace_id == trace_id), key=lambda span: span.started_at)
+        if not spans:
+            return []
+        origin = spans[0].started_at
+        return [{
+            "span": span.name,
+            "offset_ms": round((span.started_at - origin) * 1000, 2),
+            "duration_ms": round(span.duration_ms, 2),
+            "error": span.error,
+            **span.attributes,
+        } for span in spans]
+
+    # Metrics in the Prometheus text exposition format
+    def prometheus_text(self):
+        with self._lock:
+            metrics = sorted(self.metrics.items())
+            lines = [
+                "# HELP kdipa_span_duration_seconds Duration of instrumented stages",
+                "# TYPE kdipa_span_duration_seconds histogram",
+            ]
+            for name, m in metrics:
+                for bound, count in zip(DURATION_BUCKETS, m.buckets):
+                    lines.append(f'kdipa_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'kdipa_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {m.count}')
+                lines.append(f'kdipa_span_duration_seconds_sum{{span="{name}"}} {m.seconds:.6f}')
+                lines.append(f'kdipa_span_duration_seconds_count{{span="{name}"}} {m.count}')
+            lines += ["# HELP kdipa_span_errors_total Stages that raised", "# TYPE kdipa_span_errors_total counter"]
+            lines += [f'kdipa_span_errors_total{{span="{name}"}} {m.errors}' for name, m in metrics]
+            lines += ["# HELP kdipa_span_bytes_total Payload bytes handled by each stage", "# TYPE kdipa_span_bytes_total counter"]
+            lines += [f'kdipa_span_bytes_total{{span="{name}"}} {m.bytes}' for name, m in metrics if m.bytes]
+        return "\n".join(lines) + "\n"
+
+
+# Top functions of a cProfile.Profile by cumulative time, as text
+def profile_report(profiler, limit=30):
+    import io
+    import pstats
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+# Serve GET /metrics from a daemon thread
+def start_metrics_server(tracer, port, host="127.0.0.1"):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+_metrics_server = None
+
+
+# Process-wide tracer. KDIPA_TRACE_PATH sets the JSONL trace file (empty keeps
+# spans in memory only) and KDIPA_METRICS_PORT, when set, starts the /metrics
+# endpoint alongside it on KDIPA_METRICS_HOST (loopback by default). Every
+# process serves its own spans, so worker processes take the first free port
+# of the KDIPA_METRICS_PORTS ports from KDIPA_METRICS_PORT on.
+def get_tracer():
+    global _tracer, _metrics_server
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(
+                os.environ.get("KDIPA_TRACE_PATH", os.path.join(".trace", "spans.jsonl")),
+                recent=int(os.environ.get("KDIPA_TRACE_RECENT", 2000))
+            )
+            port = os.environ.get("KDIPA_METRICS_PORT")
+            if port:
+                host = os.environ.get("KDIPA_METRICS_HOST", "127.0.0.1")
+                try:
+                    first, count = int(port), max(int(os.environ.get("KDIPA_METRICS_PORTS", 16)), 1)
+                except ValueError:
+                    first, count = 0, 0
+                    print(f"Span metrics not served: invalid KDIPA_METRICS_PORT={port}", file=sys.stderr)
+                for candidate in range(first, first + count):
+                    try:
+                        _metrics_server = start_metrics_server(_tracer, candidate, host=host)
+                        break
+                    except OSError:
+                        # Taken by another worker process
+                        continue
+                else:
+                    if count:
+                        print(f"Span metrics not served: ports {first}-{first + count - 1} on {host} are all taken",
+                              file=sys.stderr)
+        return _tracer
+
+
+def metrics_url():
+    if _metrics_server is None:
+        return None
+    return f"http://{_metrics_server.server_address[0]}:{_metrics_server.server_address[1]}/metrics"
+
+
+# Shorthand for get_tracer().span(...)
+def span(name, **kwargs):
+    return get_tracer().span(name, **kwargs)